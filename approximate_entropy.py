@@ -0,0 +1,152 @@
+# Vectorized Approximate Entropy (ApEn) engine used by entropy.get_entropy
+# https://www.pnas.org/doi/10.1073/pnas.88.6.2297 - Pincus, original ApEn definition
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+WINDOW_SIZE = 50  # Window size
+DELTA = 1  # Sliding step
+EMBEDDING_DIMENSION = 2  # m
+TOLERANCE_FACTOR = 0.15  # r = TOLERANCE_FACTOR * std_dev
+
+# Upper bound on the temporary arrays built for one batch of windows
+MAX_BATCH_BYTES = 64 * 1024 * 1024
+
+
+def create_m_dimensional_vectors(data, m):
+    """
+    Create the m-dimensional embedding vectors u(m)(i) = [x(i), ..., x(i + m - 1)] of a series.
+
+    :param data: 1-D array-like time series.
+    :param m: Embedding dimension.
+    :return: Read-only (len(data) - m + 1, m) view over the series.
+    """
+    return sliding_window_view(np.asarray(data, dtype=float), m)
+
+
+def calculate_lagged_match_counts(data, m, r, max_lag):
+    """
+    Count, for every m-dimensional vector of the series, its Chebyshev matches among the vectors at most max_lag
+    positions after and before it.
+
+    Whether two vectors match depends only on their positions in the series, not on the window they are seen in,
+    so every pair within max_lag of each other is compared exactly once for all overlapping windows.
+
+    :param data: 1-D array-like time series.
+    :param m: Embedding dimension.
+    :param r: Tolerance level.
+    :param max_lag: Largest lag to compare, i.e. the number of vectors in a window minus one.
+    :return: Tuple (forward, backward) of (len(data) - m + 1, max_lag + 1) arrays, where forward[i, k] is the number
+             of lags d in 0..k for which vector i matches vector i + d, and backward[i, k] the number of lags d in 1..k
+             for which it matches vector i - d.
+    """
+    vectors = create_m_dimensional_vectors(data, m)
+    V = len(vectors)
+    forward_matches = np.zeros((V, max_lag + 1), dtype=np.int32)
+    backward_matches = np.zeros((V, max_lag + 1), dtype=np.int32)
+
+    # Lag 0 is the vector itself, which matches unless it contains NaN
+    forward_matches[:, 0] = np.max(np.abs(vectors - vectors), axis=1) <= r
+
+    for d in range(1, min(max_lag, V - 1) + 1):
+        distance = np.max(np.abs(vectors[:-d] - vectors[d:]), axis=1)
+        matches = distance <= r
+        forward_matches[:V - d, d] = matches
+        backward_matches[d:, d] = matches
+
+    return np.cumsum(forward_matches, axis=1, out=forward_matches), np.cumsum(backward_matches, axis=1, out=backward_matches)
+
+
+def calculate_C_m_batched(data, window_starts, window_width, m, r, max_batch_bytes=MAX_BATCH_BYTES):
+    """
+    Calculate C(m)(u(m)(i)|X, r) for every vector of every window, batching windows together.
+
+    Two vectors match when their Chebyshev (max-abs) distance is <= r. Matches are counted once per pair of
+    positions with calculate_lagged_match_counts, then each window only looks up how many of them fall inside it,
+    so the cost grows with N * window_width instead of N * window_width^2.
+
+    :param data: 1-D array-like time series.
+    :param window_starts: Start index of each window in the series.
+    :param window_width: Number of points per window.
+    :param m: Embedding dimension.
+    :param r: Tolerance level.
+    :param max_batch_bytes: Memory budget for the lookups of one batch of windows.
+    :return: (len(window_starts), N_m) array of C(m) values, where N_m = window_width - m + 1.
+    """
+    N_m = window_width - m + 1
+    max_lag = N_m - 1
+    window_starts = np.asarray(window_starts, dtype=np.intp)
+    forward, backward = calculate_lagged_match_counts(data, m, r, max_lag)
+
+    # Vector t of a window starting at s sees max_lag - t later and t earlier vectors of the same window
+    offsets = np.arange(N_m)
+    bytes_per_window = N_m * (np.dtype(np.intp).itemsize + np.dtype(np.int32).itemsize * 2)
+    batch_size = max(1, int(max_batch_bytes // bytes_per_window))
+
+    C_m = np.empty((len(window_starts), N_m))
+    for batch_start in range(0, len(window_starts), batch_size):
+        rows = window_starts[batch_start:batch_start + batch_size, None] + offsets
+        counts = forward[rows, max_lag - offsets] + backward[rows, offsets]
+        C_m[batch_start:batch_start + len(rows)] = counts / N_m
+    return C_m
+
+
+def calculate_Phi(C_m):
+    """
+    Calculate Φ(m)(r) for each window from its row of C(m) values.
+
+    :param C_m: (num_windows, N_m) array of C(m) values.
+    :return: (num_windows,) array of Φ(m)(r).
+    """
+    # Reduce row by row so each window is summed exactly like a standalone 1-D np.sum
+    return np.array([np.sum(np.log(row)) / len(row) for row in C_m])
+
+
+def calculate_approximate_entropy_with_skewness(skewness_data, quote_dates, window_width=WINDOW_SIZE,
+                                                sliding_step=DELTA, m=EMBEDDING_DIMENSION, r=None,
+                                                max_batch_bytes=MAX_BATCH_BYTES):
+    """
+    Calculate Approximate Entropy (ApEn) for a given time series with aligned dates and skewness using a sliding window.
+
+    Parameters:
+    - skewness_data: The time series data (e.g., skewness premiums).
+    - quote_dates: The list of corresponding quote dates.
+    - window_width: The width of the sliding window.
+    - sliding_step: The step size for moving the window.
+    - m: The dimension of the vectors u(m)(i) used in the ApEn calculation. Default is 2.
+    - r: The tolerance level. If not provided, it will be calculated as r = 0.15 * std_dev of the data.
+    - max_batch_bytes: Memory budget for the windows processed together in one batch.
+
+    Returns:
+    - entropy_df: A DataFrame containing the Approximate Entropy, corresponding dates, and skewness.
+    """
+    values = np.asarray(skewness_data, dtype=float)
+    dates = np.asarray(quote_dates)
+    N = len(values)
+    if N < m + 1:
+        raise ValueError("Time series is too short to calculate approximate entropy.")
+
+    # Set tolerance r if not provided
+    if r is None:
+        r = TOLERANCE_FACTOR * np.std(skewness_data)
+
+    num_windows = max(0, (N - window_width) // sliding_step + 1)
+    window_starts = np.arange(num_windows) * sliding_step
+    window_ends = window_starts + window_width
+
+    if num_windows:
+        Phi_m = calculate_Phi(calculate_C_m_batched(values, window_starts, window_width, m, r, max_batch_bytes))
+        Phi_m1 = calculate_Phi(calculate_C_m_batched(values, window_starts, window_width, m + 1, r, max_batch_bytes))
+        entropy_values = Phi_m - Phi_m1
+    else:
+        entropy_values = np.empty(0)
+
+    # Dates and skewness are aligned with the end of each window
+    entropy_df = pd.DataFrame({
+        'Date': dates[window_ends - 1],
+        'Entropy': entropy_values,
+        'Skewness': values[window_ends - 1]
+    })
+    entropy_df['Date'] = pd.to_datetime(entropy_df['Date'])
+    return entropy_df
@@ -0,0 +1,294 @@
+# Backfill options_data from optionsdx SPX end-of-day archives (https://www.optionsdx.com/shop/)
+# optionsdx ships one text file per month (e.g. spx_eod_202301.txt), usually bundled in yearly zip archives.
+# Months are parsed and COPYed in parallel, each in its own transaction together with its progress row, so an
+# interrupted run resumes with the months it had not finished. Plain indexes of options_data are dropped for the load
+# and rebuilt once at the end; the primary key and unique constraints stay, so the daily loader's ON CONFLICT keeps
+# deduplicating while a backfill is running or unfinished.
+#
+# Usage: python backfill_optionsdx.py ARCHIVE_FOLDER [--workers N] [--keep-indexes]
+
+import argparse
+import hashlib
+import io
+import os
+import re
+import time
+import zipfile
+from datetime import date
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
+import psycopg2
+from constants import DB_NAME, DB_HOST, DB_USER, DB_PORT, DB_PASSWORD
+from options_store import OPTIONS_COLUMNS, INTEGER_COLUMNS
+from ingestion_manifest import MANIFEST_TABLE_DDL, record_ingestion
+from load_options_data import FINGERPRINT_TABLE_DDL
+
+ARCHIVE_EXTENSIONS = ('.txt', '.csv')
+# Month of an optionsdx file, e.g. spx_eod_202301.txt
+SOURCE_MONTH_PATTERN = re.compile(r'(\d{4})(\d{2})\.(?:txt|csv)$', re.IGNORECASE)
+
+PROGRESS_TABLE_DDL = """
+    CREATE TABLE IF NOT EXISTS backfill_progress (
+        source text PRIMARY KEY,
+        row_count bigint NOT NULL,
+        seconds real NOT NULL,
+        completed_at timestamptz NOT NULL DEFAULT now()
+    )
+    """
+
+# Definitions of the indexes dropped for the load, kept in the database so a resumed run rebuilds them
+DEFERRED_INDEXES_DDL = """
+    CREATE TABLE IF NOT EXISTS backfill_deferred_indexes (
+        name text PRIMARY KEY,
+        drop_statement text NOT NULL,
+        create_statement text NOT NULL
+    )
+    """
+
+# Plain indexes of options_data (not backing a constraint), with the statements to drop and recreate them
+INDEX_DEFINITIONS_QUERY = """
+    SELECT i.relname, format('DROP INDEX %I', i.relname), pg_get_indexdef(i.oid)
+    FROM pg_index x
+    JOIN pg_class i ON i.oid = x.indexrelid
+    WHERE x.indrelid = 'options_data'::regclass
+      AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = x.indexrelid)
+    """
+
+
+def connect_db():
+    return psycopg2.connect(
+        host=DB_HOST,
+        database=DB_NAME,
+        user=DB_USER,
+        password=DB_PASSWORD,
+        port=DB_PORT
+    )
+
+
+def list_sources(archive_folder):
+    """
+    List the monthly files of an archive folder, looking inside zip archives.
+
+    :return: Sorted list of source names, 'file.txt' or 'archive.zip:member.txt', relative to archive_folder.
+    """
+    sources = []
+    for root, _, files in os.walk(archive_folder):
+        for file_name in files:
+            path = os.path.relpath(os.path.join(root, file_name), archive_folder)
+            if file_name.lower().endswith(ARCHIVE_EXTENSIONS):
+                sources.append(path)
+            elif file_name.lower().endswith('.zip'):
+                with zipfile.ZipFile(os.path.join(archive_folder, path)) as archive:
+                    sources.extend(f'{path}:{member}' for member in archive.namelist()
+                                   if member.lower().endswith(ARCHIVE_EXTENSIONS))
+    return sorted(sources)
+
+
+def source_month(source):
+    """First day of the month a source file holds, from its name, or None if the name does not say."""
+    match = SOURCE_MONTH_PATTERN.search(source)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def clear_months(conn, months) -> None:
+    """
+    Delete the rows of whole months, one index range per month, before they are loaded again.
+
+    The manifest and fingerprint rows of the same months go in the same transaction, so the watermark and the quote
+    date fingerprints never describe quote dates the new files do not reload.
+    """
+    with conn.cursor() as cursor:
+        for month in sorted(months):
+            month_range = [month, (pd.Timestamp(month) + pd.offsets.MonthBegin(1)).date()]
+            for table in ('options_data', 'ingestion_manifest', 'quote_date_fingerprints'):
+                cursor.execute(f"DELETE FROM {table} WHERE quote_date >= %s AND quote_date < %s", month_range)
+    conn.commit()
+    print(f"Cleared {len(months)} previously loaded months of options_data")
+
+
+def parse_optionsdx(f) -> pd.DataFrame:
+    """
+    Parse an optionsdx end-of-day file into options_data rows.
+
+    optionsdx headers look like '[QUOTE_DATE], [UNDERLYING_LAST], ...' and values are space padded. The files have
+    no open interest, so those columns are left empty.
+
+    :param f: Path or open binary file.
+    :return: DataFrame with the OPTIONS_COLUMNS, one row per quote_date, expire_date and strike.
+    """
+    df = pd.read_csv(f, skipinitialspace=True, low_memory=False)
+    df.columns = [column.strip().strip('[]').lower() for column in df.columns]
+    missing = {'quote_date', 'expire_date', 'strike'} - set(df.columns)
+    if missing:
+        raise ValueError(f"Not an optionsdx end-of-day file, missing columns: {', '.join(sorted(missing))}")
+    df = df.reindex(columns=OPTIONS_COLUMNS)
+
+    df['quote_date'] = pd.to_datetime(df['quote_date'], format='%Y-%m-%d', errors='coerce')
+    df['expire_date'] = pd.to_datetime(df['expire_date'], format='%Y-%m-%d', errors='coerce')
+    numeric_columns = [column for column in OPTIONS_COLUMNS if column not in ('quote_date', 'expire_date')]
+    df[numeric_columns] = df[numeric_columns].apply(pd.to_numeric, errors='coerce')
+    # dte is fractional in optionsdx; it and the volumes are integers in options_data, so they are written as 12, not 12.0
+    df[INTEGER_COLUMNS] = df[INTEGER_COLUMNS].round().astype('Int64')
+
+    df = df.dropna(subset=['quote_date', 'expire_date', 'strike'])
+    return df.drop_duplicates(subset=['quote_date', 'expire_date', 'strike'], keep='last')
+
+
+def load_source(archive_folder, source, loaded_months) -> tuple:
+    """
+    Parse one monthly file and COPY it into options_data, recording it in backfill_progress in the same transaction.
+
+    :param loaded_months: Months (first day, datetime.date) that still have rows from before the backfill started;
+                          their quote dates are deleted first so the load stays idempotent. backfill_optionsdx clears
+                          the months it can tell from the file names before the indexes are dropped.
+    :return: Tuple (source, row_count, seconds).
+    """
+    start_time = time.time()
+    if ':' in source:
+        archive_path, member = source.split(':', 1)
+        with zipfile.ZipFile(os.path.join(archive_folder, archive_path)) as archive, archive.open(member) as f:
+            df = parse_optionsdx(f)
+    else:
+        df = parse_optionsdx(os.path.join(archive_folder, source))
+
+    conn = connect_db()
+    try:
+        with conn.cursor() as cursor:
+            # A crash may lose the latest commits, but a month is lost together with its progress row and reloaded
+            cursor.execute("SET synchronous_commit = off")
+
+            months = set(df['quote_date'].dt.to_period('M').dt.start_time.dt.date)
+            if months & loaded_months:
+                cursor.execute("DELETE FROM options_data WHERE quote_date = ANY(%s::date[])",
+                               [[str(quote_date) for quote_date in df['quote_date'].dt.date.unique()]])
+
+            buffer = io.StringIO()
+            df.to_csv(buffer, index=False, header=False, date_format='%Y-%m-%d')
+            buffer.seek(0)
+            cursor.copy_expert(f"COPY options_data ({', '.join(OPTIONS_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+            # Recorded like daily files, so the watermark and the quote date fingerprints see the backfilled dates
+            for quote_date, day in df.groupby(df['quote_date'].dt.date):
+                content_hash = hashlib.md5(pd.util.hash_pandas_object(day, index=False).values.tobytes()).hexdigest()
+                record_ingestion(cursor, quote_date, source, content_hash, len(day))
+
+            seconds = time.time() - start_time
+            cursor.execute("INSERT INTO backfill_progress (source, row_count, seconds) VALUES (%s, %s, %s)",
+                           [source, len(df), seconds])
+        conn.commit()
+    finally:
+        conn.close()
+    return source, len(df), seconds
+
+
+def defer_indexes(conn) -> None:
+    """Drop the plain indexes of options_data, remembering how to rebuild them."""
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT count(*) FROM backfill_deferred_indexes")
+        if cursor.fetchone()[0]:
+            # Already dropped by an interrupted run
+            return
+        cursor.execute(INDEX_DEFINITIONS_QUERY)
+        definitions = cursor.fetchall()
+        for name, drop_statement, create_statement in definitions:
+            cursor.execute("INSERT INTO backfill_deferred_indexes VALUES (%s, %s, %s)", [name, drop_statement, create_statement])
+            cursor.execute(drop_statement)
+    conn.commit()
+    print(f"Deferred {len(definitions)} indexes of options_data until the end of the backfill")
+
+
+def rebuild_indexes(conn) -> None:
+    """Recreate the indexes dropped by defer_indexes, then refresh the planner statistics."""
+    rebuild_start = time.time()
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT name, create_statement FROM backfill_deferred_indexes ORDER BY name")
+        definitions = cursor.fetchall()
+        if not definitions:
+            return
+        cursor.execute("SET maintenance_work_mem = '1GB'")
+        for name, create_statement in definitions:
+            cursor.execute(create_statement)
+            print(f"Rebuilt {name}")
+        cursor.execute("DELETE FROM backfill_deferred_indexes")
+    conn.commit()
+
+    conn.autocommit = True
+    with conn.cursor() as cursor:
+        cursor.execute("ANALYZE options_data")
+    conn.autocommit = False
+    print(f"Rebuilding indexes took {time.time() - rebuild_start:.2f} seconds")
+
+
+def backfill_optionsdx(archive_folder, workers=None, defer=True) -> int:
+    """
+    Load every monthly file of an optionsdx archive folder into options_data, skipping files already loaded.
+
+    :param archive_folder: Folder with optionsdx .txt/.csv files or zip archives of them.
+    :param workers: Number of worker processes; defaults to the number of CPUs.
+    :param defer: Drop the plain indexes during the load and rebuild them at the end.
+    :return: Number of rows loaded by this run.
+    """
+    start_time = time.time()
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    conn = connect_db()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(PROGRESS_TABLE_DDL)
+            cursor.execute(DEFERRED_INDEXES_DDL)
+            cursor.execute(MANIFEST_TABLE_DDL)
+            cursor.execute(FINGERPRINT_TABLE_DDL)
+            cursor.execute("SELECT source FROM backfill_progress")
+            completed = {source for source, in cursor.fetchall()}
+            cursor.execute("SELECT DISTINCT date_trunc('month', quote_date)::date FROM options_data")
+            loaded_months = {month for month, in cursor.fetchall()}
+        conn.commit()
+
+        sources = list_sources(archive_folder)
+        pending = [source for source in sources if source not in completed]
+        print(f"Backfill: {len(sources)} monthly files, {len(sources) - len(pending)} already loaded, {len(pending)} to load")
+
+        # Months loaded before are replaced; delete them while the indexes are still there to find their rows
+        months_to_clear = {source_month(source) for source in pending} & loaded_months
+        if months_to_clear:
+            clear_months(conn, months_to_clear)
+            loaded_months -= months_to_clear
+
+        if pending and defer:
+            defer_indexes(conn)
+
+        rows_loaded, failed = 0, []
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(load_source, archive_folder, source, loaded_months): source for source in pending}
+            for done, future in enumerate(as_completed(futures), start=1):
+                try:
+                    source, row_count, seconds = future.result()
+                except Exception as e:
+                    failed.append(futures[future])
+                    print(f"Error loading {futures[future]}: {e}")
+                    continue
+                rows_loaded += row_count
+                elapsed = time.time() - start_time
+                print(f"[{done}/{len(pending)}] {source}: {row_count} rows in {seconds:.2f} seconds, "
+                      f"{rows_loaded} rows so far at {rows_loaded / elapsed:,.0f} rows/s")
+
+        if failed:
+            # Indexes stay deferred so the rerun that loads the failed files does not pay for them
+            print(f"{len(failed)} files failed; rerun the backfill to load them and rebuild the indexes")
+        else:
+            rebuild_indexes(conn)
+    finally:
+        conn.close()
+
+    print(f"Backfill of {rows_loaded} rows took {time.time() - start_time:.2f} seconds")
+    return rows_loaded
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill options_data from optionsdx SPX end-of-day archives.")
+    parser.add_argument('archive_folder', help="Folder with optionsdx .txt/.csv files or zip archives of them")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: number of CPUs)")
+    parser.add_argument('--keep-indexes', action='store_true', help="Load with the indexes in place")
+    args = parser.parse_args()
+    backfill_optionsdx(args.archive_folder, workers=args.workers, defer=not args.keep_indexes)
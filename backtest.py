@@ -0,0 +1,160 @@
+# Backtest of the entropy-decline drawdown rule, without the LLM
+# The chat prompt tells the model that an entropy drop within the past 4-6 weeks precedes an SPX decline within the
+# next 4-6 weeks. Here that rule is evaluated directly on the Date/Entropy/Adj Close history for a grid of variants:
+#   signal on day t:  an entropy decline of `consecutive` days dropping at least `drop_threshold` ended within the last
+#                     `lookback` trading days (t included)
+#   hit on day t:     SPX closes at least `drawdown` below its day t close within the next `horizon` trading days
+# Signals and outcomes are NumPy arrays over the whole history, and the metrics of all variants sharing a horizon and a
+# drawdown are a few matrix products, so thousands of variants take seconds.
+
+import itertools
+import time
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+# The rule as stated in the prompt: any decline within 6 weeks, SPX decline within the next 6 weeks
+PROMPT_RULE = {'lookback': 30, 'horizon': 30, 'drop_threshold': 0.0, 'consecutive': 1, 'drawdown': 0.05}
+
+DEFAULT_GRID = {
+    'lookback': [10, 15, 20, 25, 30],
+    'horizon': [10, 15, 20, 25, 30],
+    'drop_threshold': [0.0, 0.01, 0.02, 0.05, 0.1],
+    'consecutive': [1, 2, 3, 4, 5],
+    'drawdown': [0.03, 0.05, 0.1],
+}
+RULE_PARAMETERS = list(DEFAULT_GRID)
+
+RESULT_COLUMNS = RULE_PARAMETERS + ['signal_days', 'signal_rate', 'hit_rate', 'base_rate', 'lift', 'recall',
+                                    'drawdown_capture', 'mean_lead_days']
+
+
+def merge_signal_and_prices(entropy: pd.DataFrame, prices: pd.DataFrame) -> pd.DataFrame:
+    """
+    Align the get_entropy output with index prices on their common dates.
+
+    :param entropy: DataFrame with Date and Entropy.
+    :param prices: DataFrame indexed by date with 'Adj Close', e.g. ReturnCalculator.calculate_daily_returns.
+    :return: DataFrame with Date, Entropy and Adj Close.
+    """
+    prices = prices[['Adj Close']].rename_axis('Date').reset_index()
+    prices['Date'] = pd.to_datetime(prices['Date'])
+    entropy = entropy[['Date', 'Entropy']].assign(Date=pd.to_datetime(entropy['Date']))
+    return entropy.merge(prices, on='Date', how='inner')
+
+
+def decline_events(entropy: np.ndarray, consecutive, drop_threshold) -> np.ndarray:
+    """
+    Days ending a decline of at least `consecutive` days whose total drop is at least `drop_threshold`.
+
+    :return: Boolean array (len(consecutive), len(drop_threshold), len(entropy)).
+    """
+    declining = np.diff(entropy, prepend=np.nan) < 0
+    # Length of the run of declining days ending on each day
+    run_starts = np.where(declining, 0, np.arange(len(entropy)))
+    run_length = np.arange(len(entropy)) - np.maximum.accumulate(run_starts)
+
+    events = np.zeros((len(consecutive), len(drop_threshold), len(entropy)), dtype=bool)
+    for i, days in enumerate(consecutive):
+        drop = np.full(len(entropy), -np.inf)
+        drop[days:] = entropy[:-days] - entropy[days:]
+        events[i] = (run_length >= days) & (drop >= np.asarray(drop_threshold)[:, None])
+    return events
+
+
+def rolling_any(events: np.ndarray, window: int) -> np.ndarray:
+    """Whether any event happened within the last `window` days, along the last axis."""
+    counts = np.cumsum(events, axis=-1)
+    shifted = np.zeros_like(counts)
+    shifted[..., window:] = counts[..., :-window]
+    return counts > shifted
+
+
+def forward_outcomes(prices: np.ndarray, horizon: int, drawdown: float):
+    """
+    Forward drawdown outcomes of every day that has a full horizon after it.
+
+    :return: Tuple (valid, hit, lead_days, forward_drawdown) of arrays over the days: valid marks days with a full
+             horizon, hit whether the close fell at least `drawdown` below the day's close, lead_days the trading days
+             until it first did (0 if not) and forward_drawdown the worst close of the horizon relative to the day's.
+    """
+    n = len(prices)
+    valid = np.arange(n) < n - horizon
+    hit, lead_days, forward_drawdown = np.zeros(n, dtype=bool), np.zeros(n), np.zeros(n)
+    if valid.any():
+        future = sliding_window_view(prices[1:], horizon)[:valid.sum()]
+        relative = future / prices[:valid.sum(), None] - 1
+        crossed = relative <= -drawdown
+        hit[valid] = crossed.any(axis=1)
+        lead_days[valid] = np.where(hit[valid], crossed.argmax(axis=1) + 1, 0)
+        forward_drawdown[valid] = np.minimum(relative.min(axis=1), 0)
+    return valid, hit, lead_days, forward_drawdown
+
+
+def expand_rule_grid(parameter_grid=None) -> dict:
+    """Fill the parameters missing from a grid dict with their PROMPT_RULE value."""
+    parameter_grid = parameter_grid or DEFAULT_GRID
+    unknown = set(parameter_grid) - set(RULE_PARAMETERS)
+    if unknown:
+        raise ValueError(f"Unknown rule parameters: {', '.join(sorted(unknown))}")
+    return {name: list(np.atleast_1d(parameter_grid.get(name, PROMPT_RULE[name]))) for name in RULE_PARAMETERS}
+
+
+def backtest_rule_grid(df: pd.DataFrame, parameter_grid: dict = None) -> pd.DataFrame:
+    """
+    Evaluate every variant of the entropy-decline rule in a parameter grid.
+
+    :param df: DataFrame with Date, Entropy and Adj Close, one row per trading day (see merge_signal_and_prices).
+    :param parameter_grid: Dict mapping RULE_PARAMETERS to lists of values; the cartesian product is evaluated.
+                           Lookback and horizon are in trading days, drop_threshold in entropy units and drawdown a
+                           fraction of the index price. Missing parameters take their PROMPT_RULE value.
+    :return: DataFrame with the RESULT_COLUMNS, one row per variant. hit_rate is the share of signal days followed by a
+             hit, base_rate the share of all days, recall the share of hit days that had a signal, drawdown_capture the
+             share of the summed forward drawdowns that fell on signal days and mean_lead_days the mean trading days
+             from a signal day to the hit.
+    """
+    start_time = time.time()
+    grid = expand_rule_grid(parameter_grid)
+    df = df.sort_values('Date').dropna(subset=['Entropy', 'Adj Close'])
+    entropy = df['Entropy'].to_numpy(dtype=float)
+    prices = df['Adj Close'].to_numpy(dtype=float)
+
+    # Signals of every (lookback, consecutive, drop_threshold), flattened to one row per signal variant
+    events = decline_events(entropy, grid['consecutive'], grid['drop_threshold'])
+    signals = np.stack([rolling_any(events, lookback) for lookback in grid['lookback']])
+    signal_keys = list(itertools.product(grid['lookback'], grid['consecutive'], grid['drop_threshold']))
+    signals = signals.reshape(len(signal_keys), len(entropy))
+
+    results = []
+    for horizon, drawdown in itertools.product(grid['horizon'], grid['drawdown']):
+        valid, hit, lead_days, forward_drawdown = forward_outcomes(prices, horizon, drawdown)
+        on = signals[:, valid].astype(float)
+        signal_days = on.sum(axis=1)
+        hit_days = on @ hit[valid]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            base_rate = hit[valid].mean() if valid.any() else np.nan
+            hit_rate = hit_days / signal_days
+            results.append(pd.DataFrame({
+                'lookback': [key[0] for key in signal_keys],
+                'horizon': horizon,
+                'drop_threshold': [key[2] for key in signal_keys],
+                'consecutive': [key[1] for key in signal_keys],
+                'drawdown': drawdown,
+                'signal_days': signal_days.astype(int),
+                'signal_rate': signal_days / valid.sum(),
+                'hit_rate': hit_rate,
+                'base_rate': base_rate,
+                'lift': hit_rate / base_rate,
+                'recall': hit_days / hit[valid].sum(),
+                'drawdown_capture': (on @ forward_drawdown[valid]) / forward_drawdown[valid].sum(),
+                'mean_lead_days': (on @ lead_days[valid]) / hit_days,
+            }))
+
+    results = pd.concat(results, ignore_index=True)[RESULT_COLUMNS]
+    print(f"Backtest of {len(results)} rule variants over {len(df)} days took {time.time() - start_time:.2f} seconds")
+    return results
+
+
+def backtest_rule(df: pd.DataFrame, **rule) -> pd.Series:
+    """Metrics of a single rule variant; parameters default to PROMPT_RULE."""
+    return backtest_rule_grid(df, {**PROMPT_RULE, **rule}).iloc[0]
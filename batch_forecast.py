@@ -0,0 +1,137 @@
+# Market Expectation forecasts for many as-of dates at once, for validation against what SPX did afterwards
+# Each forecast only sees the rows up to its as-of date: Entropy is recomputed from those rows (including the tolerance
+# r = 0.15 * std_dev) and the prompt's current period is the CURRENT_WINDOW_MONTHS ending at that date.
+# Requests run concurrently on one event loop, capped by a concurrency limit and a request rate, and go through the
+# chat response cache, so rerunning a batch only calls the API for new dates.
+
+import asyncio
+import time
+import pandas as pd
+from chat_client import ChatClient
+from constants import BATCH_MAX_CONCURRENCY, BATCH_REQUESTS_PER_MINUTE, PROMPT_TOKEN_BUDGET, ENTROPY_ESTIMATOR
+from entropy_estimators import get_estimator, recalculate_entropy
+from prompt_builder import CURRENT_PERIOD, estimate_tokens
+
+CURRENT_WINDOW_MONTHS = 7  # Length of the current period of the prompt, as in the interactive chat (Jan - July)
+QUESTION = "Today is {as_of:%B %d, %Y}, what do you expect of markets in the near term?"
+RESULT_COLUMNS = ['as_of_date', 'prompt_tokens', 'forecast', 'error', 'seconds']
+
+
+class RateLimiter:
+    """Spaces out request starts to at most requests_per_minute."""
+
+    def __init__(self, requests_per_minute: float) -> None:
+        self.interval: float = 60.0 / requests_per_minute if requests_per_minute else 0.0
+        self.next_start: float = 0.0
+        self.lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        async with self.lock:
+            now = time.monotonic()
+            delay = self.next_start - now
+            self.next_start = max(now, self.next_start) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def resolve_as_of_dates(df: pd.DataFrame, dates=None, start: str = None, end: str = None, freq: str = 'W-FRI',
+                        min_history: int = 1) -> list:
+    """
+    Map requested dates to the trading days of df they are forecast from.
+
+    :param dates: Explicit dates; otherwise every freq step between start and end (default: the whole data range).
+    :param min_history: Minimum number of rows up to an as-of date; earlier dates are skipped.
+    :return: Sorted unique dates of df, each the last trading day on or before a requested date.
+    """
+    trading_days = pd.DatetimeIndex(pd.to_datetime(df['Date'])).sort_values()
+    if dates is None:
+        dates = pd.date_range(start or trading_days[0], end or trading_days[-1], freq=freq)
+    requested = pd.DatetimeIndex(pd.to_datetime(list(dates)))
+    positions = trading_days.searchsorted(requested, side='right') - 1
+    return sorted({trading_days[position] for position in positions if position >= min_history - 1})
+
+
+def build_as_of_messages(df: pd.DataFrame, as_of: pd.Timestamp, estimator=ENTROPY_ESTIMATOR) -> list:
+    """
+    Chat messages for a forecast at as_of, built only from the rows dated on or before it.
+
+    Entropy is recomputed from the visible Skewness, since the stored column uses a tolerance r taken from the whole
+    history. The first window_width - 1 visible rows have no entropy and are left out of the prompt.
+    """
+    from main import build_initial_messages
+
+    visible = recalculate_entropy(df[pd.to_datetime(df['Date']) <= as_of], estimator)
+    window_start = as_of - pd.DateOffset(months=CURRENT_WINDOW_MONTHS)
+    current_period = (CURRENT_PERIOD[0], f'{window_start:%Y-%m-%d}', f'{as_of:%Y-%m-%d}')
+    question = QUESTION.format(as_of=as_of)
+    # The question counts against the same budget as the initial messages
+    messages = build_initial_messages(visible, PROMPT_TOKEN_BUDGET - estimate_tokens(question),
+                                      current_period=current_period)
+    messages.append({"role": "user", "content": question})
+    return messages
+
+
+async def run_batch(client: ChatClient, df: pd.DataFrame, as_of_dates: list,
+                    max_concurrency: int = BATCH_MAX_CONCURRENCY,
+                    requests_per_minute: float = BATCH_REQUESTS_PER_MINUTE,
+                    estimator=ENTROPY_ESTIMATOR) -> pd.DataFrame:
+    """
+    Forecast every as-of date concurrently; a failed date is reported in the error column instead of stopping the batch.
+
+    :return: DataFrame with the RESULT_COLUMNS, one row per as-of date.
+    """
+    # Prompts are CPU-bound; build them all before the first request so they do not stall the requests in flight
+    prompt_start = time.time()
+    batch = [(as_of, build_as_of_messages(df, as_of, estimator)) for as_of in as_of_dates]
+    print(f"Building {len(batch)} prompts took {time.time() - prompt_start:.2f} seconds")
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+    rate_limiter = RateLimiter(requests_per_minute)
+    done = 0
+
+    async def forecast(as_of, messages):
+        nonlocal done
+        result = {'as_of_date': as_of,
+                  'prompt_tokens': sum(estimate_tokens(message['content']) for message in messages),
+                  'forecast': None, 'error': None}
+        async with semaphore:
+            start_time = time.perf_counter()
+            try:
+                # Cached forecasts do not count against the rate limit
+                if client.cached(messages) is None:
+                    await rate_limiter.wait()
+                start_time = time.perf_counter()
+                result['forecast'] = await client.complete(messages)
+            except Exception as e:
+                result['error'] = str(e)
+            result['seconds'] = time.perf_counter() - start_time
+        done += 1
+        print(f"[{done}/{len(batch)}] {as_of:%Y-%m-%d}: {'failed: ' + result['error'] if result['error'] else 'ok'}")
+        return result
+
+    results = await asyncio.gather(*(forecast(as_of, messages) for as_of, messages in batch))
+    return pd.DataFrame(results, columns=RESULT_COLUMNS)
+
+
+def batch_forecast(client: ChatClient, df: pd.DataFrame, output_file: str, dates=None, start: str = None,
+                   end: str = None, freq: str = 'W-FRI', max_concurrency: int = BATCH_MAX_CONCURRENCY,
+                   requests_per_minute: float = BATCH_REQUESTS_PER_MINUTE,
+                   estimator=ENTROPY_ESTIMATOR) -> pd.DataFrame:
+    """
+    Forecast a list or range of as-of dates and write the results to a CSV file.
+
+    :param df: DataFrame with Date, Skewness and Adj Close; Entropy is recomputed for each as-of date.
+    :param output_file: CSV file with the RESULT_COLUMNS.
+    :param estimator: Estimator name or instance the entropy is recomputed with.
+    :return: The results.
+    """
+    start_time = time.time()
+    estimator = get_estimator(estimator)
+    # Dates without a full entropy window before them cannot be forecast
+    as_of_dates = resolve_as_of_dates(df, dates, start, end, freq, min_history=estimator.window_width)
+    print(f"Forecasting {len(as_of_dates)} as-of dates, {max_concurrency} at a time, {requests_per_minute} requests/minute")
+    results = asyncio.run(run_batch(client, df, as_of_dates, max_concurrency, requests_per_minute, estimator))
+    results.to_csv(output_file, index=False, date_format='%Y-%m-%d')
+    print(f"Batch of {len(results)} forecasts ({results['error'].notna().sum()} failed) took "
+          f"{time.time() - start_time:.2f} seconds, written to {output_file}")
+    return results
@@ -0,0 +1,258 @@
+# Benchmarks of the get_entropy and daily CSV ingestion stages on synthetic option chains
+# Every stage runs on data from synthetic_options at a named scale, and reports its best wall time over a few repeats,
+# rows per second and peak traced memory. Results can be stored as a baseline and later runs compared against it, so a
+# change that slows a stage down or makes it hold more memory is flagged before it reaches the real history.
+#
+# Usage: python benchmarks.py [--scale small|medium|large] [--repeat N] [--postgres] [--save-baseline] [--check]
+
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import pandas as pd
+from constants import ENTROPY_ESTIMATOR
+
+# Quote dates x expiries x strikes; days stay above the entropy window so the entropy stage has output
+SCALES = {
+    'small': {'days': 60, 'expiries': 8, 'strikes': 60},
+    'medium': {'days': 250, 'expiries': 12, 'strikes': 120},
+    'large': {'days': 1000, 'expiries': 16, 'strikes': 200},
+}
+BASELINE_FILE = 'benchmark_baselines.json'
+REGRESSION_TOLERANCE = 0.25  # Flag stages more than 25% slower or hungrier than their baseline
+# ... and by more than these absolute margins, so millisecond stages are not flagged for timer noise
+MIN_REGRESSION_SECONDS = 0.05
+MIN_REGRESSION_MB = 1.0
+BASELINE_VERSION = 1
+
+
+def measure(function, repeat: int = 3, setup=None) -> dict:
+    """
+    Time a stage and trace its peak memory.
+
+    Timed runs are separate from the traced run, since tracemalloc slows allocation-heavy code down. Memory allocated by
+    pyarrow's own pool is not traced.
+
+    :param setup: Optional function run untimed before every run, e.g. to reset the tables a stage writes to.
+    :return: Dict with the best 'seconds' of repeat runs, 'peak_mb' and the stage's 'result'.
+    """
+    timings = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        gc.collect()
+        start_time = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start_time)
+
+    if setup:
+        setup()
+    gc.collect()
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'seconds': min(timings), 'peak_mb': peak / 2 ** 20, 'result': result}
+
+
+@contextlib.contextmanager
+def benchmark_schema():
+    """
+    Throwaway PostgreSQL schema for the database stages, dropped on exit.
+
+    While it is open, PGOPTIONS points the search_path of every new connection at the schema, so the real loaders and
+    queries run unchanged against its options_data and ingestion_manifest and never touch the live tables.
+
+    :return: Context manager yielding a reset() function that recreates an empty options_data and drops the manifest.
+    """
+    import psycopg2
+    from constants import DB_NAME, DB_HOST, DB_USER, DB_PORT, DB_PASSWORD
+
+    schema = f'benchmark_{os.getpid()}'
+    conn = psycopg2.connect(host=DB_HOST, database=DB_NAME, user=DB_USER, password=DB_PASSWORD, port=DB_PORT)
+    conn.autocommit = True
+
+    def reset():
+        with conn.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {schema}.options_data, {schema}.ingestion_manifest")
+            cursor.execute(f"CREATE TABLE {schema}.options_data (LIKE options_data INCLUDING ALL)")
+
+    pgoptions = os.environ.get('PGOPTIONS')
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(f"CREATE SCHEMA {schema}")
+        reset()
+        os.environ['PGOPTIONS'] = f'{pgoptions or ""} -c search_path={schema}'.strip()
+        yield reset
+    finally:
+        if pgoptions is None:
+            os.environ.pop('PGOPTIONS', None)
+        else:
+            os.environ['PGOPTIONS'] = pgoptions
+        with conn.cursor() as cursor:
+            cursor.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+        conn.close()
+
+
+def run_benchmarks(scale: str = 'small', repeat: int = 3, postgres: bool = False,
+                   estimator: str = ENTROPY_ESTIMATOR, seed: int = 0) -> pd.DataFrame:
+    """
+    Run every stage on a synthetic chain of the given scale, each stage consuming the previous stage's output.
+
+    Stages: csv_parse (parse_daily_csv), store_write and store_load (options_store), clean, filter, skewness and
+    entropy. With postgres=True, in a throwaway schema: db_insert (load_daily_data_to_db on the daily CSVs), then
+    db_load, db_stream and db_medians (load_options_data_from_db, stream_options_data_from_db and
+    load_deepest_strike_medians_from_db on the rows it inserted).
+
+    :return: DataFrame with one row per stage: scale, stage, rows, seconds, rows_per_second and peak_mb.
+    """
+    from synthetic_options import generate_option_chain, write_daily_csvs
+    from daily_csv_parser import parse_daily_csv
+    from options_store import write_options_data, load_options_data_from_store
+    from skewness import clean_options_data, filter_options_data, calculate_average_skewness_same_strike_same_dte
+    from entropy_estimators import get_estimator
+
+    dimensions = SCALES[scale]
+    entropy_estimator = get_estimator(estimator)
+    results = []
+
+    def run_stage(stage, function, rows=None, setup=None):
+        measured = measure(function, repeat, setup)
+        result = measured.pop('result')
+        rows = rows if rows is not None else len(result)
+        results.append({'scale': scale, 'stage': stage, 'rows': rows, **measured,
+                        'rows_per_second': rows / measured['seconds'] if measured['seconds'] else float('nan')})
+        print(f"{stage}: {rows} rows in {measured['seconds']:.3f} seconds, peak {measured['peak_mb']:.1f} MB")
+        return result
+
+    with tempfile.TemporaryDirectory() as folder:
+        csv_folder = os.path.join(folder, 'daily_csv')
+        store_folder = os.path.join(folder, 'options_store')
+
+        # Test data, generated once and not benchmarked
+        setup_start = time.time()
+        chain = generate_option_chain(seed=seed, **dimensions)
+        paths = write_daily_csvs(chain, csv_folder)
+        print(f"Generating {len(chain)} option rows in {len(paths)} daily files took {time.time() - setup_start:.2f} seconds")
+
+        run_stage('csv_parse', lambda: pd.concat([parse_daily_csv(path)[1] for path in paths]))
+        run_stage('store_write', lambda: write_options_data(chain, store_folder), rows=len(chain))
+        loaded = run_stage('store_load', lambda: load_options_data_from_store(chain['quote_date'].min(),
+                                                                              store_folder=store_folder))
+        cleaned = run_stage('clean', lambda: clean_options_data(loaded))
+        filtered = run_stage('filter', lambda: filter_options_data(cleaned))
+        skewness = run_stage('skewness', lambda: calculate_average_skewness_same_strike_same_dte(filtered),
+                             rows=len(filtered))
+        run_stage('entropy', lambda: entropy_estimator.calculate(skewness['Average Skewness'], skewness['quote_date']),
+                  rows=len(skewness))
+        if postgres:
+            run_database_stages(run_stage, chain, paths, folder)
+
+    return pd.DataFrame(results, columns=['scale', 'stage', 'rows', 'seconds', 'rows_per_second', 'peak_mb'])
+
+
+def run_database_stages(run_stage, chain: pd.DataFrame, paths: list, folder: str) -> None:
+    """Run the PostgreSQL stages of run_benchmarks through run_stage, in a benchmark_schema."""
+    from load_daily_csv_to_db import load_daily_data_to_db
+    from load_options_data import (load_options_data_from_db, stream_options_data_from_db,
+                                   load_deepest_strike_medians_from_db)
+
+    daily_folder = os.path.join(folder, 'daily_data')
+    archive_folder = os.path.join(folder, 'archive')
+    start_date, end_date = chain['quote_date'].min(), chain['quote_date'].max()
+
+    with benchmark_schema() as reset:
+        def fresh_load():
+            # Empty tables and a full daily folder, since the loader archives the files and skips ingested ones
+            reset()
+            shutil.rmtree(daily_folder, ignore_errors=True)
+            os.makedirs(daily_folder)
+            for path in paths:
+                shutil.copy(path, daily_folder)
+
+        def insert():
+            # The loader reports every file; only its timing is of interest here
+            with contextlib.redirect_stdout(io.StringIO()):
+                load_daily_data_to_db(target='postgres', daily_folder=daily_folder, archive_folder=archive_folder)
+            return len(chain)
+
+        run_stage('db_insert', insert, rows=len(chain), setup=fresh_load)
+        run_stage('db_load', lambda: load_options_data_from_db(start_date, end_date))
+        run_stage('db_stream', lambda: sum(len(chunk) for chunk in stream_options_data_from_db(start_date, end_date)),
+                  rows=len(chain))
+        run_stage('db_medians', lambda: load_deepest_strike_medians_from_db(start_date, end_date))
+
+
+def load_baselines(baseline_file: str = BASELINE_FILE) -> dict:
+    """Stored results keyed by 'scale/stage', or an empty dict."""
+    if not os.path.exists(baseline_file):
+        return {}
+    with open(baseline_file, 'r') as f:
+        baselines = json.load(f)
+    return baselines['results'] if baselines.get('version') == BASELINE_VERSION else {}
+
+
+def save_baselines(results: pd.DataFrame, baseline_file: str = BASELINE_FILE) -> None:
+    """Store results as the baseline of their scale and stage, keeping the baselines of other scales."""
+    baselines = load_baselines(baseline_file)
+    for row in results.to_dict('records'):
+        baselines[f"{row['scale']}/{row['stage']}"] = {key: row[key] for key in ('rows', 'seconds', 'peak_mb')}
+    with open(baseline_file, 'w') as f:
+        json.dump({'version': BASELINE_VERSION, 'python': sys.version.split()[0], 'machine': platform.platform(),
+                   'results': baselines}, f, indent=2)
+    print(f"Saved {len(results)} baselines to {baseline_file}")
+
+
+def compare_to_baselines(results: pd.DataFrame, baselines: dict,
+                         tolerance: float = REGRESSION_TOLERANCE) -> pd.DataFrame:
+    """
+    Add the baseline seconds and peak memory of each stage, their ratios and a 'regression' flag set when either
+    ratio exceeds 1 + tolerance by more than MIN_REGRESSION_SECONDS / MIN_REGRESSION_MB. Stages without a baseline are
+    never flagged.
+    """
+    compared = results.copy()
+    keys = compared['scale'] + '/' + compared['stage']
+    compared['baseline_seconds'] = keys.map(lambda key: baselines.get(key, {}).get('seconds', float('nan')))
+    compared['baseline_peak_mb'] = keys.map(lambda key: baselines.get(key, {}).get('peak_mb', float('nan')))
+    compared['time_ratio'] = compared['seconds'] / compared['baseline_seconds']
+    compared['memory_ratio'] = compared['peak_mb'] / compared['baseline_peak_mb']
+    slower = ((compared['time_ratio'] > 1 + tolerance)
+              & (compared['seconds'] - compared['baseline_seconds'] > MIN_REGRESSION_SECONDS))
+    hungrier = ((compared['memory_ratio'] > 1 + tolerance)
+                & (compared['peak_mb'] - compared['baseline_peak_mb'] > MIN_REGRESSION_MB))
+    compared['regression'] = slower | hungrier
+    return compared
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages on synthetic option chains.")
+    parser.add_argument('--scale', default='small', choices=list(SCALES))
+    parser.add_argument('--repeat', type=int, default=3, help="Timed runs per stage; the best is reported")
+    parser.add_argument('--postgres', action='store_true', help="Also benchmark the PostgreSQL loader and queries")
+    parser.add_argument('--baseline-file', default=BASELINE_FILE)
+    parser.add_argument('--tolerance', type=float, default=REGRESSION_TOLERANCE)
+    parser.add_argument('--save-baseline', action='store_true', help="Store this run as the baseline of its scale")
+    parser.add_argument('--check', action='store_true', help="Exit with status 1 if a stage regressed")
+    parser.add_argument('--output', help="CSV file to write the results to")
+    args = parser.parse_args()
+
+    results = compare_to_baselines(run_benchmarks(args.scale, args.repeat, args.postgres),
+                                   load_baselines(args.baseline_file), args.tolerance)
+    print(results.drop(columns='scale').to_string(index=False, float_format='{:.3f}'.format))
+    if args.output:
+        results.to_csv(args.output, index=False)
+    if args.save_baseline:
+        save_baselines(results, args.baseline_file)
+    regressions = results[results['regression']]
+    if len(regressions):
+        print(f"Regressions against {args.baseline_file}: {', '.join(regressions['stage'])}")
+        if args.check:
+            sys.exit(1)
@@ -0,0 +1,207 @@
+# Async, streaming chat completions with a persistent response cache
+# Tokens are handed to a callback as they arrive, so the answer starts printing at first-token time. Completed
+# responses are stored under a hash of the model, the sampling parameters and the whole message history, so a
+# repeated question in the same conversation is answered from disk without calling the API.
+# The backend is any OpenAI-compatible async client: openai.AsyncOpenAI (optionally pointed at a local server with
+# CHAT_BASE_URL) or StubChatBackend, which needs no network and has configurable latency and failures.
+
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+from types import SimpleNamespace
+from constants import CHAT_BACKEND, CHAT_BASE_URL, CHAT_CACHE_FOLDER
+
+CHAT_MODEL = 'gpt-4o-mini'
+CHAT_PARAMS = {'temperature': 0.1, 'max_tokens': 75}
+MAX_RETRIES = 4
+BACKOFF_SECONDS = 1.0  # First retry delay, doubled for every further attempt
+
+
+def response_cache_key(model: str, params: dict, messages: list) -> str:
+    """Hash of everything that determines a completion."""
+    payload = json.dumps({'model': model, 'params': params, 'messages': messages}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResponseCache:
+    """Completed responses, one JSON file per cache key."""
+
+    def __init__(self, cache_folder: str = CHAT_CACHE_FOLDER) -> None:
+        self.cache_folder: str = cache_folder
+        if not os.path.exists(self.cache_folder):
+            os.makedirs(self.cache_folder)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_folder, f'{key}.json')
+
+    def get(self, key: str):
+        """Return the cached response text, or None."""
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r') as f:
+            return json.load(f)['content']
+
+    def put(self, key: str, content: str, model: str) -> None:
+        """Store a response; the file is replaced atomically so concurrent writers never leave half an entry."""
+        path = self._path(key)
+        with open(f'{path}.tmp', 'w') as f:
+            json.dump({'model': model, 'content': content, 'created_at': time.time()}, f)
+        os.replace(f'{path}.tmp', path)
+
+
+class StubBackendError(Exception):
+    """Transient error raised by StubChatBackend, shaped like an HTTP status error of the openai package."""
+
+    def __init__(self, status_code: int) -> None:
+        super().__init__(f"Stub backend returned status {status_code}")
+        self.status_code: int = status_code
+
+
+class StubChatBackend:
+    """
+    Offline stand-in for openai.AsyncOpenAI: chat.completions.create with or without stream=True.
+
+    The reply is a fixed Market Expectation statement that mentions the last user message, streamed word by word.
+
+    :param first_token_latency: Seconds before the first chunk.
+    :param token_latency: Seconds between chunks.
+    :param failures: Number of calls that fail with a 503 before the backend answers, to exercise retries.
+    """
+
+    def __init__(self, first_token_latency: float = 0.0, token_latency: float = 0.0, failures: int = 0) -> None:
+        self.first_token_latency: float = first_token_latency
+        self.token_latency: float = token_latency
+        self.failures: int = failures
+        self.calls: int = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def reply(self, messages: list) -> str:
+        question = next((message['content'] for message in reversed(messages) if message['role'] == 'user'), '')
+        return (f"**Market Expectation** (stub reply to: {question[:60].strip()}): the current market structure "
+                f"does not suggest an imminent decrease in SPX over the next 2-4 weeks.")
+
+    async def _chunks(self, text: str):
+        await asyncio.sleep(self.first_token_latency)
+        for position, word in enumerate(text.split(' ')):
+            if position:
+                await asyncio.sleep(self.token_latency)
+            delta = SimpleNamespace(content=word if position == 0 else f' {word}')
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+
+    async def create(self, model: str, messages: list, stream: bool = False, **params):
+        self.calls += 1
+        if self.failures:
+            self.failures -= 1
+            raise StubBackendError(503)
+        text = self.reply(messages)
+        if stream:
+            return self._chunks(text)
+        await asyncio.sleep(self.first_token_latency)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))])
+
+
+def create_backend(backend: str = CHAT_BACKEND, api_key: str = None, base_url: str = CHAT_BASE_URL):
+    """
+    Create an OpenAI-compatible async client.
+
+    :param backend: 'openai' (the OpenAI API, or the server at base_url) or 'stub' (StubChatBackend).
+    """
+    if backend == 'stub':
+        return StubChatBackend()
+    if backend == 'openai':
+        from openai import AsyncOpenAI
+        # Retries are handled by ChatClient, which knows whether tokens were already shown
+        return AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+    raise ValueError(f"Unknown chat backend '{backend}'. Choose 'openai' or 'stub'.")
+
+
+def is_retryable(error: Exception) -> bool:
+    """Rate limits, server errors, timeouts and connection failures are worth retrying; other errors are not."""
+    status_code = getattr(error, 'status_code', None)
+    if status_code is not None:
+        return status_code in (408, 409, 429) or status_code >= 500
+    return isinstance(error, (ConnectionError, TimeoutError)) or any(
+        cls.__name__ == 'APIConnectionError' for cls in type(error).__mro__)
+
+
+class ChatClient:
+    """
+    Streaming chat completions with a response cache and retries with exponential backoff.
+
+    :param backend: OpenAI-compatible async client, see create_backend.
+    :param cache: ResponseCache, or None to always call the backend.
+    """
+
+    def __init__(self, backend, model: str = CHAT_MODEL, params: dict = None, cache: ResponseCache = None,
+                 max_retries: int = MAX_RETRIES, backoff_seconds: float = BACKOFF_SECONDS) -> None:
+        self.backend = backend
+        self.model: str = model
+        self.params: dict = dict(CHAT_PARAMS if params is None else params)
+        self.cache: ResponseCache = cache
+        self.max_retries: int = max_retries
+        self.backoff_seconds: float = backoff_seconds
+
+    async def _stream(self, messages: list, on_token, parts: list) -> str:
+        """Stream one completion, appending the pieces received so far to parts."""
+        stream = await self.backend.chat.completions.create(model=self.model, messages=messages, stream=True,
+                                                            **self.params)
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            token = chunk.choices[0].delta.content
+            if token:
+                parts.append(token)
+                if on_token is not None:
+                    on_token(token)
+        return ''.join(parts)
+
+    def cached(self, messages: list):
+        """Return the cached response to a message history, or None."""
+        if self.cache is None:
+            return None
+        return self.cache.get(response_cache_key(self.model, self.params, messages))
+
+    async def complete(self, messages: list, on_token=None) -> str:
+        """
+        Return the assistant response to a message history, streaming it to on_token as it arrives.
+
+        :param messages: Chat messages, as for chat.completions.create.
+        :param on_token: Optional callable receiving each piece of text; a cached response arrives as one piece.
+        :return: The full response text.
+        """
+        content = self.cached(messages)
+        if content is not None:
+            if on_token is not None:
+                on_token(content)
+            return content
+
+        for attempt in range(self.max_retries + 1):
+            received = []
+            try:
+                content = await self._stream(messages, on_token, received)
+                break
+            except Exception as e:
+                # Once tokens were shown a retry would repeat them, so only failures before the first token are retried
+                if received or attempt == self.max_retries or not is_retryable(e):
+                    raise
+                delay = self.backoff_seconds * 2 ** attempt * random.uniform(0.5, 1.0)
+                print(f"Chat request failed ({e}), retrying in {delay:.1f} seconds")
+                await asyncio.sleep(delay)
+
+        if self.cache is not None:
+            self.cache.put(response_cache_key(self.model, self.params, messages), content, self.model)
+        return content
+
+
+def create_chat_client(api_key: str = None, backend: str = CHAT_BACKEND, use_cache: bool = True) -> ChatClient:
+    """ChatClient on the configured backend, with the response cache in CHAT_CACHE_FOLDER unless use_cache is False."""
+    cache = ResponseCache() if use_cache and CHAT_CACHE_FOLDER else None
+    return ChatClient(create_backend(backend, api_key), cache=cache)
+
+
+def print_token(token: str) -> None:
+    print(token, end='', flush=True)
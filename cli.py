@@ -0,0 +1,178 @@
+# Command line entry point with one subcommand per pipeline stage:
+#   python cli.py ingest            load the daily CSVs waiting in DAILY_DATA_FOLDER
+#   python cli.py compute-entropy   ingest, then compute the entropy series
+#   python cli.py plot              plot the signal service's series or demo_data.csv (or the live pipeline with --live)
+#   python cli.py chat              start the market expectation chatbot on the signal service's series or demo_data.csv
+#   python cli.py forecast          batch market expectations for a list or range of as-of dates
+#   python cli.py backtest          evaluate the entropy-decline rule over a grid of variants, without the LLM
+# Each subcommand imports only the modules it needs and reports how long its startup took.
+
+import argparse
+import sys
+import threading
+import time
+
+START_TIME = time.perf_counter()
+
+
+def report_startup(command: str) -> None:
+    print(f"Startup of '{command}' took {time.perf_counter() - START_TIME:.2f} seconds")
+
+
+def ingest(args) -> None:
+    from load_daily_csv_to_db import load_daily_data_to_db
+    report_startup(args.command)
+
+    load_daily_data_to_db(target=args.source, workers=args.workers)
+
+
+def compute_entropy(args) -> None:
+    from entropy import get_entropy
+    report_startup(args.command)
+
+    entropy = get_entropy(estimator=args.estimator, source=args.source, ingest=not args.no_ingest)
+    if args.output:
+        entropy.to_csv(args.output, index=False)
+        print(f"Wrote {len(entropy)} rows to {args.output}")
+    else:
+        print(entropy.tail())
+
+
+def plot(args) -> None:
+    from plotter import Plotter
+    return_calculator, signal_client = None, None
+    if args.live:
+        from signal_service import SignalClient
+        signal_client = SignalClient()
+        if args.no_service or not signal_client.is_available():
+            # Compute the signal in this process
+            from return_calculator import ReturnCalculator
+            return_calculator, signal_client = ReturnCalculator([args.ticker], args.start_date), None
+    report_startup(args.command)
+
+    dataframe = None
+    if not args.live:
+        from main import load_signal
+        dataframe = load_signal(args.estimator)
+    Plotter(return_calculator, signal_client).plot_skewness_entropy_and_returns(args.ticker, dataframe,
+                                                                                demo=not args.live,
+                                                                                estimator=args.estimator,
+                                                                                output_file=args.output)
+
+
+def chat(args) -> None:
+    if args.backend == 'openai':
+        # openai is the slowest import of this path; load it in the background while the demo data is read
+        preload = threading.Thread(target=__import__, args=('openai',), daemon=True)
+        preload.start()
+
+    from constants import GENAI_API_KEY
+    from main import load_signal, build_initial_messages, create_client, start_chatGPT
+
+    if args.backend == 'openai' and GENAI_API_KEY is None:
+        raise ValueError("API key not found. Please check if your key is set up correctly.")
+    messages = build_initial_messages(load_signal(args.estimator))
+    client = create_client(GENAI_API_KEY, args.backend, use_cache=not args.no_cache)
+    report_startup(args.command)
+
+    print("Interactive financial insights chatbot. Start with the date of interest and request a market forecast. Type 'exit' or press Ctrl+C to quit.")
+    start_chatGPT(client, messages)
+
+
+def forecast(args) -> None:
+    from constants import GENAI_API_KEY
+    from main import load_demo_data, create_client
+    from batch_forecast import batch_forecast
+
+    if args.backend == 'openai' and GENAI_API_KEY is None:
+        raise ValueError("API key not found. Please check if your key is set up correctly.")
+    client = create_client(GENAI_API_KEY, args.backend, use_cache=not args.no_cache)
+    report_startup(args.command)
+
+    # Entropy is recomputed for each as-of date, so the full demo Skewness history is loaded as is
+    batch_forecast(client, load_demo_data('approximate'), args.output, dates=args.dates, start=args.start,
+                   end=args.end, freq=args.freq, max_concurrency=args.concurrency,
+                   requests_per_minute=args.requests_per_minute, estimator=args.estimator)
+
+
+def backtest(args) -> None:
+    from backtest import backtest_rule_grid, PROMPT_RULE
+    from main import load_demo_data
+    report_startup(args.command)
+
+    results = backtest_rule_grid(load_demo_data(args.estimator), PROMPT_RULE if args.prompt_rule else None)
+    if args.output:
+        results.to_csv(args.output, index=False)
+        print(f"Wrote {len(results)} rule variants to {args.output}")
+    ranked = results[results['signal_days'] >= args.min_signal_days].sort_values('lift', ascending=False)
+    print(ranked.head(args.top).to_string(index=False))
+
+
+def build_parser() -> argparse.ArgumentParser:
+    from constants import (ENTROPY_ESTIMATOR, OPTIONS_DATA_SOURCE, INGEST_WORKERS, CHAT_BACKEND, BATCH_MAX_CONCURRENCY,
+                           BATCH_REQUESTS_PER_MINUTE)
+    from entropy_estimators import ESTIMATORS
+
+    parser = argparse.ArgumentParser(description="Options skewness entropy pipeline.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    ingest_parser = subparsers.add_parser('ingest', help="Load the daily CSVs waiting in DAILY_DATA_FOLDER")
+    ingest_parser.add_argument('--source', default=OPTIONS_DATA_SOURCE, choices=['postgres', 'parquet'])
+    ingest_parser.add_argument('--workers', type=int, default=INGEST_WORKERS, help="Processes parsing files")
+    ingest_parser.set_defaults(handler=ingest)
+
+    entropy_parser = subparsers.add_parser('compute-entropy', help="Compute the entropy of the skewness series")
+    entropy_parser.add_argument('--estimator', default=ENTROPY_ESTIMATOR, choices=sorted(ESTIMATORS))
+    entropy_parser.add_argument('--source', default=OPTIONS_DATA_SOURCE, choices=['postgres', 'parquet'])
+    entropy_parser.add_argument('--no-ingest', action='store_true', help="Skip loading pending daily files")
+    entropy_parser.add_argument('--output', help="CSV file to write the Date/Entropy/Skewness series to")
+    entropy_parser.set_defaults(handler=compute_entropy)
+
+    plot_parser = subparsers.add_parser('plot', help="Plot skewness, entropy and the index price")
+    plot_parser.add_argument('--estimator', default=ENTROPY_ESTIMATOR, choices=sorted(ESTIMATORS))
+    plot_parser.add_argument('--live', action='store_true',
+                             help="Plot the live signal from the signal service, or run the pipeline if it is not running")
+    plot_parser.add_argument('--no-service', action='store_true', help="With --live, always run the pipeline locally")
+    plot_parser.add_argument('--ticker', default='^SPX')
+    plot_parser.add_argument('--start-date', default='1990-01-01')
+    plot_parser.add_argument('--output', help="Write a .html or image file instead of opening a browser")
+    plot_parser.set_defaults(handler=plot)
+
+    chat_parser = subparsers.add_parser('chat', help="Chat about market expectations based on the signal")
+    chat_parser.add_argument('--estimator', default=ENTROPY_ESTIMATOR, choices=sorted(ESTIMATORS))
+    chat_parser.add_argument('--backend', default=CHAT_BACKEND, choices=['openai', 'stub'],
+                             help="'stub' answers offline, for testing and benchmarking")
+    chat_parser.add_argument('--no-cache', action='store_true', help="Always call the backend")
+    chat_parser.set_defaults(handler=chat)
+
+    forecast_parser = subparsers.add_parser('forecast', help="Market expectations for many as-of dates, to a CSV file")
+    forecast_parser.add_argument('--dates', nargs='+', help="As-of dates; otherwise every --freq step from --start to --end")
+    forecast_parser.add_argument('--start', help="First as-of date of the range (default: first date of the data)")
+    forecast_parser.add_argument('--end', help="Last as-of date of the range (default: last date of the data)")
+    forecast_parser.add_argument('--freq', default='W-FRI', help="Step of the range, as a pandas frequency")
+    forecast_parser.add_argument('--output', default='forecasts.csv')
+    forecast_parser.add_argument('--estimator', default=ENTROPY_ESTIMATOR, choices=sorted(ESTIMATORS))
+    forecast_parser.add_argument('--backend', default=CHAT_BACKEND, choices=['openai', 'stub'])
+    forecast_parser.add_argument('--concurrency', type=int, default=BATCH_MAX_CONCURRENCY, help="Requests in flight")
+    forecast_parser.add_argument('--requests-per-minute', type=float, default=BATCH_REQUESTS_PER_MINUTE)
+    forecast_parser.add_argument('--no-cache', action='store_true', help="Always call the backend")
+    forecast_parser.set_defaults(handler=forecast)
+
+    backtest_parser = subparsers.add_parser('backtest', help="Hit rate, lead time and drawdown capture of the entropy rule")
+    backtest_parser.add_argument('--estimator', default=ENTROPY_ESTIMATOR, choices=sorted(ESTIMATORS))
+    backtest_parser.add_argument('--prompt-rule', action='store_true', help="Only the rule as stated in the chat prompt")
+    backtest_parser.add_argument('--min-signal-days', type=int, default=20, help="Ignore rarer variants in the ranking")
+    backtest_parser.add_argument('--top', type=int, default=10, help="Variants to print, by lift over the base rate")
+    backtest_parser.add_argument('--output', help="CSV file to write the metrics of every variant to")
+    backtest_parser.set_defaults(handler=backtest)
+
+    return parser
+
+
+def run(argv=None) -> None:
+    args = build_parser().parse_args(argv)
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    run(sys.argv[1:])
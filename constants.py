@@ -5,4 +5,28 @@ DB_HOST = 'localhost'
 DB_NAME = 'options_data'
 DB_USER = 'vpintea'
 DB_PORT = 5432
-DB_PASSWORD = None
\ No newline at end of file
+DB_PASSWORD = None
+ENTROPY_ESTIMATOR = 'approximate'  # 'approximate', 'sample' or 'permutation'
+SIGNAL_STORE_FOLDER = './historical_data/signal_store/'
+SERVER_SIDE_SKEWNESS = False  # Aggregate deepest-strike prices in PostgreSQL instead of loading every row
+OPTIONS_DATA_SOURCE = 'postgres'  # 'postgres' or 'parquet' (local store in OPTIONS_STORE_FOLDER)
+OPTIONS_STORE_FOLDER = './options_store/'
+STREAMING_CHUNK_SIZE = None  # Rows per chunk for streamed PostgreSQL reads; None loads the whole result at once
+INSERT_MODE = 'copy'  # 'copy' (COPY + staging table) or 'execute_values' for loading daily CSVs into PostgreSQL
+INGEST_WORKERS = 1  # Processes parsing daily CSVs in parallel; 1 parses and inserts one file at a time
+PRICE_DATA_SOURCE = 'yahoo'  # 'yahoo' or 'fake' (deterministic offline prices for tests and demos)
+PROMPT_TOKEN_BUDGET = 4500  # Estimated tokens of the initial chat messages (instructions, signal features and data rows)
+CHAT_BACKEND = 'openai'  # 'openai' or 'stub' (offline OpenAI-compatible stand-in for tests and benchmarks)
+CHAT_BASE_URL = None  # URL of an OpenAI-compatible server (e.g. a local model); None uses the OpenAI API
+CHAT_CACHE_FOLDER = './historical_data/chat_cache/'  # Cached chat responses; None disables the cache
+BATCH_MAX_CONCURRENCY = 8  # Chat requests in flight at once in batch forecasts
+BATCH_REQUESTS_PER_MINUTE = 60  # Rate limit of batch forecast requests; set to the API tier's limit
+INSTRUMENTATION_LOG = './logs/pipeline_stages.jsonl'  # JSON lines of per-stage timings, rows and memory; None disables
+TRACE_MEMORY = False  # Record the peak traced memory of each stage (tracemalloc slows allocation-heavy stages down)
+PROFILE_STAGES = []  # Stage names to run under cProfile, e.g. ['skewness', 'entropy'], or ['*'] for every stage
+PROFILE_FOLDER = './logs/profiles/'
+SIGNAL_SERVICE_HOST = '127.0.0.1'
+SIGNAL_SERVICE_PORT = 8765
+SIGNAL_SERVICE_URL = f'http://{SIGNAL_SERVICE_HOST}:{SIGNAL_SERVICE_PORT}'  # Where main.py and the plotter read the signal
+SIGNAL_SERVICE_SOURCE = 'demo'  # 'demo' (demo_data.csv) or 'pipeline' (ingestion, entropy and index prices)
+SIGNAL_REFRESH_SECONDS = 60  # How often the signal service checks for newly ingested data
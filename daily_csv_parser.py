@@ -0,0 +1,155 @@
+# Parser for the daily SPX quote table CSVs (deltaneutral / CBOE delayed quotes download format)
+# The header lines and the option rows are read through one file handle, and dates are parsed vectorized with
+# explicit formats, so a file is read once and never walked row by row.
+
+import os
+import re
+import numpy as np
+import pandas as pd
+from options_store import OPTIONS_COLUMNS
+
+# Raw columns of the option rows: calls on the left of Strike, puts on the right
+RAW_COLUMNS = [
+    'expire_date', 'Calls', 'C_Last Sale', 'C_Net', 'C_Bid', 'C_Ask', 'C_Volume', 'C_IV', 'C_Delta',
+    'C_Gamma', 'C_Open Interest', 'Strike', 'Puts', 'P_Last Sale', 'P_Net', 'P_Bid', 'P_Ask', 'P_Volume',
+    'P_IV', 'P_Delta', 'P_Gamma', 'P_Open Interest'
+]
+
+# Raw column feeding each options_data column (quote_date and underlying_last come from the header)
+RAW_TO_OPTIONS_COLUMNS = {
+    'expire_date': 'expire_date', 'C_Volume': 'c_volume', 'C_Bid': 'c_bid', 'C_Ask': 'c_ask', 'C_IV': 'c_iv',
+    'C_Delta': 'c_delta', 'C_Gamma': 'c_gamma', 'C_Open Interest': 'c_open_interest', 'Strike': 'strike',
+    'P_Bid': 'p_bid', 'P_Ask': 'p_ask', 'P_Volume': 'p_volume', 'P_IV': 'p_iv', 'P_Delta': 'p_delta',
+    'P_Gamma': 'p_gamma', 'P_Open Interest': 'p_open_interest'
+}
+
+# Prices, greeks and strikes are always floats; volumes and open interest keep the integer type when complete
+FLOAT_COLUMNS = ['C_Bid', 'C_Ask', 'C_IV', 'C_Delta', 'C_Gamma', 'Strike', 'P_Bid', 'P_Ask', 'P_IV', 'P_Delta', 'P_Gamma']
+
+EXPIRE_DATE_FORMAT = '%a %b %d %Y'  # e.g. Mon Aug 05 2024
+HEADER_DATE_FORMAT = '%B %d, %Y'  # e.g. August 5, 2024
+MAX_HEADER_LINES = 10
+
+LAST_PATTERN = re.compile(r'Last:\s*([\d,]+(?:\.\d+)?)')
+DATE_PATTERN = re.compile(r'Date:\s*([A-Za-z]+ \d{1,2}, \d{4})')
+# spx_quotedata_2025_01_03.csv or spx_quotedata_01_03_2025.csv
+DATED_FILE_PATTERN = re.compile(r'(?:(\d{4})_(\d{2})_(\d{2})|(\d{2})_(\d{2})_(\d{4}))\.csv$')
+# spx_quotedata_01_03.csv
+UNDATED_FILE_PATTERN = re.compile(r'(\d{2})_(\d{2})\.csv$')
+
+
+def _read_header(f):
+    """
+    Read the lines above the column header from an open file.
+
+    :return: Tuple (underlying_last, header quote date or None); the handle is left on the first option row.
+    """
+    underlying_last, quote_date = None, None
+    for _ in range(MAX_HEADER_LINES):
+        line = f.readline()
+        if not line:
+            break
+        if line.startswith('Expiration Date'):
+            if underlying_last is None:
+                raise ValueError("No 'Last:' value in the file header.")
+            return underlying_last, quote_date
+        last_match = LAST_PATTERN.search(line)
+        if last_match and underlying_last is None:
+            underlying_last = float(last_match.group(1).replace(',', ''))
+        date_match = DATE_PATTERN.search(line)
+        if date_match and quote_date is None:
+            quote_date = pd.to_datetime(date_match.group(1), format=HEADER_DATE_FORMAT)
+    raise ValueError("No 'Expiration Date' column header in the first lines of the file.")
+
+
+def quote_date_from_file_name(csv_file, first_expiry=None):
+    """
+    Quote date from the file name. Names without a year (spx_quotedata_08_05.csv) take the latest year that puts
+    the quote date on or before the first expiry of the file.
+
+    :param csv_file: Path of the CSV file.
+    :param first_expiry: Earliest expiration date in the file, needed for names without a year.
+    :return: pd.Timestamp, or None if the name holds no date or the year cannot be inferred.
+    """
+    file_name = os.path.basename(csv_file)
+    dated = DATED_FILE_PATTERN.search(file_name)
+    if dated:
+        year, month, day = dated.group(1, 2, 3) if dated.group(1) else (dated.group(6), dated.group(4), dated.group(5))
+        return pd.Timestamp(year=int(year), month=int(month), day=int(day))
+
+    undated = UNDATED_FILE_PATTERN.search(file_name)
+    if not undated or first_expiry is None or pd.isnull(first_expiry):
+        return None
+    month, day = int(undated.group(1)), int(undated.group(2))
+    for year in (first_expiry.year, first_expiry.year - 1):
+        try:
+            quote_date = pd.Timestamp(year=year, month=month, day=day)
+        except ValueError:
+            continue
+        if quote_date <= first_expiry:
+            return quote_date
+    return None
+
+
+def read_quote_date(csv_file):
+    """
+    Quote date of a daily file, reading only its header (and the first option row if the header has no date).
+
+    :return: pd.Timestamp.
+    """
+    with open(csv_file, 'r') as f:
+        _, quote_date = _read_header(f)
+        if quote_date is None:
+            quote_date = quote_date_from_file_name(csv_file)
+        if quote_date is None:
+            first_expiry = pd.to_datetime(f.readline().split(',', 1)[0], format=EXPIRE_DATE_FORMAT, errors='coerce')
+            quote_date = quote_date_from_file_name(csv_file, first_expiry)
+    if quote_date is None:
+        raise ValueError(f"Cannot determine the quote date of {csv_file}.")
+    return quote_date
+
+
+def parse_daily_csv(csv_file):
+    """
+    Parse and validate one daily CSV into options_data rows. Runs in the worker processes of the pipelined loader,
+    so it must not touch the database.
+
+    The quote date comes from the 'Date:' header line, else from the file name (inferring the year from the
+    expirations when the name has none).
+
+    :param csv_file: Path of the CSV file.
+    :return: Tuple (quote_date, df_cleaned, valid_rows_count, expected_row_count), where df_cleaned has the
+             OPTIONS_COLUMNS with datetime dates and numeric prices.
+    """
+    with open(csv_file, 'r') as f:
+        underlying_last, quote_date = _read_header(f)
+        df = pd.read_csv(f, header=None, names=RAW_COLUMNS, usecols=list(RAW_TO_OPTIONS_COLUMNS))
+
+    # Placeholders such as '-' in a numeric column become NaN instead of failing the whole file
+    numeric_columns = [column for column in RAW_TO_OPTIONS_COLUMNS if column != 'expire_date']
+    df[numeric_columns] = df[numeric_columns].apply(pd.to_numeric, errors='coerce')
+    df[FLOAT_COLUMNS] = df[FLOAT_COLUMNS].astype(np.float64)
+
+    # Blank rows are not counted as data rows
+    expected_row_count = len(df) - int(df.isnull().all(axis=1).sum())
+
+    df['expire_date'] = pd.to_datetime(df['expire_date'], format=EXPIRE_DATE_FORMAT, errors='coerce')
+    if quote_date is None:
+        quote_date = quote_date_from_file_name(csv_file)
+    if quote_date is None:
+        quote_date = quote_date_from_file_name(csv_file, df['expire_date'].min())
+    if quote_date is None:
+        raise ValueError(f"Cannot determine the quote date of {csv_file}.")
+
+    # Drop rows with invalid expiration dates, then add the quote level columns
+    df = df.dropna(subset=['expire_date']).rename(columns=RAW_TO_OPTIONS_COLUMNS)
+    df['quote_date'] = quote_date
+    df['underlying_last'] = underlying_last
+    df['dte'] = (df['expire_date'] - quote_date).dt.days
+
+    df_cleaned = df[OPTIONS_COLUMNS].sort_values(by=['quote_date', 'expire_date', 'strike'])
+
+    # Rows with every required column present
+    valid_rows_count = len(df_cleaned.dropna(subset=['quote_date', 'expire_date', 'c_bid', 'c_ask', 'p_bid', 'p_ask']))
+
+    return quote_date, df_cleaned, valid_rows_count, expected_row_count
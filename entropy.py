@@ -11,230 +11,250 @@
 import time
 import numpy as np
 import pandas as pd
-from load_options_data import load_options_data_from_db
+from load_options_data import (load_options_data_from_db, load_quote_date_fingerprints, load_deepest_strike_medians_from_db,
+                               stream_options_data_from_db)
 from load_daily_csv_to_db import load_daily_data_to_db
+from ingestion_manifest import has_pending_files, get_ingestion_watermark
+from constants import ENTROPY_ESTIMATOR, SERVER_SIDE_SKEWNESS, OPTIONS_DATA_SOURCE, STREAMING_CHUNK_SIZE
+from options_store import load_options_data_from_store, load_quote_date_fingerprints_from_store
+from approximate_entropy import WINDOW_SIZE, DELTA, TOLERANCE_FACTOR
+from entropy_estimators import get_estimator
+from signal_store import SignalStore
+from skewness import (clean_options_data, filter_options_data, calculate_average_skewness_same_strike_same_dte,
+                      skewness_from_deepest_strike_medians, calculate_average_skewness_from_chunks)
+from entropy_sweep import sweep_entropy_parameters, PARAMETER_COLUMNS
+from streaming_entropy import StreamingApproximateEntropy, ENTROPY_STATE_FILE
+from instrumentation import stage
 
 pd.set_option('display.max_columns', None)
-import matplotlib
-matplotlib.use('TkAgg')  # or 'Qt5Agg', depending on your preference
-
-def get_entropy():
-    WINDOW_SIZE = 50  # Window size
-    DELTA = 1  # Sliding step
 
+START_DATE = "2019-05-11"
+
+
+def get_average_skewness(option_data_sample):
+    """
+    Clean raw option rows and reduce them to one skewness premium per quote_date.
+
+    :param option_data_sample: DataFrame of option rows as returned by load_options_data_from_db.
+    :return: DataFrame with 'quote_date' and 'Average Skewness' columns.
+    """
+    with stage('clean', "Data cleaning and preprocessing") as clean_stage:
+        option_data_sample = clean_options_data(option_data_sample)
+        clean_stage.rows = len(option_data_sample)
+
+    with stage('filter', "Filtering data") as filter_stage:
+        filtered_data = filter_options_data(option_data_sample)
+        filter_stage.rows = len(filtered_data)
+
+    with stage('skewness', "Skewness calculation") as skewness_stage:
+        average_skewness = calculate_average_skewness_same_strike_same_dte(filtered_data)
+        skewness_stage.rows = len(average_skewness)
+
+    return average_skewness
+
+
+def load_options_data(start_date, quote_dates=None, source=OPTIONS_DATA_SOURCE):
+    """
+    Load option rows from PostgreSQL ('postgres') or the local columnar store ('parquet').
+
+    :param start_date: First quote_date to include.
+    :param quote_dates: Optional list of quote dates to restrict the load to.
+    :param source: Where to read options_data from.
+    :return: DataFrame of option rows.
+    """
+    if source == 'parquet':
+        return load_options_data_from_store(start_date, quote_dates=quote_dates)
+    if source == 'postgres':
+        return load_options_data_from_db(start_date, quote_dates=quote_dates)
+    raise ValueError(f"Unknown options data source '{source}'. Choose 'postgres' or 'parquet'.")
+
+
+def load_average_skewness(quote_dates=None, server_side=SERVER_SIDE_SKEWNESS, source=OPTIONS_DATA_SOURCE,
+                          chunk_size=STREAMING_CHUNK_SIZE):
+    """
+    Load option rows and reduce them to the daily skewness series.
+
+    :param quote_dates: Optional list of quote dates to restrict the load to.
+    :param server_side: Compute the deepest-strike medians in PostgreSQL and only transfer one row per quote_date.
+    :param source: Where to read options_data from, 'postgres' or 'parquet'.
+    :param chunk_size: Stream rows from PostgreSQL in chunks of this many rows with compact dtypes, keeping peak
+                       memory flat; None loads the whole result at once. float32 prices shift skewness values
+                       by about 1e-7 relative to the full-precision load.
+    :return: DataFrame with 'quote_date' and 'Average Skewness' columns.
+    """
+    if server_side and source != 'postgres':
+        raise ValueError("Server-side skewness aggregation requires the 'postgres' source.")
+
+    if server_side:
+        with stage('load_medians', "Loading deepest strike medians from DB", source=source) as load_stage:
+            medians = load_deepest_strike_medians_from_db(START_DATE, quote_dates=quote_dates)
+            load_stage.rows = 0 if medians is None else len(medians)
+        if medians is None or medians.empty:
+            return pd.DataFrame({'quote_date': [], 'Average Skewness': []})
+        medians = medians.set_index('quote_date')
+        return skewness_from_deepest_strike_medians(medians['call_median'], medians['put_median'])
+
+    if chunk_size and source == 'postgres':
+        with stage('stream_skewness', "Streaming options data and skewness calculation", source=source,
+                   chunk_size=chunk_size) as skewness_stage:
+            chunks = stream_options_data_from_db(START_DATE, quote_dates=quote_dates, chunk_size=chunk_size)
+            average_skewness = calculate_average_skewness_from_chunks(chunks)
+            skewness_stage.rows = len(average_skewness)
+        return average_skewness
+
+    with stage('load', f"Loading options data from {source}", source=source) as load_stage:
+        option_data_sample = load_options_data(START_DATE, quote_dates=quote_dates, source=source)
+        load_stage.rows = 0 if option_data_sample is None else len(option_data_sample)
+
+    if option_data_sample is None or option_data_sample.empty:
+        return pd.DataFrame({'quote_date': [], 'Average Skewness': []})
+    return get_average_skewness(option_data_sample)
+
+
+def ingest_pending_files(source=OPTIONS_DATA_SOURCE):
+    """
+    Load the daily files waiting in DAILY_DATA_FOLDER into the source. Without pending files this is a single
+    directory check, with no database connection.
+
+    :param source: Where to load the files, 'postgres' or 'parquet'.
+    """
+    if has_pending_files():
+        with stage('ingest', f"Loading daily data to {source}", source=source):
+            load_daily_data_to_db(target=source)
+
+
+def get_entropy(window_width=WINDOW_SIZE, sliding_step=DELTA, m=None, r=None, estimator=ENTROPY_ESTIMATOR,
+                use_store=True, server_side=SERVER_SIDE_SKEWNESS, source=OPTIONS_DATA_SOURCE, ingest=True):
+    """
+    Load option data, reduce it to daily skewness and calculate entropy over a sliding window.
+
+    :param window_width: Width of the sliding window.
+    :param sliding_step: Step size for moving the window.
+    :param m: Embedding dimension (pattern order for permutation entropy); None uses the estimator default.
+    :param r: Tolerance level; None uses 0.15 * std_dev of the skewness series. Ignored by permutation entropy.
+    :param estimator: Estimator name from entropy_estimators.ESTIMATORS or an EntropyEstimator instance.
+    :param use_store: Serve skewness and entropy from the SignalStore, recomputing only new or changed quote dates.
+    :param server_side: Aggregate the deepest-strike prices in PostgreSQL instead of loading every option row.
+    :param source: Where to read options_data from, 'postgres' or the local 'parquet' store.
+    :param ingest: Load pending daily files first; False serves the data already ingested.
+    :return: DataFrame with Date, Entropy and Skewness.
+    """
     start_time = time.time()  # Start timing
-    start_date = "2019-05-11"
-    end_date = "2024-09-18"
-
-    load_db_start = time.time()
-    load_daily_data_to_db()
-    print(f"Loading daily data to DB took {time.time() - load_db_start:.2f} seconds")
-
-    load_data_start = time.time()
-    option_data_sample = load_options_data_from_db(start_date)
-
-    print(f"Loading options data from DB took {time.time() - load_data_start:.2f} seconds")
-
-    clean_data_start = time.time()
-    option_data_sample.dropna(subset=['quote_date', 'expire_date', 'c_bid', 'c_ask', 'p_bid', 'p_ask'], inplace=True)
-    # Calculate the average price for call and put options
-    # Ensure that c_bid, c_ask, p_bid, and p_ask are numeric
-    option_data_sample['c_bid'] = pd.to_numeric(option_data_sample['c_bid'], errors='coerce')
-    option_data_sample['c_ask'] = pd.to_numeric(option_data_sample['c_ask'], errors='coerce')
-    option_data_sample['p_bid'] = pd.to_numeric(option_data_sample['p_bid'], errors='coerce')
-    option_data_sample['p_ask'] = pd.to_numeric(option_data_sample['p_ask'], errors='coerce')
-
-    option_data_sample['C_Avg'] = (option_data_sample['c_bid'] + option_data_sample['c_ask']) / 2
-    option_data_sample['P_Avg'] = (option_data_sample['p_bid'] + option_data_sample['p_ask']) / 2
-    option_data_sample.dropna(subset=['C_Avg', 'P_Avg'], inplace=True)
-    print(f"Data cleaning and preprocessing took {time.time() - clean_data_start:.2f} seconds")
-
-    filter_data_start = time.time()
-    # Ensure we're only looking at rows where C_Avg and P_Avg are not NaN
-    option_data_sample = option_data_sample[(option_data_sample['C_Avg'] != 0) & (option_data_sample['P_Avg'] != 0)]
-
-    filtered_data = option_data_sample[(option_data_sample['dte'] > 28) & (option_data_sample['dte'] < 118)]
-    print(f"Filtering data took {time.time() - filter_data_start:.2f} seconds")
-
-    skewness_calc_start = time.time()
-
-    def calculate_average_skewness_same_strike_same_dte(df):
-        """
-        Calculate skewness premium using the deepest available out-of-the-money option pairs across multiple expiries for each quote_date.
-
-        :param df: DataFrame containing options data (already filtered for DTE > 28, DTE < 200, and valid premiums).
-        :return: DataFrame with skewness premium for each quote_date.
-        """
-
-        def get_deepest_available_strikes(group):
-            """
-            Find the deepest available strike for both calls and puts that are available across all expiries.
-            """
-            # Sort by strike
-            group_sorted = group.sort_values(by='strike')
-
-            # Find the deepest call (highest strike) and deepest put (lowest strike)
-            deepest_call_strike = group_sorted['strike'].max()
-            deepest_put_strike = group_sorted['strike'].min()
-
-            # Get the rows for the deepest call and put across all expiries
-            call_options = group[(group['strike'] == deepest_call_strike)]
-            put_options = group[(group['strike'] == deepest_put_strike)]
-
-            if call_options.empty or put_options.empty:
-                return None
-
-            # Return the average prices for both call and put, averaging across expiries
-            call_avg = call_options['C_Avg'].median()
-            put_avg = put_options['P_Avg'].median()
-            # call_avg_ = call_options['C_Avg'].mean()
-            # put_avg_ = put_options['P_Avg'].mean()
-
-            return call_avg, put_avg
-
-        # Group by 'quote_date'
-        grouped = df.groupby('quote_date')
-
-        def calculate_skewness_for_group(group):
-            # Get the deepest available strike for this quote_date
-            result = get_deepest_available_strikes(group)
-            if result is None:
-                return None
-
-            call_avg, put_avg = result
-
-            # Ensure both call and put have valid averages
-            if call_avg > 0 and put_avg > 0:
-                # Calculate skewness premium
-                skewness_premium = (put_avg / call_avg) - 1
-                return skewness_premium
-            return None
-
-        # Apply skewness calculation for each quote_date
-        skewness_data = grouped.apply(calculate_skewness_for_group).reset_index()
-        skewness_data.columns = ['quote_date', 'skewness_premium']
-        # Filter out extreme skewness values (e.g., by limiting the skewness ratio)
-        skewness_data['skewness_premium'] = skewness_data['skewness_premium'].apply(
-            lambda x: x if abs(x) < 200 else 0)
-        return skewness_data
-
-    skewness_data = calculate_average_skewness_same_strike_same_dte(filtered_data)
-    print(f"Skewness calculation took {time.time() - skewness_calc_start:.2f} seconds")
-
-    avg_skew_start = time.time()
-
-    # Drop the EXPIRE_DATE column as it's no longer relevant
-    skewness_data = skewness_data.drop(columns='expire_date', errors='ignore')
-    # Calculate the average skewness premium for each QUOTE_DATE
-    average_skewness = skewness_data.groupby('quote_date').max().reset_index()
-    # Rename the second column to 'Average Skewness'
-    average_skewness.rename(columns={"skewness_premium": 'Average Skewness'}, inplace=True)
-
-    print(f"Averaging skewness took {time.time() - avg_skew_start:.2f} seconds")
-
-    skewness_data = average_skewness['Average Skewness']
-    quote_dates = average_skewness['quote_date']
-
-    entropy_calc_start = time.time()
-
-    def calculate_approximate_entropy_with_skewness(skewness_data, quote_dates, window_width=WINDOW_SIZE, sliding_step=DELTA, m=2,
-                                                    r=None):
-        """
-        Calculate Approximate Entropy (ApEn) for a given time series with aligned dates and skewness using a sliding window.
-
-        Parameters:
-        - skewness_data: The time series data (e.g., skewness premiums).
-        - quote_dates: The list of corresponding quote dates.
-        - window_width: The width of the sliding window.
-        - sliding_step: The step size for moving the window.
-        - m: The dimension of the vectors u(m)(i) used in the ApEn calculation. Default is 2.
-        - r: The tolerance level. If not provided, it will be calculated as r = 0.15 * std_dev of the data.
-
-        Returns:
-        - entropy_df: A DataFrame containing the Approximate Entropy, corresponding dates, and skewness.
-        """
-        N = len(skewness_data)
-        if N < m + 1:
-            raise ValueError("Time series is too short to calculate approximate entropy.")
-
-        # Calculate standard deviation of the time series
-        std_dev = np.std(skewness_data)
-
-        # Set tolerance r if not provided
-        if r is None:
-            r = 0.15 * std_dev
-
-        # Store results
-        entropy_values = []
-        aligned_skewness = []
-        aligned_dates = []
-
-        # Step 1: Create m-dimensional vectors
-        def create_m_dimensional_vectors(data, m):
-            vectors = np.array([data[i:i + m] for i in range(len(data) - m + 1)])
-            return vectors
-
-        # Step 2: Calculate distance between vectors
-        def max_distance(v1, v2):
-            return np.max(np.abs(v1 - v2))
-
-        # Step 3: Calculate C(m)(u(m)(i)|X, r)
-        def calculate_C_m(vectors, r):
-            N_m = len(vectors)
-            C_m = np.zeros(N_m)
-            for i in range(N_m):
-                for j in range(N_m):
-                    if max_distance(vectors[i], vectors[j]) <= r:
-                        C_m[i] += 1
-                C_m[i] /= N_m
-            return C_m
-
-        # Step 4: Calculate Φ(m)(r)
-        def calculate_Phi(C_m):
-            return np.sum(np.log(C_m)) / len(C_m)
-
-        # Sliding window over the skewness data
-        num_windows = (N - window_width) // sliding_step + 1
-
-        for n in range(num_windows):
-            start_index = n * sliding_step
-            end_index = start_index + window_width
-            window_data = skewness_data[start_index:end_index]
-
-            # Create m and (m+1)-dimensional vectors for the current window
-            vectors_m = create_m_dimensional_vectors(window_data, m)
-            vectors_m1 = create_m_dimensional_vectors(window_data, m + 1)
-
-            # Calculate C(m) and C(m+1)
-            C_m = calculate_C_m(vectors_m, r)
-            C_m1 = calculate_C_m(vectors_m1, r)
-
-            # Calculate Φ(m) and Φ(m+1)
-            Phi_m = calculate_Phi(C_m)
-            Phi_m1 = calculate_Phi(C_m1)
-
-            # Calculate Approximate Entropy (ApEn)
-            ApEn = Phi_m - Phi_m1
-            entropy_values.append(ApEn)
-
-            # Align dates with the entropy calculation (date at the end of the window)
-            aligned_dates.append(quote_dates[end_index - 1])
-
-            # Align skewness data with the entropy calculation (last skewness value in the window)
-            aligned_skewness.append(window_data.iloc[-1])
-
-        # Return the results in a DataFrame
-        entropy_df = pd.DataFrame({
-            'Date': aligned_dates,
-            'Entropy': entropy_values,
-            'Skewness': aligned_skewness
-        })
-        entropy_df['Date'] = pd.to_datetime(entropy_df['Date'])
-        return entropy_df
-
-    entropy = calculate_approximate_entropy_with_skewness(skewness_data, quote_dates, window_width=50, m=2)
-
-    print(f"Entropy calculation took {time.time() - entropy_calc_start:.2f} seconds")
+    with stage('get_entropy', estimator=getattr(estimator, 'name', estimator), source=source) as run_stage:
+        if ingest:
+            ingest_pending_files(source)
+
+        entropy_estimator = get_estimator(estimator, window_width=window_width, sliding_step=sliding_step, m=m, r=r)
+
+        if use_store:
+            store = SignalStore()
+            with stage('fingerprint', f"Fingerprinting options data in {source}", source=source) as fingerprint_stage:
+                if source == 'parquet':
+                    fingerprints = load_quote_date_fingerprints_from_store(START_DATE)
+                else:
+                    fingerprints = load_quote_date_fingerprints(START_DATE)
+                fingerprint_stage.rows = len(fingerprints)
+
+            average_skewness = store.get_skewness(fingerprints,
+                                                  lambda quote_dates: load_average_skewness(quote_dates, server_side, source))
+
+            with stage('entropy', f"{entropy_estimator.name} calculation", estimator=entropy_estimator.name) as entropy_stage:
+                entropy = store.get_entropy(average_skewness, entropy_estimator)
+                entropy_stage.rows = len(entropy)
+        else:
+            average_skewness = load_average_skewness(server_side=server_side, source=source)
+
+            with stage('entropy', f"{entropy_estimator.name} calculation", estimator=entropy_estimator.name) as entropy_stage:
+                entropy = entropy_estimator.calculate(average_skewness['Average Skewness'], average_skewness['quote_date'])
+                entropy_stage.rows = len(entropy)
+        run_stage.rows = len(entropy)
+
     print(f"Total execution time: {time.time() - start_time:.2f} seconds")
 
     return entropy
+
+
+def update_entropy(state_file=ENTROPY_STATE_FILE, source=OPTIONS_DATA_SOURCE, refit=False):
+    """
+    Emit entropy only for the quote dates loaded since the previous run.
+
+    The streaming calculator state is restored from state_file, fed the skewness of the new quote dates and
+    saved again, so the daily refresh does not depend on the length of history. On the first run the calculator
+    is built from the full history with r = 0.15 * std_dev, which then stays fixed for later updates: the state file
+    records r and the last quote date it was fitted on. get_entropy recomputes r from the whole history on every
+    call, so as new data arrives the two drift apart for the same dates. refit=True discards the state and rebuilds
+    it from the full history, which brings r and the returned values back in line with get_entropy.
+
+    :param state_file: JSON file holding the StreamingApproximateEntropy state.
+    :param source: Where to read options_data from, 'postgres' or 'parquet'.
+    :param refit: Recompute r and the entropy of every window from the full history instead of updating the state.
+    :return: DataFrame with Date, Entropy and Skewness for the newly completed windows (every window when refit).
+    """
+    with stage('update_entropy', "Incremental entropy update", source=source) as run_stage:
+        ingest_pending_files(source)
+
+        calculator = None if refit else StreamingApproximateEntropy.load(state_file)
+        if calculator is not None and calculator.last_date is not None:
+            # Nothing to do when no quote date was ingested after the last processed one
+            watermark = get_ingestion_watermark(source)
+            if watermark is not None and pd.Timestamp(watermark['quote_date']) <= calculator.last_date:
+                print(f"No quote dates ingested after {calculator.last_date.date()}")
+                run_stage.rows = 0
+                return pd.DataFrame(columns=['Date', 'Entropy', 'Skewness'])
+
+        start_date = START_DATE if calculator is None else (calculator.last_date + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+        with stage('load', f"Loading options data from {source}", source=source) as load_stage:
+            option_data_sample = load_options_data(start_date, source=source)
+            load_stage.rows = 0 if option_data_sample is None else len(option_data_sample)
+
+        if option_data_sample is None or option_data_sample.empty:
+            print(f"No new option data since {start_date}")
+            run_stage.rows = 0
+            return pd.DataFrame(columns=['Date', 'Entropy', 'Skewness'])
+
+        average_skewness = get_average_skewness(option_data_sample)
+        skewness_data = average_skewness['Average Skewness']
+        quote_dates = average_skewness['quote_date']
+
+        if calculator is None:
+            calculator = StreamingApproximateEntropy(TOLERANCE_FACTOR * np.std(skewness_data), WINDOW_SIZE)
+            calculator.r_fitted_through = pd.Timestamp(quote_dates.iloc[-1])
+        else:
+            fitted_through = calculator.r_fitted_through
+            fitted_through = 'an unrecorded date' if fitted_through is None else fitted_through.date()
+            print(f"Using r = {calculator.r:.6g} fitted on the history through {fitted_through}; "
+                  f"refit=True recomputes it as get_entropy does")
+        run_stage.set(r=calculator.r, refit=refit)
+
+        with stage('entropy', estimator='streaming_approximate') as entropy_stage:
+            entropy = calculator.update_many(skewness_data, quote_dates)
+            calculator.save(state_file)
+            entropy_stage.rows = len(entropy)
+        run_stage.rows = len(entropy)
+
+    return entropy
+
+
+def get_entropy_sweep(parameter_grid, max_workers=None, source=OPTIONS_DATA_SOURCE):
+    """
+    Calculate entropy for every parameter set of a grid, loading and reducing the option data only once.
+
+    :param parameter_grid: Grid of window_width, sliding_step, m and tolerance_factor values,
+                           e.g. {'window_width': [30, 50, 100], 'm': [2, 3], 'tolerance_factor': [0.1, 0.15, 0.2]}.
+    :param max_workers: Number of worker processes; defaults to the number of CPUs.
+    :param source: Where to read options_data from, 'postgres' or 'parquet'.
+    :return: Tidy DataFrame keyed by the parameter columns, with Date, Entropy and Skewness.
+    """
+    start_time = time.time()
+    ingest_pending_files(source)
+    average_skewness = load_average_skewness(source=source)
+
+    with stage('entropy_sweep', source=source) as sweep_stage:
+        sweep = sweep_entropy_parameters(average_skewness['Average Skewness'], average_skewness['quote_date'],
+                                         parameter_grid, max_workers=max_workers)
+        sweep_stage.rows = len(sweep)
+        sweep_stage.set(parameter_sets=sweep.groupby(PARAMETER_COLUMNS).ngroups)
+    print(f"Entropy sweep over {sweep_stage.fields['parameter_sets']} parameter sets took "
+          f"{sweep_stage.wall_seconds:.2f} seconds")
+    print(f"Total execution time: {time.time() - start_time:.2f} seconds")
+    return sweep
@@ -0,0 +1,186 @@
+# Entropy estimators for the skewness series, all producing the Date/Entropy/Skewness frame used by the plotter and the prompt
+# https://journals.physiology.org/doi/full/10.1152/ajpheart.2000.278.6.H2039 - Richman & Moorman, Sample Entropy
+# https://journals.aps.org/prl/abstract/10.1103/PhysRevLett.88.174102 - Bandt & Pompe, permutation entropy
+
+import abc
+import math
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from approximate_entropy import (calculate_C_m_batched, calculate_Phi, calculate_lagged_match_counts, WINDOW_SIZE,
+                                 DELTA, EMBEDDING_DIMENSION, TOLERANCE_FACTOR, MAX_BATCH_BYTES)
+
+PERMUTATION_ORDER = 3  # Default ordinal pattern length for permutation entropy
+
+
+class EntropyEstimator(abc.ABC):
+    """
+    Base class for entropy estimators evaluated over a sliding window of the skewness series.
+
+    Subclasses implement calculate_window_entropy; windowing and date/skewness alignment are shared. Windows whose
+    entropy is undefined (inf or NaN) are reported as NaN so consumers only have to handle missing values.
+    """
+    name: str = None
+    uses_tolerance: bool = False
+
+    def __init__(self, window_width: int = WINDOW_SIZE, sliding_step: int = DELTA, m: int = EMBEDDING_DIMENSION,
+                 r: float = None) -> None:
+        if r is not None and not self.uses_tolerance:
+            raise ValueError(f"{self.name} does not use a tolerance r.")
+        self.window_width: int = window_width
+        self.sliding_step: int = sliding_step
+        self.m: int = m
+        self.r: float = r
+
+    def tolerance(self, skewness_data) -> float:
+        """Tolerance used for the whole series: r if provided, otherwise r = 0.15 * std_dev of the data."""
+        if self.r is not None:
+            return self.r
+        return TOLERANCE_FACTOR * np.std(skewness_data)
+
+    @abc.abstractmethod
+    def calculate_window_entropy(self, values: np.ndarray, window_starts: np.ndarray, r: float) -> np.ndarray:
+        """Return the entropy of each window of values starting at window_starts."""
+
+    def calculate(self, skewness_data, quote_dates) -> pd.DataFrame:
+        """
+        Calculate the entropy over a sliding window of the series.
+
+        :param skewness_data: The time series data (e.g., skewness premiums).
+        :param quote_dates: The list of corresponding quote dates.
+        :return: DataFrame with Date, Entropy and Skewness aligned with the end of each window.
+        """
+        values = np.asarray(skewness_data, dtype=float)
+        dates = np.asarray(quote_dates)
+        N = len(values)
+        if N < self.m + 1:
+            raise ValueError(f"Time series is too short to calculate {self.name.lower()}.")
+
+        num_windows = max(0, (N - self.window_width) // self.sliding_step + 1)
+        window_starts = np.arange(num_windows) * self.sliding_step
+        window_ends = window_starts + self.window_width
+
+        if num_windows:
+            r = self.tolerance(skewness_data) if self.uses_tolerance else None
+            entropy_values = self.calculate_window_entropy(values, window_starts, r)
+            entropy_values = np.where(np.isfinite(entropy_values), entropy_values, np.nan)
+        else:
+            entropy_values = np.empty(0)
+
+        entropy_df = pd.DataFrame({
+            'Date': dates[window_ends - 1],
+            'Entropy': entropy_values,
+            'Skewness': values[window_ends - 1]
+        })
+        entropy_df['Date'] = pd.to_datetime(entropy_df['Date'])
+        return entropy_df
+
+
+class ApproximateEntropy(EntropyEstimator):
+    """Approximate Entropy (ApEn): Φ(m)(r) - Φ(m+1)(r), self-matches included. This is the get_entropy default."""
+    name = 'Approximate Entropy'
+    uses_tolerance = True
+
+    def calculate_window_entropy(self, values, window_starts, r):
+        Phi_m = calculate_Phi(calculate_C_m_batched(values, window_starts, self.window_width, self.m, r))
+        Phi_m1 = calculate_Phi(calculate_C_m_batched(values, window_starts, self.window_width, self.m + 1, r))
+        return Phi_m - Phi_m1
+
+
+class SampleEntropy(EntropyEstimator):
+    """
+    Sample Entropy (SampEn): -ln(A / B), where B and A count matching pairs of m- and (m+1)-dimensional vectors,
+    self-matches excluded. Windows without any (m+1) or m match are undefined and reported as NaN.
+    """
+    name = 'Sample Entropy'
+    uses_tolerance = True
+
+    def _count_pairs(self, values, window_starts, dimension, r):
+        """Number of matching vector pairs among the first window_width - m vectors of each window."""
+        templates = self.window_width - self.m
+        forward, _ = calculate_lagged_match_counts(values, dimension, r, templates - 1)
+        offsets = np.arange(templates)
+
+        bytes_per_window = templates * (np.dtype(np.intp).itemsize + np.dtype(np.int32).itemsize * 2)
+        batch_size = max(1, int(MAX_BATCH_BYTES // bytes_per_window))
+
+        pairs = np.empty(len(window_starts), dtype=np.int64)
+        for batch_start in range(0, len(window_starts), batch_size):
+            rows = window_starts[batch_start:batch_start + batch_size, None] + offsets
+            # Matches with later vectors of the window, without the lag-0 self-match
+            later_matches = forward[rows, templates - 1 - offsets] - forward[rows, 0]
+            pairs[batch_start:batch_start + len(rows)] = later_matches.sum(axis=1)
+        return pairs
+
+    def calculate_window_entropy(self, values, window_starts, r):
+        B = self._count_pairs(values, window_starts, self.m, r)
+        A = self._count_pairs(values, window_starts, self.m + 1, r)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.log(B / A)
+
+
+class PermutationEntropy(EntropyEstimator):
+    """
+    Normalized permutation entropy: Shannon entropy of the ordinal patterns of length m in the window, divided by
+    ln(m!) so that values lie between 0 and 1. Ties are ranked by order of occurrence.
+    """
+    name = 'Permutation Entropy'
+    uses_tolerance = False
+
+    def __init__(self, window_width: int = WINDOW_SIZE, sliding_step: int = DELTA, m: int = PERMUTATION_ORDER,
+                 r: float = None) -> None:
+        super().__init__(window_width, sliding_step, m, r)
+
+    def calculate_window_entropy(self, values, window_starts, r):
+        N_m = self.window_width - self.m + 1
+        ranks = np.argsort(sliding_window_view(values, self.m), axis=1, kind='stable')
+        codes = ranks @ (self.m ** np.arange(self.m))
+        _, pattern_ids = np.unique(codes, return_inverse=True)
+
+        # Running count of each pattern, so a window's histogram is the difference of two rows
+        pattern_counts = np.zeros((len(codes) + 1, pattern_ids.max() + 1), dtype=np.int32)
+        pattern_counts[np.arange(1, len(codes) + 1), pattern_ids] = 1
+        np.cumsum(pattern_counts, axis=0, out=pattern_counts)
+
+        probabilities = (pattern_counts[window_starts + N_m] - pattern_counts[window_starts]) / N_m
+        with np.errstate(divide='ignore', invalid='ignore'):
+            plogp = np.where(probabilities > 0, probabilities * np.log(probabilities), 0.0)
+        return -plogp.sum(axis=1) / math.log(math.factorial(self.m))
+
+
+ESTIMATORS = {
+    'approximate': ApproximateEntropy,
+    'sample': SampleEntropy,
+    'permutation': PermutationEntropy,
+}
+
+
+def get_estimator(estimator='approximate', **parameters) -> EntropyEstimator:
+    """
+    Resolve an estimator name or instance.
+
+    :param estimator: One of ESTIMATORS ('approximate', 'sample', 'permutation') or an EntropyEstimator instance.
+    :param parameters: window_width, sliding_step, m and r for a named estimator; None values use its defaults.
+    :return: EntropyEstimator instance.
+    """
+    if isinstance(estimator, EntropyEstimator):
+        return estimator
+    if estimator not in ESTIMATORS:
+        raise ValueError(f"Unknown entropy estimator '{estimator}'. Choose from: {', '.join(ESTIMATORS)}")
+    return ESTIMATORS[estimator](**{name: value for name, value in parameters.items() if value is not None})
+
+
+def recalculate_entropy(dataframe: pd.DataFrame, estimator='approximate') -> pd.DataFrame:
+    """
+    Replace the Entropy column of a Date/Entropy/Skewness frame (e.g. demo_data.csv) using another estimator.
+
+    Entropy is recomputed from the frame's own Skewness column, so the first window_width - 1 rows are dropped.
+
+    :param dataframe: DataFrame with at least Date and Skewness columns.
+    :param estimator: Estimator name or instance.
+    :return: DataFrame with the same columns and Entropy from the chosen estimator.
+    """
+    estimator = get_estimator(estimator)
+    entropy_df = estimator.calculate(dataframe['Skewness'], dataframe['Date'])
+    merged_df = dataframe.drop(columns='Entropy', errors='ignore').merge(entropy_df[['Date', 'Entropy']], on='Date')
+    return merged_df[[column for column in dataframe.columns if column in merged_df.columns]]
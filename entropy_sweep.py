@@ -0,0 +1,121 @@
+# Parallel parameter sweep of the Approximate Entropy (ApEn) calculation
+# The skewness series is placed in shared memory once; worker processes attach to it instead of unpickling a copy per task.
+
+import itertools
+import os
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from approximate_entropy import (calculate_approximate_entropy_with_skewness, WINDOW_SIZE, DELTA,
+                                 EMBEDDING_DIMENSION, TOLERANCE_FACTOR)
+
+PARAMETER_COLUMNS = ['window_width', 'sliding_step', 'm', 'tolerance_factor']
+
+# Shared series attached by each worker process in _attach_shared_series
+_shared_blocks = []
+_shared_skewness = None
+_shared_dates = None
+
+
+def expand_parameter_grid(parameter_grid):
+    """
+    Expand a parameter grid into a list of parameter sets.
+
+    :param parameter_grid: Either a dict mapping parameter names to lists of values (the cartesian product is taken),
+                           or a list of dicts each describing one parameter set. Missing parameters use get_entropy defaults.
+    :return: List of dicts with window_width, sliding_step, m and tolerance_factor.
+    """
+    defaults = {'window_width': WINDOW_SIZE, 'sliding_step': DELTA, 'm': EMBEDDING_DIMENSION,
+                'tolerance_factor': TOLERANCE_FACTOR}
+
+    if isinstance(parameter_grid, dict):
+        names = list(parameter_grid)
+        parameter_sets = [dict(zip(names, values)) for values in itertools.product(*parameter_grid.values())]
+    else:
+        parameter_sets = [dict(parameter_set) for parameter_set in parameter_grid]
+
+    expanded = []
+    for parameter_set in parameter_sets:
+        unknown = set(parameter_set) - set(defaults)
+        if unknown:
+            raise ValueError(f"Unknown entropy parameters: {', '.join(sorted(unknown))}")
+        expanded.append({**defaults, **parameter_set})
+    return expanded
+
+
+def _to_shared_memory(array):
+    """Copy an array into a new shared memory block and return the block."""
+    block = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[:] = array
+    return block
+
+
+def _attach_shared_series(skewness_name, dates_name, length):
+    """Worker initializer: map the shared skewness and date arrays into this process."""
+    global _shared_skewness, _shared_dates
+    skewness_block = shared_memory.SharedMemory(name=skewness_name)
+    dates_block = shared_memory.SharedMemory(name=dates_name)
+    _shared_blocks.extend([skewness_block, dates_block])
+    _shared_skewness = np.ndarray((length,), dtype=np.float64, buffer=skewness_block.buf)
+    _shared_dates = np.ndarray((length,), dtype='datetime64[ns]', buffer=dates_block.buf)
+
+
+def _run_parameter_set(parameter_set):
+    """Worker task: calculate ApEn over the shared series for one parameter set."""
+    return _calculate_entropy(_shared_skewness, _shared_dates, parameter_set)
+
+
+def _calculate_entropy(skewness_data, quote_dates, parameter_set):
+    """Calculate ApEn for one parameter set and tag each row with the parameters used."""
+    r = parameter_set['tolerance_factor'] * np.std(skewness_data)
+    entropy_df = calculate_approximate_entropy_with_skewness(skewness_data, quote_dates,
+                                                             window_width=parameter_set['window_width'],
+                                                             sliding_step=parameter_set['sliding_step'],
+                                                             m=parameter_set['m'], r=r)
+    for name in reversed(PARAMETER_COLUMNS):
+        entropy_df.insert(0, name, parameter_set[name])
+    return entropy_df
+
+
+def sweep_entropy_parameters(skewness_data, quote_dates, parameter_grid, max_workers=None):
+    """
+    Calculate ApEn for every parameter set of a grid on a process pool.
+
+    Parameters:
+    - skewness_data: The time series data (e.g., skewness premiums).
+    - quote_dates: The list of corresponding quote dates.
+    - parameter_grid: Grid of window_width, sliding_step, m and tolerance_factor values (see expand_parameter_grid).
+      r is tolerance_factor * std_dev of the data.
+    - max_workers: Number of worker processes. Defaults to the number of CPUs; 1 runs in-process.
+
+    Returns:
+    - sweep_df: A tidy DataFrame with one row per (parameter set, Date), with the parameter columns
+      followed by Date, Entropy and Skewness.
+    """
+    parameter_sets = expand_parameter_grid(parameter_grid)
+    skewness = np.ascontiguousarray(skewness_data, dtype=np.float64)
+    dates = np.ascontiguousarray(pd.to_datetime(np.asarray(quote_dates)), dtype='datetime64[ns]')
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = min(max_workers, len(parameter_sets))
+
+    if max_workers <= 1:
+        results = [_calculate_entropy(skewness, dates, parameter_set) for parameter_set in parameter_sets]
+    else:
+        skewness_block = _to_shared_memory(skewness)
+        dates_block = _to_shared_memory(dates)
+        try:
+            with ProcessPoolExecutor(max_workers=max_workers, initializer=_attach_shared_series,
+                                     initargs=(skewness_block.name, dates_block.name, len(skewness))) as executor:
+                results = list(executor.map(_run_parameter_set, parameter_sets))
+        finally:
+            skewness_block.close()
+            skewness_block.unlink()
+            dates_block.close()
+            dates_block.unlink()
+
+    if not results:
+        return pd.DataFrame(columns=PARAMETER_COLUMNS + ['Date', 'Entropy', 'Skewness'])
+    return pd.concat(results, ignore_index=True)
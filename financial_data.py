@@ -1,48 +1,180 @@
-import pandas as pd
-import yfinance as yf
+import json
 import os
+import zlib
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from constants import PRICE_DATA_SOURCE
+
+PRICE_CACHE_FOLDER = 'historical_data'
+# Bump when the cached layout changes so old caches are downloaded again
+PRICE_CACHE_VERSION = 1
+PRICE_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume']
+# Cached bars downloaded again on each update, to detect a re-adjusted 'Adj Close' history
+UPDATE_OVERLAP_BARS = 10
+ADJUSTMENT_TOLERANCE = 1e-6  # Relative difference of overlapping adjusted closes that counts as a re-adjustment
+MARKET_TIMEZONE = 'America/New_York'
+MARKET_CLOSE_HOUR = 16
+
+
+def last_trading_session(now: pd.Timestamp = None) -> pd.Timestamp:
+    """
+    Date of the last completed trading session: today after the close on a weekday, otherwise the business day before.
+
+    Exchange holidays are not known, so on a holiday the cache is checked against the network once per call.
+    """
+    now = pd.Timestamp.now(tz=MARKET_TIMEZONE) if now is None else now
+    today = now.tz_localize(None).normalize() if now.tz is not None else now.normalize()
+    if today.weekday() < 5 and now.hour >= MARKET_CLOSE_HOUR:
+        return today
+    return today - pd.offsets.BDay(1)
+
+
+class YahooFinanceSource:
+    """Daily bars from Yahoo Finance."""
+    name = 'yahoo'
+
+    def download(self, ticker: str, start: str, end: str = None) -> pd.DataFrame:
+        import yfinance as yf
+
+        # Ticker.history rather than yf.download: download() collects its results in module-level dicts that every
+        # call resets, so concurrent downloads (ReturnCalculator.load_all) could return each other's or empty frames
+        data = yf.Ticker(ticker).history(start=start, end=end, auto_adjust=False, actions=False)
+        if data.empty:
+            return pd.DataFrame(columns=PRICE_COLUMNS)
+        # history() indexes bars by exchange-local timestamps; the cache uses naive dates
+        data.index = data.index.tz_localize(None).normalize().rename('Date')
+        return data.reindex(columns=PRICE_COLUMNS)
+
+
+class FakeDataSource:
+    """
+    Deterministic offline daily bars: a geometric random walk over business days, seeded by the ticker.
+
+    Any two downloads agree on the bars they share, so incremental refreshes can be tested without a network.
+    """
+    name = 'fake'
+    history_start = '1960-01-01'
+
+    def __init__(self, seed: int = 0, end_date: str = None) -> None:
+        self.seed: int = seed
+        self.end_date: str = end_date
+
+    def download(self, ticker: str, start: str, end: str = None) -> pd.DataFrame:
+        last_date = pd.Timestamp(end or self.end_date or pd.Timestamp.today()).normalize()
+        dates = pd.bdate_range(self.history_start, last_date, name='Date')
+        # Row-major draws from separate streams, so the first bars never depend on how many are generated
+        noise_rng, volume_rng = (np.random.default_rng(seed) for seed in
+                                 np.random.SeedSequence([self.seed, zlib.crc32(ticker.encode())]).spawn(2))
+        noise = noise_rng.standard_normal((len(dates), 3))
+        close = 100 * np.exp(np.cumsum(0.0003 + 0.01 * noise[:, 0]))
+        spread = np.abs(0.005 * noise[:, 1])
+        data = pd.DataFrame({
+            'Open': close * (1 + 0.002 * noise[:, 2]),
+            'High': close * (1 + spread),
+            'Low': close * (1 - spread),
+            'Close': close,
+            'Adj Close': close,
+            'Volume': volume_rng.integers(1_000_000, 5_000_000, len(dates)),
+        }, index=dates)
+        return data[data.index >= pd.Timestamp(start)]
+
+
+PRICE_SOURCES = {'yahoo': YahooFinanceSource, 'fake': FakeDataSource}
+
+
+def get_price_source(source=PRICE_DATA_SOURCE):
+    """Return a price source instance from its name, or the instance itself."""
+    if not isinstance(source, str):
+        return source
+    if source not in PRICE_SOURCES:
+        raise ValueError(f"Unknown price source '{source}'. Choose one of: {', '.join(PRICE_SOURCES)}.")
+    return PRICE_SOURCES[source]()
 
 
 class FinancialData:
-    def __init__(self, ticker: str, start_date: str = '1960-01-01') -> None:
+    def __init__(self, ticker: str, start_date: str = '1960-01-01', source=PRICE_DATA_SOURCE,
+                 cache_folder: str = PRICE_CACHE_FOLDER) -> None:
         self.ticker: str = ticker
         self.start_date: str = start_date
+        self.source = get_price_source(source)
         self.data: pd.DataFrame = None
-        self.file_path: str = f'historical_data/{self.ticker}.csv'
+        self.file_path: str = os.path.join(cache_folder, f'{self.ticker}.parquet')
+        # Caches written before the Parquet format; read once and converted
+        self.csv_file_path: str = os.path.join(cache_folder, f'{self.ticker}.csv')
 
-    def download_data(self) -> pd.DataFrame:
-        """Download historical data for the given ticker."""
-        data = yf.download(self.ticker, start=self.start_date)
+    def download_data(self, start_date: str = None) -> pd.DataFrame:
+        """Download historical data for the given ticker, from start_date (default: self.start_date)."""
+        data = self.source.download(self.ticker, start=start_date or self.start_date)
         # data = data[['Adj Close', 'Volume']]  # Keep only 'Adj Close' column
-        self.data = data.dropna()
-        return self.data
+        return data.dropna()
 
     def save_data(self) -> None:
-        """Save the downloaded data to a CSV file."""
-        if self.data is not None:
-            self.data.to_csv(self.file_path)
+        """Save the data to a Parquet file, with the ticker, start date and source in the schema metadata."""
+        if self.data is None:
+            return
+        folder = os.path.dirname(self.file_path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        table = pa.Table.from_pandas(self.data, preserve_index=True)
+        metadata = {'version': PRICE_CACHE_VERSION, 'ticker': self.ticker, 'start_date': self.start_date,
+                    'source': self.source.name, 'last_date': self.data.index[-1].strftime('%Y-%m-%d')}
+        table = table.replace_schema_metadata({**table.schema.metadata, b'financial_data': json.dumps(metadata).encode()})
+        pq.write_table(table, f'{self.file_path}.tmp')
+        os.replace(f'{self.file_path}.tmp', self.file_path)
 
     def load_data(self) -> pd.DataFrame:
-        """Load data from a CSV file if it exists."""
+        """Load data from the Parquet cache (or a legacy CSV) if it exists and covers self.start_date."""
         if os.path.exists(self.file_path):
-            self.data = pd.read_csv(self.file_path, index_col=0, parse_dates=True)
+            table = pq.read_table(self.file_path)
+            metadata = json.loads((table.schema.metadata or {}).get(b'financial_data', b'{}'))
+            if (metadata.get('version') == PRICE_CACHE_VERSION and metadata.get('ticker') == self.ticker
+                    and metadata.get('source') == self.source.name
+                    and pd.Timestamp(metadata['start_date']) <= pd.Timestamp(self.start_date)):
+                self.data = table.to_pandas()
+        elif os.path.exists(self.csv_file_path):
+            self.data = pd.read_csv(self.csv_file_path, index_col=0, parse_dates=True)
+            self.save_data()
+        return self.data
+
+    def update_data(self) -> pd.DataFrame:
+        """
+        Fetch the bars after the last cached date, with UPDATE_OVERLAP_BARS cached bars before it, and append them.
+
+        A dividend or split re-adjusts the whole 'Adj Close' history; if the overlapping bars no longer match the cache,
+        the full history is downloaded again instead, so returns do not jump at the seam.
+        """
+        last_date = self.data.index[-1]
+        overlap_start = self.data.index[max(len(self.data) - UPDATE_OVERLAP_BARS, 0)]
+        new_data = self.download_data(overlap_start.strftime('%Y-%m-%d'))
+
+        overlap = self.data['Adj Close'].loc[overlap_start:].align(new_data['Adj Close'], join='inner')
+        if not np.allclose(*overlap, rtol=ADJUSTMENT_TOLERANCE, atol=0):
+            print(f"Adjusted closes of {self.ticker} changed since they were cached, downloading the full history")
+            self.data = self.download_data()
+            self.save_data()
+            return self.data
+
+        new_data = new_data[new_data.index > last_date]
+        if not new_data.empty:
+            self.data = pd.concat([self.data, new_data.reindex(columns=self.data.columns)])
+            self.save_data()
         return self.data
 
     def get_data(self) -> pd.DataFrame:
         """Returns the downloaded data."""
         if self.data is None:
             self.load_data()
-        if self.data is None or not self.is_data_up_to_date():
-            self.download_data()
+        if self.data is None or self.data.empty:
+            self.data = self.download_data()
             self.save_data()
+        elif not self.is_data_up_to_date():
+            self.update_data()
         return self.data
 
     def is_data_up_to_date(self) -> bool:
-        """Check if the data is up-to-date."""
+        """Check if the data holds the last completed trading session."""
         if self.data is not None:
-            last_date = self.data.index[-1]
-            today = pd.Timestamp.today()
-            if today.weekday() >= 5:  # if today is Saturday (5) or Sunday (6), check for last Friday
-                today -= pd.Timedelta(days=today.weekday() - 4)
-            return last_date >= today
+            return self.data.index[-1].normalize() >= last_trading_session()
         return False
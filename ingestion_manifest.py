@@ -0,0 +1,137 @@
+# Record of the daily files already ingested, keyed by quote_date
+# Lets the loader skip unchanged re-deliveries and lets analytics ask for the ingestion high-water mark with a single
+# small query instead of scanning and loading files on every call.
+
+import hashlib
+import json
+import os
+import pandas as pd
+import psycopg2
+from constants import DB_NAME, DB_HOST, DB_USER, DB_PORT, DB_PASSWORD, DAILY_DATA_FOLDER, OPTIONS_STORE_FOLDER
+
+MANIFEST_TABLE_DDL = """
+    CREATE TABLE IF NOT EXISTS ingestion_manifest (
+        quote_date date PRIMARY KEY,
+        file_name text NOT NULL,
+        content_hash text NOT NULL,
+        row_count integer NOT NULL,
+        ingested_at timestamptz NOT NULL DEFAULT now()
+    )
+    """
+
+# Manifest of the parquet store, next to the quote_date partitions
+MANIFEST_FILE = 'ingestion_manifest.json'
+
+
+def file_content_hash(csv_file, block_size=1 << 20) -> str:
+    """md5 of a file's bytes, read in blocks."""
+    digest = hashlib.md5()
+    with open(csv_file, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def has_pending_files(folder=DAILY_DATA_FOLDER) -> bool:
+    """Whether the daily data folder holds any CSV waiting to be ingested; stops at the first one found."""
+    if not os.path.exists(folder):
+        return False
+    with os.scandir(folder) as entries:
+        return any(entry.name.endswith('.csv') for entry in entries)
+
+
+def ensure_manifest_table(conn) -> None:
+    """Create the ingestion_manifest table if it does not exist yet."""
+    with conn.cursor() as cursor:
+        cursor.execute(MANIFEST_TABLE_DDL)
+    conn.commit()
+
+
+def load_manifest_hashes(conn) -> dict:
+    """Content hash of the file last ingested for each quote_date."""
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT quote_date, content_hash FROM ingestion_manifest")
+        return {pd.Timestamp(quote_date): content_hash for quote_date, content_hash in cursor.fetchall()}
+
+
+def record_ingestion(cursor, quote_date, file_name, content_hash, row_count) -> None:
+    """Upsert the manifest row of a quote_date; runs in the caller's transaction so it commits with the data."""
+    cursor.execute("""
+        INSERT INTO ingestion_manifest (quote_date, file_name, content_hash, row_count, ingested_at)
+        VALUES (%s, %s, %s, %s, now())
+        ON CONFLICT (quote_date) DO UPDATE
+        SET file_name = EXCLUDED.file_name, content_hash = EXCLUDED.content_hash,
+            row_count = EXCLUDED.row_count, ingested_at = EXCLUDED.ingested_at
+        """, [quote_date, file_name, content_hash, int(row_count)])
+
+
+def load_store_manifest(store_folder=OPTIONS_STORE_FOLDER) -> dict:
+    """Manifest of the parquet store as {quote_date string: entry}."""
+    path = os.path.join(store_folder, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def record_store_ingestion(quote_date, file_name, content_hash, row_count, store_folder=OPTIONS_STORE_FOLDER) -> None:
+    """Add or replace the manifest entry of a quote_date in the parquet store; the file is replaced atomically."""
+    manifest = load_store_manifest(store_folder)
+    manifest[pd.Timestamp(quote_date).strftime('%Y-%m-%d')] = {
+        'file_name': file_name,
+        'content_hash': content_hash,
+        'row_count': int(row_count),
+        'ingested_at': pd.Timestamp.now(tz='UTC').isoformat(),
+    }
+    if not os.path.exists(store_folder):
+        os.makedirs(store_folder)
+    path = os.path.join(store_folder, MANIFEST_FILE)
+    with open(f'{path}.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(f'{path}.tmp', path)
+
+
+def get_ingestion_watermark(source='postgres', store_folder=OPTIONS_STORE_FOLDER):
+    """
+    Ingestion high-water mark of a source, read from its manifest without touching options_data.
+
+    Only files loaded through load_daily_data_to_db or backfill_optionsdx are tracked, so rows written by other means
+    do not move it.
+
+    :param source: 'postgres' or 'parquet'.
+    :return: Dict with the latest ingested quote_date, the time of the latest ingestion and the number of quote dates,
+             or None if nothing was ingested yet (or the manifest cannot be read).
+    """
+    if source == 'parquet':
+        manifest = load_store_manifest(store_folder)
+        if not manifest:
+            return None
+        return {
+            'quote_date': pd.Timestamp(max(manifest)).date(),
+            'ingested_at': pd.Timestamp(max(entry['ingested_at'] for entry in manifest.values())),
+            'quote_dates': len(manifest),
+        }
+
+    connection = None
+    try:
+        connection = psycopg2.connect(
+            host=DB_HOST,
+            database=DB_NAME,
+            user=DB_USER,
+            password=DB_PASSWORD,
+            port=DB_PORT
+        )
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT max(quote_date), max(ingested_at), count(*) FROM ingestion_manifest")
+            quote_date, ingested_at, quote_dates = cursor.fetchone()
+        if quote_date is None:
+            return None
+        return {'quote_date': quote_date, 'ingested_at': pd.Timestamp(ingested_at), 'quote_dates': quote_dates}
+
+    except Exception as e:
+        print(f"Error loading ingestion watermark: {e}")
+        return None
+
+    finally:
+        if connection:
+            connection.close()
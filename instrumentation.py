@@ -0,0 +1,162 @@
+# Structured per-stage instrumentation of the pipeline
+# Code wrapped in `with stage(name):` records its wall time, CPU time, row count and, with TRACE_MEMORY, its peak traced
+# memory as one JSON object. Records are appended to INSTRUMENTATION_LOG (JSON lines) and passed to the sinks registered
+# with add_sink, e.g. a metrics exporter. Stages named in PROFILE_STAGES are also run under cProfile and their profile
+# is dumped to PROFILE_FOLDER, one .prof file per stage run, for pstats or snakeviz.
+#
+# All records of one pipeline run share a run_id. It is kept in the environment, so the ingestion worker processes
+# report under the run that started them.
+
+import cProfile
+import json
+import os
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from constants import INSTRUMENTATION_LOG, TRACE_MEMORY, PROFILE_STAGES, PROFILE_FOLDER
+
+RUN_ID_VARIABLE = 'PIPELINE_RUN_ID'
+
+_sinks = []
+_active_stages = ContextVar('active_stages', default=())
+# cProfile installs a single profile hook per thread, so stages nested in a profiled stage are not profiled again
+_profiler_lock = threading.Lock()
+_profiler_active = False
+
+
+def get_run_id() -> str:
+    """Identifier shared by every record of this process and of the worker processes it starts."""
+    if RUN_ID_VARIABLE not in os.environ:
+        os.environ[RUN_ID_VARIABLE] = f"{datetime.now():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+    return os.environ[RUN_ID_VARIABLE]
+
+
+def new_run() -> str:
+    """Start a new run_id, e.g. for each pass of a long-running process."""
+    os.environ.pop(RUN_ID_VARIABLE, None)
+    return get_run_id()
+
+
+def add_sink(sink) -> None:
+    """Register a callable receiving every stage record (a dict) as it completes."""
+    _sinks.append(sink)
+
+
+def remove_sink(sink) -> None:
+    _sinks.remove(sink)
+
+
+def write_record(record: dict, log_file: str = INSTRUMENTATION_LOG) -> None:
+    """Append a record to the JSON lines log; one write per line, so concurrent processes do not interleave."""
+    folder = os.path.dirname(log_file)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder, exist_ok=True)
+    with open(log_file, 'a') as f:
+        f.write(json.dumps(record, default=str) + '\n')
+
+
+def emit(record: dict) -> None:
+    if INSTRUMENTATION_LOG:
+        write_record(record)
+    for sink in list(_sinks):
+        sink(record)
+
+
+class Stage:
+    """Handle of a running stage: set rows and extra fields (source, quote_date, ...) before it ends."""
+
+    def __init__(self, name: str, fields: dict) -> None:
+        self.name: str = name
+        self.rows = None
+        self.fields: dict = fields
+        self.wall_seconds = None  # Set when the stage ends
+        # Highest traced memory seen by the stages nested in this one
+        self.child_peak: int = 0
+
+    def set(self, **fields) -> None:
+        self.fields.update(fields)
+
+
+def _should_profile(name: str) -> bool:
+    return bool(PROFILE_STAGES) and ('*' in PROFILE_STAGES or name in PROFILE_STAGES)
+
+
+@contextmanager
+def stage(name: str, message: str = None, **fields):
+    """
+    Instrument a pipeline stage.
+
+    :param name: Stage name, e.g. 'clean' or 'csv_insert'.
+    :param message: If set, also print "<message> took <seconds> seconds", the pipeline's human-readable timing line.
+    :param fields: Extra fields of the record, e.g. source='parquet'.
+    :return: Context manager yielding a Stage; set its rows attribute to the number of rows the stage produced.
+    """
+    global _profiler_active
+    run_id = get_run_id()  # Before any worker process is started, so it inherits the run_id
+    parents = _active_stages.get()
+    handle = Stage(name, dict(fields))
+    token = _active_stages.set(parents + (handle,))
+
+    started_tracing = TRACE_MEMORY and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        if parents:
+            parents[-1].child_peak = max(parents[-1].child_peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+        start_memory = tracemalloc.get_traced_memory()[0]
+
+    profiler = None
+    if _should_profile(name):
+        with _profiler_lock:
+            if not _profiler_active:
+                _profiler_active = True
+                profiler = cProfile.Profile()
+    started_at = datetime.now(timezone.utc)
+    start_time, start_cpu = time.perf_counter(), time.process_time()
+    if profiler is not None:
+        profiler.enable()
+
+    status, error = 'ok', None
+    try:
+        yield handle
+    except BaseException as e:
+        status, error = 'error', f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        wall_seconds = handle.wall_seconds = time.perf_counter() - start_time
+        record = {
+            'run_id': run_id, 'stage': name, 'parent': parents[-1].name if parents else None,
+            'started_at': started_at.isoformat(), 'wall_seconds': round(wall_seconds, 6),
+            'cpu_seconds': round(time.process_time() - start_cpu, 6), 'rows': handle.rows, 'pid': os.getpid(),
+            'status': status, **handle.fields,
+        }
+        if error is not None:
+            record['error'] = error
+        if tracing and tracemalloc.is_tracing():
+            peak = max(handle.child_peak, tracemalloc.get_traced_memory()[1])
+            record['peak_mb'] = round((peak - start_memory) / 2 ** 20, 3)
+            if parents:
+                parents[-1].child_peak = max(parents[-1].child_peak, peak)
+        if started_tracing:
+            tracemalloc.stop()
+        if profiler is not None:
+            if not os.path.exists(PROFILE_FOLDER):
+                os.makedirs(PROFILE_FOLDER, exist_ok=True)
+            record['profile'] = os.path.join(PROFILE_FOLDER,
+                                             f"{record['run_id']}_{name}_{os.getpid()}_{started_at:%H%M%S%f}.prof")
+            profiler.dump_stats(record['profile'])
+            with _profiler_lock:
+                _profiler_active = False
+        _active_stages.reset(token)
+
+        emit(record)
+        if message is not None and status == 'ok':
+            print(f"{message} took {wall_seconds:.2f} seconds")
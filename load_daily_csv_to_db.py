@@ -1,11 +1,38 @@
+import io
 import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import psycopg2
 from psycopg2 import sql
-from constants import DB_NAME, DB_HOST, DB_USER, DB_PORT, DB_PASSWORD, DAILY_DATA_FOLDER, ARCHIVE_FOLDER
+from constants import (DB_NAME, DB_HOST, DB_USER, DB_PORT, DB_PASSWORD, DAILY_DATA_FOLDER, ARCHIVE_FOLDER, OPTIONS_DATA_SOURCE,
+                       INSERT_MODE, INGEST_WORKERS)
+from options_store import write_options_data, OPTIONS_COLUMNS, INTEGER_COLUMNS
+from daily_csv_parser import parse_daily_csv, read_quote_date
+from ingestion_manifest import (file_content_hash, ensure_manifest_table, load_manifest_hashes, record_ingestion,
+                                load_store_manifest, record_store_ingestion)
+from instrumentation import stage
 import shutil
 
-def load_daily_data_to_db():
+# Parsed files waiting for the writer in pipelined mode; bounds the DataFrames held in memory at once
+PARSE_QUEUE_SIZE = 4
+
+
+def parse_daily_file(csv_path):
+    # parse_daily_csv instrumented as a 'csv_parse' stage; module level so the parse pool can pickle it
+    with stage('csv_parse', file=os.path.basename(csv_path)) as parse_stage:
+        parsed = parse_daily_csv(csv_path)
+        parse_stage.rows = parsed[2]
+        parse_stage.set(quote_date=parsed[0])
+    return parsed
+
+
+def load_daily_data_to_db(target=OPTIONS_DATA_SOURCE, insert_mode=INSERT_MODE, workers=INGEST_WORKERS,
+                          daily_folder=DAILY_DATA_FOLDER, archive_folder=ARCHIVE_FOLDER):
+    # target is 'postgres' (options_data table) or 'parquet' (local options_store)
+    # insert_mode is 'copy' (COPY into a staging table, merged in one transaction) or 'execute_values'
+    # workers > 1 parses files in a process pool while a single writer inserts them in quote date order
+    # daily_folder holds the CSVs to load; each file is moved to archive_folder once it is committed
     # Database connection settings
     db_params = {
         'dbname': DB_NAME,
@@ -16,8 +43,8 @@ def load_daily_data_to_db():
     }
 
     # Ensure the archive folder exists
-    if not os.path.exists(ARCHIVE_FOLDER):
-        os.makedirs(ARCHIVE_FOLDER)
+    if not os.path.exists(archive_folder):
+        os.makedirs(archive_folder)
 
     # Connect to the PostgreSQL database
     def connect_db():
@@ -41,85 +68,59 @@ def load_daily_data_to_db():
             print(f"Error deleting data for quote date {quote_date}: {e}")
             conn.rollback()
 
-    # Process and insert new data into the database in bulk
-    def process_and_insert_data_bulk(conn, csv_file):
+    # Stream the cleaned rows through COPY into a staging table, then replace the quote date in one transaction
+    def copy_and_merge_data(conn, df_cleaned, quote_date, file_name, content_hash):
+        cursor = conn.cursor()
+        cursor.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS options_data_staging
+            (LIKE options_data INCLUDING DEFAULTS) ON COMMIT DELETE ROWS
+        """)
+
+        # df_cleaned holds the OPTIONS_COLUMNS in order; integer columns with gaps are written as 12, not 12.0
+        buffer = io.StringIO()
+        df_copy = df_cleaned.astype({column: 'Int64' for column in INTEGER_COLUMNS})
+        df_copy.to_csv(buffer, index=False, header=False, date_format='%Y-%m-%d')
+        buffer.seek(0)
+        columns = ', '.join(OPTIONS_COLUMNS)
+        cursor.copy_expert(f"COPY options_data_staging ({columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+        cursor.execute("DELETE FROM options_data WHERE quote_date = %s", [quote_date])
+        cursor.execute(f"""
+            INSERT INTO options_data ({columns})
+            SELECT {columns} FROM options_data_staging
+            ON CONFLICT DO NOTHING
+        """)
+        record_ingestion(cursor, quote_date, file_name, content_hash, len(df_cleaned))
+        conn.commit()
+        print(f"Replaced data for quote date: {quote_date}")
+
+    # Insert the parsed rows of one file, replacing its quote date
+    def insert_parsed_data(conn, csv_file, parsed, content_hash):
+        quote_date, df_cleaned, valid_rows_count, expected_row_count = parsed
+        file_name = os.path.basename(csv_file)
         try:
-            # Extract the quote date from the file name
-            file_name = os.path.basename(csv_file)
-            date_part = file_name.split('_')[-2:]
-            month = date_part[0]
-            day = date_part[1].replace('.csv', '')
-            quote_date_str = f"2024-{month}-{day}"  # Assuming the year is 2024
-            quote_date = pd.to_datetime(quote_date_str)
-
             print(f"Processing file: {csv_file} with quote date: {quote_date}")
 
-            # Delete existing data for the quote date before inserting new data
-            delete_existing_data(conn, quote_date)
-
-            # Read the file lines to get the UNDERLYING_LAST value from the second line
-            with open(csv_file, 'r') as f:
-                lines = f.readlines()
-
-            quote_line = lines[1]
-            # Extract the UNDERLYING_LAST from the 'Last: 5503.4102' part of the line
-            underlying_last_str = quote_line.split(',')[1].replace('Last: ', '').strip()
-            underlying_last = float(underlying_last_str)
-
-            # Load the actual option data starting from row 5 (skipping the first 4 rows)
-            df = pd.read_csv(csv_file, delimiter=',', skiprows=4, low_memory=False)
-
-            # Rename the first column dynamically to 'expire_date'
-            df.rename(columns={df.columns[0]: 'expire_date'}, inplace=True)
-
-            # Rename other columns for easier access, including greeks and open interest
-            df.columns = [
-                'expire_date', 'Calls', 'C_Last Sale', 'C_Net', 'C_Bid', 'C_Ask', 'C_Volume', 'C_IV', 'C_Delta',
-                'C_Gamma', 'C_Open Interest', 'Strike', 'Puts', 'P_Last Sale', 'P_Net', 'P_Bid', 'P_Ask', 'P_Volume',
-                'P_IV', 'P_Delta', 'P_Gamma', 'P_Open Interest'
-            ]
-
-            # Add error handling for invalid date formats in 'expire_date'
-            def parse_expiration_date(expire_date):
-                try:
-                    return pd.to_datetime(expire_date, errors='coerce')
-                except Exception as e:
-                    print(f"Error parsing expiration date: {expire_date} - {e}")
-                    return pd.NaT
-
-            # Apply date parsing with error handling to the 'expire_date' column
-            df['expire_date'] = df['expire_date'].apply(parse_expiration_date)
-
-            # Calculate Days to Expiry (DTE), skip rows with invalid expiration dates
-            df['DTE'] = (df['expire_date'] - quote_date).dt.days
-
-            # Add the Quote Date and Underlying Last (extracted from the second line)
-            df['QUOTE_DATE'] = quote_date
-            df['UNDERLYING_LAST'] = underlying_last
-
-            # Select and reorder columns to match the database schema (including the new greeks and open interest)
-            df_cleaned = df[[
-                'QUOTE_DATE', 'UNDERLYING_LAST', 'expire_date', 'DTE', 'C_Volume', 'C_Bid', 'C_Ask', 'C_IV', 'C_Delta',
-                'C_Gamma', 'C_Open Interest', 'Strike', 'P_Bid', 'P_Ask', 'P_Volume', 'P_IV', 'P_Delta', 'P_Gamma', 'P_Open Interest'
-            ]]
-
-            # Drop rows where expire_date is NaT (invalid expiration dates)
-            df_cleaned = df_cleaned.dropna(subset=['expire_date']).copy()
-
-            # Sort by quote_date and then by strike
-            df_cleaned = df_cleaned.sort_values(by=['QUOTE_DATE', 'expire_date', 'Strike'])
-
-            # Ensure there are no missing or invalid rows (rows with required columns missing)
-            valid_rows_count = len(
-                df_cleaned.dropna(subset=['QUOTE_DATE', 'expire_date', 'C_Bid', 'C_Ask', 'P_Bid', 'P_Ask']))
-
-            # Ensure the number of valid rows matches the number of data rows in the file
-            expected_row_count = len(df) - len(df[df.isnull().all(axis=1)])  # Removing blank rows from count
-
             if valid_rows_count != expected_row_count:
                 print(f"Row count mismatch in {csv_file}. Expected {expected_row_count}, found {valid_rows_count}. Skipping insert.")
                 return False
 
+            if target == 'parquet':
+                # The parquet store replaces the whole quote_date partition on write
+                write_options_data(df_cleaned)
+                record_store_ingestion(quote_date, file_name, content_hash, valid_rows_count)
+                print(f"Data from {csv_file} written to the options store. {valid_rows_count} rows added.")
+                return True
+
+            if insert_mode == 'copy':
+                # COPY mode deletes in the same transaction as the insert
+                copy_and_merge_data(conn, df_cleaned, quote_date, file_name, content_hash)
+                print(f"Data from {csv_file} copied successfully. {valid_rows_count} rows added.")
+                return True
+
+            # Delete existing data for the quote date before inserting new data
+            delete_existing_data(conn, quote_date)
+
             # Insert data into the database, including new greeks and open interest columns
             cursor = conn.cursor()
 
@@ -147,15 +148,13 @@ def load_daily_data_to_db():
                 ON CONFLICT DO NOTHING
             """)
 
-            rows = [
-                (row['QUOTE_DATE'], row['UNDERLYING_LAST'], row['expire_date'], row['DTE'], row['C_Volume'],
-                 row['C_Bid'], row['C_Ask'], row['C_IV'], row['C_Delta'], row['C_Gamma'], row['C_Open Interest'],
-                 row['Strike'], row['P_Bid'], row['P_Ask'], row['P_Volume'], row['P_IV'], row['P_Delta'], row['P_Gamma'], row['P_Open Interest'])
-                for _, row in df_cleaned.iterrows()
-            ]
+            # Python scalars in OPTIONS_COLUMNS order, with missing values as NULL
+            values = df_cleaned.astype(object)
+            rows = list(values.where(df_cleaned.notna(), None).itertuples(index=False, name=None))
 
             from psycopg2.extras import execute_values
             execute_values(cursor, insert_query, rows)
+            record_ingestion(cursor, quote_date, file_name, content_hash, valid_rows_count)
 
             conn.commit()
             print(f"Data from {csv_file} inserted successfully. {valid_rows_count} rows added.")
@@ -164,31 +163,96 @@ def load_daily_data_to_db():
 
         except Exception as e:
             print(f"Error processing {csv_file}: {e}")
+            if conn:
+                conn.rollback()
             return False
 
-    # Main function to handle new file processing
-    def process_new_files():
-        conn = connect_db()
-        if not conn:
+    # Wait for a parse submitted to the pool, returning (csv_file, parsed or exception)
+    def take(item):
+        csv_path, future = item
+        try:
+            return csv_path, future.result()
+        except Exception as e:
+            return csv_path, e
+
+    # Parse files in the order given, yielding (csv_file, parsed or exception). With several workers, a process pool
+    # parses ahead of the writer, keeping at most PARSE_QUEUE_SIZE files parsed or in flight.
+    def parse_files(files_to_process):
+        if workers <= 1 or len(files_to_process) <= 1:
+            for csv_path in files_to_process:
+                try:
+                    yield csv_path, parse_daily_file(csv_path)
+                except Exception as e:
+                    yield csv_path, e
             return
 
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = deque()
+            for csv_path in files_to_process:
+                pending.append((csv_path, executor.submit(parse_daily_file, csv_path)))
+                if len(pending) >= max(PARSE_QUEUE_SIZE, workers):
+                    yield take(pending.popleft())
+            while pending:
+                yield take(pending.popleft())
+
+    # Main function to handle new file processing
+    def process_new_files():
         # Check if the daily data folder exists and has files
-        files_to_process = [f for f in os.listdir(DAILY_DATA_FOLDER) if f.endswith(".csv")]
+        files_to_process = [f for f in os.listdir(daily_folder) if f.endswith(".csv")]
 
         if not files_to_process:
             print("No new files to process.")
             return
 
-        # Process each new CSV file in the folder
+        conn = None
+        if target == 'postgres':
+            conn = connect_db()
+            if not conn:
+                return
+            ensure_manifest_table(conn)
+            ingested_hashes = load_manifest_hashes(conn)
+        else:
+            ingested_hashes = {pd.Timestamp(quote_date): entry['content_hash']
+                               for quote_date, entry in load_store_manifest().items()}
+
+        # Write in quote date order whatever the number of workers, so runs are repeatable
+        quote_dates = {}
+        for csv_file in files_to_process:
+            try:
+                quote_dates[csv_file] = read_quote_date(os.path.join(daily_folder, csv_file))
+            except Exception as e:
+                print(f"Error processing {csv_file}: {e}")
+        files_to_process = sorted(quote_dates, key=lambda csv_file: (quote_dates[csv_file], csv_file))
+
+        # Skip re-deliveries identical to the file already ingested for their quote date
+        content_hashes = {}
         for csv_file in files_to_process:
-            csv_path = os.path.join(DAILY_DATA_FOLDER, csv_file)
-            success = process_and_insert_data_bulk(conn, csv_path)
+            csv_path = os.path.join(daily_folder, csv_file)
+            content_hash = file_content_hash(csv_path)
+            if ingested_hashes.get(quote_dates[csv_file]) == content_hash:
+                shutil.move(csv_path, os.path.join(archive_folder, csv_file))
+                print(f"File {csv_file} is unchanged since its last ingestion, moved to archive folder.")
+                continue
+            content_hashes[csv_path] = content_hash
+
+        # A single writer inserts each file as soon as it is parsed
+        for csv_path, parsed in parse_files(list(content_hashes)):
+            if isinstance(parsed, Exception):
+                print(f"Error processing {csv_path}: {parsed}")
+                continue
+            with stage('csv_insert', target=target, file=os.path.basename(csv_path),
+                       quote_date=parsed[0]) as insert_stage:
+                success = insert_parsed_data(conn, csv_path, parsed, content_hashes[csv_path])
+                insert_stage.rows = parsed[2] if success else 0
+                insert_stage.set(inserted=success)
 
             # If the processing was successful, move the file to the archive folder
             if success:
-                shutil.move(csv_path, os.path.join(ARCHIVE_FOLDER, os.path.basename(csv_file)))
+                csv_file = os.path.basename(csv_path)
+                shutil.move(csv_path, os.path.join(archive_folder, csv_file))
                 print(f"File {csv_file} moved to archive folder.")
-        conn.close()
+        if conn:
+            conn.close()
 
     process_new_files()
 
@@ -1,11 +1,37 @@
 import psycopg2
 import pandas as pd
+import pyarrow as pa
 from datetime import datetime
 from constants import DB_NAME, DB_HOST, DB_USER, DB_PORT, DB_PASSWORD
+from psycopg2.extras import execute_values
+from skewness import MIN_DTE, MAX_DTE
+from ingestion_manifest import MANIFEST_TABLE_DDL
 
-def load_options_data_from_db(start_date, end_date=None):
+DEFAULT_COLUMNS = ['quote_date', 'expire_date', 'dte', 'strike', 'c_bid', 'c_ask', 'p_bid', 'p_ask', 'c_volume', 'p_volume']
+
+# Compact types for streamed chunks: the SQL cast and the pandas dtype of each column
+COMPACT_TYPES = {
+    'quote_date': ('date', pd.ArrowDtype(pa.date32())),
+    'expire_date': ('date', pd.ArrowDtype(pa.date32())),
+    'dte': ('int2', 'int16'),
+    'strike': ('float4', 'float32'),
+    'c_bid': ('float4', 'float32'),
+    'c_ask': ('float4', 'float32'),
+    'p_bid': ('float4', 'float32'),
+    'p_ask': ('float4', 'float32'),
+    'c_volume': ('float4', 'float32'),
+    'p_volume': ('float4', 'float32'),
+}
+
+STREAM_CHUNK_SIZE = 200_000  # Rows fetched from the server-side cursor per chunk
+
+
+def load_options_data_from_db(start_date, end_date=None, quote_dates=None, columns=None):
     global connection
 
+    if columns is None:
+        columns = DEFAULT_COLUMNS
+
     if end_date is None:
         end_date = datetime.now().strftime('%Y-%m-%d')
 
@@ -21,13 +47,19 @@ def load_options_data_from_db(start_date, end_date=None):
 
         # Create a query to fetch data between start and end dates
         query = (f"""
-            SELECT quote_date, expire_date, dte, strike, c_bid, c_ask, p_bid, p_ask, c_volume, p_volume
+            SELECT {', '.join(columns)}
             FROM options_data
             WHERE quote_date >= '{start_date}' AND quote_date <= '{end_date}'
             """)
 
+        # Optionally restrict to specific quote dates (e.g. the ones that need recomputing)
+        params = None
+        if quote_dates is not None:
+            query += " AND quote_date = ANY(%s::date[])"
+            params = ([str(quote_date) for quote_date in quote_dates],)
+
         # Load data into a pandas DataFrame
-        df = pd.read_sql(query, connection)
+        df = pd.read_sql(query, connection, params=params)
 
         return df
 
@@ -36,4 +68,229 @@ def load_options_data_from_db(start_date, end_date=None):
 
     finally:
         if connection:
-            connection.close()
\ No newline at end of file
+            connection.close()
+
+
+# Fingerprints of the options_data rows of each quote_date, with the manifest entry they were hashed against
+FINGERPRINT_TABLE_DDL = """
+    CREATE TABLE IF NOT EXISTS quote_date_fingerprints (
+        quote_date date PRIMARY KEY,
+        row_count integer NOT NULL,
+        fingerprint text NOT NULL,
+        manifest_ingested_at timestamptz
+    )
+    """
+
+# md5 of the ordered rows used for skewness; row(...)::text keeps NULL fields distinct from empty ones
+FINGERPRINT_QUERY = """
+    SELECT f.quote_date, f.row_count, f.fingerprint, m.ingested_at
+    FROM (
+        SELECT quote_date,
+               COUNT(*) AS row_count,
+               md5(string_agg(row(expire_date, dte, strike, c_bid, c_ask, p_bid, p_ask)::text, ';'
+                              ORDER BY expire_date, strike, dte, c_bid, c_ask, p_bid, p_ask)) AS fingerprint
+        FROM options_data
+        WHERE quote_date >= %s AND quote_date <= %s {date_filter}
+        GROUP BY quote_date
+    ) f
+    LEFT JOIN ingestion_manifest m USING (quote_date)
+    """
+
+
+def load_quote_date_fingerprints(start_date, end_date=None, rehash_all=False):
+    """
+    Fingerprint the option rows of each quote_date on the server, so callers can tell which dates changed
+    without pulling the rows themselves.
+
+    Fingerprints are kept in the quote_date_fingerprints table. Only the quote dates whose ingestion_manifest entry
+    changed since they were hashed are hashed again, so a call costs a manifest lookup rather than a scan of
+    options_data. The first call, and calls with rehash_all, hash every quote date; use rehash_all after writing
+    options_data by means that do not record the ingestion manifest.
+
+    :param start_date: First quote_date to include.
+    :param end_date: Last quote_date to include; defaults to today.
+    :param rehash_all: Hash every quote date of the range again.
+    :return: DataFrame with quote_date, row_count and fingerprint (md5 of the ordered rows used for skewness).
+    """
+    if end_date is None:
+        end_date = datetime.now().strftime('%Y-%m-%d')
+
+    connection = None
+    try:
+        connection = psycopg2.connect(
+            host=DB_HOST,
+            database=DB_NAME,
+            user=DB_USER,
+            password=DB_PASSWORD,
+            port=DB_PORT
+        )
+        # The manifest and the rows are read from one snapshot, so a concurrent ingestion is either fully hashed or
+        # left for the next call
+        connection.set_session(isolation_level='REPEATABLE READ')
+
+        with connection.cursor() as cursor:
+            cursor.execute(MANIFEST_TABLE_DDL)
+            cursor.execute(FINGERPRINT_TABLE_DDL)
+            cursor.execute("SELECT count(*) FROM quote_date_fingerprints WHERE quote_date >= %s AND quote_date <= %s",
+                           (start_date, end_date))
+            rehash_all = rehash_all or cursor.fetchone()[0] == 0
+
+            if rehash_all:
+                cursor.execute("DELETE FROM quote_date_fingerprints WHERE quote_date >= %s AND quote_date <= %s",
+                               (start_date, end_date))
+                cursor.execute(FINGERPRINT_QUERY.format(date_filter=''), (start_date, end_date))
+            else:
+                # Dates ingested (again) since they were hashed
+                cursor.execute("""
+                    SELECT m.quote_date
+                    FROM ingestion_manifest m
+                    LEFT JOIN quote_date_fingerprints f USING (quote_date)
+                    WHERE m.quote_date >= %s AND m.quote_date <= %s
+                      AND m.ingested_at IS DISTINCT FROM f.manifest_ingested_at
+                    """, (start_date, end_date))
+                changed = [str(quote_date) for quote_date, in cursor.fetchall()]
+                cursor.execute("DELETE FROM quote_date_fingerprints WHERE quote_date = ANY(%s::date[])", (changed,))
+                cursor.execute(FINGERPRINT_QUERY.format(date_filter="AND quote_date = ANY(%s::date[])"),
+                               (start_date, end_date, changed))
+
+            rehashed = cursor.fetchall()
+            if rehashed:
+                execute_values(cursor, """
+                    INSERT INTO quote_date_fingerprints (quote_date, row_count, fingerprint, manifest_ingested_at)
+                    VALUES %s
+                    """, rehashed)
+            print(f"Hashed the option rows of {len(rehashed)} quote dates")
+
+            cursor.execute("""
+                SELECT quote_date, row_count, fingerprint
+                FROM quote_date_fingerprints
+                WHERE quote_date >= %s AND quote_date <= %s
+                ORDER BY quote_date
+                """, (start_date, end_date))
+            fingerprints = pd.DataFrame(cursor.fetchall(), columns=['quote_date', 'row_count', 'fingerprint'])
+        connection.commit()
+        return fingerprints
+
+    except Exception as e:
+        print(f"Error loading quote date fingerprints: {e}")
+        raise
+
+    finally:
+        if connection:
+            connection.close()
+
+
+def load_deepest_strike_medians_from_db(start_date, end_date=None, quote_dates=None, min_dte=MIN_DTE, max_dte=MAX_DTE):
+    """
+    Compute, on the server, the per-quote_date median call and put mid prices at the deepest strikes.
+
+    Applies the same cleaning as skewness.clean_options_data and skewness.filter_options_data (complete quotes,
+    nonzero mid prices, min_dte < dte < max_dte), then takes the median C_Avg at the highest strike and the median
+    P_Avg at the lowest strike, so only one row per quote_date crosses the wire. Medians use percentile_cont, which
+    can differ from pandas in the last bit when two middle values are averaged.
+
+    :param start_date: First quote_date to include.
+    :param end_date: Last quote_date to include; defaults to today.
+    :param quote_dates: Optional list of quote dates to restrict the query to.
+    :return: DataFrame with quote_date, call_median and put_median.
+    """
+    if end_date is None:
+        end_date = datetime.now().strftime('%Y-%m-%d')
+
+    connection = None
+    try:
+        connection = psycopg2.connect(
+            host=DB_HOST,
+            database=DB_NAME,
+            user=DB_USER,
+            password=DB_PASSWORD,
+            port=DB_PORT
+        )
+
+        params = {'start_date': start_date, 'end_date': end_date, 'min_dte': min_dte, 'max_dte': max_dte,
+                  'quote_dates': None if quote_dates is None else [str(quote_date) for quote_date in quote_dates]}
+        query = """
+            WITH quotes AS (
+                SELECT quote_date,
+                       strike,
+                       (c_bid::float8 + c_ask::float8) / 2 AS c_avg,
+                       (p_bid::float8 + p_ask::float8) / 2 AS p_avg
+                FROM options_data
+                WHERE quote_date >= %(start_date)s AND quote_date <= %(end_date)s
+                  AND (%(quote_dates)s::date[] IS NULL OR quote_date = ANY(%(quote_dates)s::date[]))
+                  AND expire_date IS NOT NULL
+                  AND c_bid IS NOT NULL AND c_ask IS NOT NULL AND p_bid IS NOT NULL AND p_ask IS NOT NULL
+                  AND dte > %(min_dte)s AND dte < %(max_dte)s
+            ),
+            deepest AS (
+                SELECT quote_date, strike, c_avg, p_avg,
+                       MAX(strike) OVER (PARTITION BY quote_date) AS call_strike,
+                       MIN(strike) OVER (PARTITION BY quote_date) AS put_strike
+                FROM quotes
+                WHERE c_avg <> 0 AND p_avg <> 0
+            )
+            SELECT quote_date,
+                   percentile_cont(0.5) WITHIN GROUP (ORDER BY c_avg) FILTER (WHERE strike = call_strike) AS call_median,
+                   percentile_cont(0.5) WITHIN GROUP (ORDER BY p_avg) FILTER (WHERE strike = put_strike) AS put_median
+            FROM deepest
+            GROUP BY quote_date
+            ORDER BY quote_date
+            """
+        return pd.read_sql(query, connection, params=params)
+
+    except Exception as e:
+        print(f"Error loading deepest strike medians: {e}")
+
+    finally:
+        if connection:
+            connection.close()
+
+
+def stream_options_data_from_db(start_date, end_date=None, quote_dates=None, chunk_size=STREAM_CHUNK_SIZE, columns=None):
+    """
+    Stream option rows in chunks through a named (server-side) cursor, ordered by quote_date.
+
+    Only one chunk is held in memory at a time, and each chunk uses the compact dtypes of COMPACT_TYPES
+    (float32 prices, int16 dte, date32 dates) instead of the object/float64 columns of pd.read_sql.
+
+    :param start_date: First quote_date to include.
+    :param end_date: Last quote_date to include; defaults to today.
+    :param quote_dates: Optional list of quote dates to restrict the load to.
+    :param chunk_size: Number of rows per chunk.
+    :param columns: Columns to select, from COMPACT_TYPES; defaults to DEFAULT_COLUMNS.
+    :return: Generator of DataFrames.
+    """
+    if end_date is None:
+        end_date = datetime.now().strftime('%Y-%m-%d')
+    if columns is None:
+        columns = DEFAULT_COLUMNS
+
+    connection = psycopg2.connect(
+        host=DB_HOST,
+        database=DB_NAME,
+        user=DB_USER,
+        password=DB_PASSWORD,
+        port=DB_PORT
+    )
+    try:
+        select_list = ', '.join(f'{column}::{COMPACT_TYPES[column][0]} AS {column}' for column in columns)
+        query = f"""
+            SELECT {select_list}
+            FROM options_data
+            WHERE quote_date >= %(start_date)s AND quote_date <= %(end_date)s
+              AND (%(quote_dates)s::date[] IS NULL OR quote_date = ANY(%(quote_dates)s::date[]))
+            ORDER BY quote_date
+            """
+        params = {'start_date': start_date, 'end_date': end_date,
+                  'quote_dates': None if quote_dates is None else [str(quote_date) for quote_date in quote_dates]}
+        with connection.cursor(name='options_data_stream') as cursor:
+            cursor.itersize = chunk_size
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                chunk = pd.DataFrame.from_records(rows, columns=columns)
+                yield chunk.astype({column: COMPACT_TYPES[column][1] for column in columns})
+    finally:
+        connection.close()
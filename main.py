@@ -1,11 +1,42 @@
 import pandas as pd
-from constants import GENAI_API_KEY
-from return_calculator import ReturnCalculator
-from plotter import Plotter
+import asyncio
+from constants import GENAI_API_KEY, ENTROPY_ESTIMATOR, CHAT_BACKEND, PROMPT_TOKEN_BUDGET
 from typing import List
-from openai import OpenAI
+
+# Heavy modules (openai, plotly, yfinance, psycopg2) are imported where they are used, so the cli.py subcommands
+# only pay for what they need
+
+DEMO_DATA_FILE = 'demo_data.csv'
+
+
+def load_demo_data(estimator=ENTROPY_ESTIMATOR) -> pd.DataFrame:
+    df = pd.read_csv(DEMO_DATA_FILE, parse_dates=['Date'])
+    # demo_data.csv holds Approximate Entropy; other estimators are recomputed from its Skewness column
+    if estimator != 'approximate':
+        from entropy_estimators import recalculate_entropy
+        df = recalculate_entropy(df, estimator)
+    return df
+
+
+def load_signal(estimator=ENTROPY_ESTIMATOR) -> pd.DataFrame:
+    # Read the signal from the signal service (python signal_service.py) when it is running, otherwise from demo_data.csv
+    from signal_service import SignalClient, SignalServiceError
+    try:
+        return SignalClient().get_signal(estimator=estimator)
+    except SignalServiceError as e:
+        print(f"{e}; using {DEMO_DATA_FILE}")
+        return load_demo_data(estimator)
+
+
+def create_client(api_key: str, backend: str = CHAT_BACKEND, use_cache: bool = True):
+    from chat_client import create_chat_client
+    return create_chat_client(api_key, backend, use_cache)
+
 
 def main() -> None:
+    from return_calculator import ReturnCalculator
+    from plotter import Plotter
+
     API_KEY = GENAI_API_KEY
 
     # Check if the key is successfully loaded
@@ -18,86 +49,69 @@ def main() -> None:
     return_calculator = ReturnCalculator(tickers, start_date)
     plotter = Plotter(return_calculator)
 
-    df = pd.read_csv('demo_data.csv', parse_dates=['Date'])
-    plotter.plot_skewness_entropy_and_returns(tickers[0], df, demo=True)
+    df = load_signal()
+    plotter.plot_skewness_entropy_and_returns(tickers[0], df, demo=True, estimator=ENTROPY_ESTIMATOR)
 
-    # Filter data for COVID time (Sept 2019 - June 2020) and 2024 (Jan - July 31)
-    covid_data = df[(df['Date'] >= '2019-09-01') & (df['Date'] <= '2020-06-30')]
-    current_data = df[(df['Date'] >= '2024-01-01') & (df['Date'] <= '2024-07-31')]
+    messages = build_initial_messages(df)
+    client = create_client(API_KEY)
+    print("Interactive financial insights chatbot. Start with the date of interest and request a market forecast. Type 'exit' or press Ctrl+C to quit.")
 
-    # Convert DataFrames to strings for ChatGPT prompts
-    covid_data_text = covid_data.to_string(index=False)
-    current_data_text = current_data.to_string(index=False)
+    start_chatGPT(client, messages)
 
-    # Initial prompt with both datasets and training context
-    initial_prompt = f"""
-        You are a financial market analyst. Based on the provided data, issue a **Market Expectation** statement focused on the next 2-4 weeks.
 
-        Below are daily data from two distinct periods: the COVID period (Sept 2019 to June 2020) and Jan 2024 to July 2024.
+SYSTEM_MESSAGE = "You are a financial market analyst."
 
-        COVID Data (Sept 2019 - June 2020):
-        {covid_data_text}
 
-        Current Data (Jan 2024 - July 30, 2024):
-        {current_data_text}
+def build_initial_messages(df: pd.DataFrame, token_budget: int = PROMPT_TOKEN_BUDGET, **prompt_options) -> list:
+    from prompt_builder import build_market_prompt, estimate_tokens
 
-        Key Insight:
-        - A **drop** in Entropy values (even a brief one) within the past 4-6 weeks consistently precedes a downturn in SPX prices within the next 4-6 weeks, regardless of whether entropy subsequently recovers.
-        - Consecutive days of Entropy decline serve as a particularly strong marker for an imminent market downturn, signaling increased risk of SPX decline.
-        - Conversely, if Entropy values maintain or rise, this does not signal stability or upside but rather that a decline in SPX is unlikely.
-        - Issue a cautious outlook if there has been *any* decline in Entropy values within the past 6 weeks, as this suggests a potential pullback in SPX prices within the coming 4-6 weeks. Recommend risk mitigation in this case.
-        - Do not mention "entropy"; use "market structure" instead.
-        - If no drop in market structure was observed, state that the current structure does not suggest an imminent decrease in SPX.
-        - Format the response as a single, clear **Market Expectation** statement.
-        """
+    # The COVID period (Sept 2019 - June 2020) and 2024 (Jan - July 31), compactly encoded so that all the messages fit
+    # token_budget; prompt_options (training_period, current_period) are passed to build_market_prompt
+    initial_prompt = build_market_prompt(df, token_budget - estimate_tokens(SYSTEM_MESSAGE), **prompt_options)
 
     # Set up initial messages for ChatGPT
     messages = [
-        {"role": "system", "content": "You are a financial market analyst."},
+        {"role": "system", "content": SYSTEM_MESSAGE},
         {"role": "user", "content": initial_prompt}
     ]
-    client = OpenAI(api_key=API_KEY)
-    print("Interactive financial insights chatbot. Start with the date of interest and request a market forecast. Type 'exit' or press Ctrl+C to quit.")
-
-    start_chatGPT(client, messages)
+    return messages
 
 
 def start_chatGPT(client, messages):
     try:
-        while True:
-            # Get user input for each question
-            user_input = input("Enter your question: ")
+        asyncio.run(chat_session(client, messages))
+    except KeyboardInterrupt:
+        print("\nExited the chatbot using Ctrl+C.")
 
-            if user_input.lower() == "exit":
-                print("Exiting the chatbot.")
-                break
 
-            # Append user question to messages
-            messages.append({"role": "user", "content": user_input})
+async def chat_session(client, messages):
+    from chat_client import print_token
 
-            # Debugging: Print that we are about to call the API
-            print("Calling OpenAI API...")
+    while True:
+        # Get user input for each question without blocking the event loop
+        user_input = await asyncio.to_thread(input, "Enter your question: ")
 
-            try:
-                response = client.chat.completions.create(
-                    model="gpt-4o-mini",
-                    messages=messages,
-                    temperature=0.1,
-                    max_tokens=75,
-                )
+        if user_input.lower() == "exit":
+            print("Exiting the chatbot.")
+            break
 
-                # Print the generated message from GPT-4
-                assistant_response = response.choices[0].message.content
-                print("Assistant:", assistant_response)
+        # Append user question to messages
+        messages.append({"role": "user", "content": user_input})
 
-                # Append assistant's response to messages for context in future questions
-                messages.append({"role": "assistant", "content": assistant_response})
+        try:
+            # Print the response as it streams in
+            print("Assistant: ", end='', flush=True)
+            assistant_response = await client.complete(messages, on_token=print_token)
+            print()
 
-            except Exception as e:
-                print(f"An error occurred while calling the OpenAI API: {e}")
+            # Append assistant's response to messages for context in future questions
+            messages.append({"role": "assistant", "content": assistant_response})
+
+        except Exception as e:
+            print(f"\nAn error occurred while calling the chat API: {e}")
+            # Drop the unanswered question so the next one is not sent after it
+            messages.pop()
 
-    except KeyboardInterrupt:
-        print("\nExited the chatbot using Ctrl+C.")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,164 @@
+# Local columnar store for options_data: one Parquet file per quote_date, read through memory mapping with column projection
+# Lets get_entropy, sweeps and backtests run without a PostgreSQL server.
+
+import hashlib
+import os
+import shutil
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from datetime import datetime
+from constants import OPTIONS_STORE_FOLDER
+
+# Same columns and names as the options_data table
+OPTIONS_COLUMNS = [
+    'quote_date', 'underlying_last', 'expire_date', 'dte', 'c_volume', 'c_bid', 'c_ask', 'c_iv', 'c_delta', 'c_gamma',
+    'c_open_interest', 'strike', 'p_bid', 'p_ask', 'p_volume', 'p_iv', 'p_delta', 'p_gamma', 'p_open_interest'
+]
+
+# Integer columns of the options_data table; pandas holds them as floats once they contain NaN
+INTEGER_COLUMNS = ['dte', 'c_volume', 'c_open_interest', 'p_volume', 'p_open_interest']
+
+# Columns returned by default, matching load_options_data.load_options_data_from_db
+DEFAULT_COLUMNS = ['quote_date', 'expire_date', 'dte', 'strike', 'c_bid', 'c_ask', 'p_bid', 'p_ask', 'c_volume', 'p_volume']
+
+PARTITION_FILE = 'part-0.parquet'
+
+
+def _partition_folder(quote_date, store_folder=OPTIONS_STORE_FOLDER) -> str:
+    """Folder holding the rows of one quote_date (hive-style quote_date=YYYY-MM-DD)."""
+    return os.path.join(store_folder, f'quote_date={pd.Timestamp(quote_date).strftime("%Y-%m-%d")}')
+
+
+def list_quote_dates(start_date=None, end_date=None, store_folder=OPTIONS_STORE_FOLDER):
+    """
+    List the quote dates present in the store, optionally between start_date and end_date (inclusive).
+
+    :return: Sorted list of datetime.date.
+    """
+    if not os.path.exists(store_folder):
+        return []
+
+    start = pd.Timestamp(start_date) if start_date is not None else pd.Timestamp.min
+    end = pd.Timestamp(end_date) if end_date is not None else pd.Timestamp.max
+    quote_dates = []
+    for folder in os.listdir(store_folder):
+        if not folder.startswith('quote_date=') or not os.path.exists(os.path.join(store_folder, folder, PARTITION_FILE)):
+            continue
+        quote_date = pd.Timestamp(folder.split('=', 1)[1])
+        if start <= quote_date <= end:
+            quote_dates.append(quote_date.date())
+    return sorted(quote_dates)
+
+
+def write_options_data(df: pd.DataFrame, store_folder=OPTIONS_STORE_FOLDER) -> int:
+    """
+    Write option rows to the store, replacing every quote_date partition present in df.
+
+    :param df: DataFrame with the options_data columns (missing optional columns are stored as nulls).
+    :return: Number of rows written.
+    """
+    df = df.reindex(columns=OPTIONS_COLUMNS)
+    df['quote_date'] = pd.to_datetime(df['quote_date']).dt.date
+    df['expire_date'] = pd.to_datetime(df['expire_date']).dt.date
+    numeric_columns = [column for column in OPTIONS_COLUMNS if column not in ('quote_date', 'expire_date')]
+    df[numeric_columns] = df[numeric_columns].apply(pd.to_numeric, errors='coerce')
+
+    for quote_date, partition in df.groupby('quote_date'):
+        folder = _partition_folder(quote_date, store_folder)
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        table = pa.Table.from_pandas(partition.drop(columns='quote_date'), preserve_index=False)
+        # Write next to the final file and swap it in, so readers never see a partial partition
+        path = os.path.join(folder, PARTITION_FILE)
+        pq.write_table(table, f'{path}.tmp')
+        os.replace(f'{path}.tmp', path)
+    return len(df)
+
+
+def delete_options_data(quote_date, store_folder=OPTIONS_STORE_FOLDER) -> None:
+    """Remove the partition of a quote_date if it exists."""
+    folder = _partition_folder(quote_date, store_folder)
+    if os.path.exists(folder):
+        shutil.rmtree(folder)
+
+
+def load_options_data_from_store(start_date, end_date=None, quote_dates=None, columns=None,
+                                 store_folder=OPTIONS_STORE_FOLDER) -> pd.DataFrame:
+    """
+    Load option rows from the store, the local counterpart of load_options_data_from_db.
+
+    Partitions outside the date range are never opened; inside each partition only the requested columns are read,
+    from memory-mapped files.
+
+    :param start_date: First quote_date to include.
+    :param end_date: Last quote_date to include; defaults to today.
+    :param quote_dates: Optional list of quote dates to restrict the load to.
+    :param columns: Columns to read; defaults to the columns returned by load_options_data_from_db.
+    :return: DataFrame with one row per option quote.
+    """
+    if end_date is None:
+        end_date = datetime.now().strftime('%Y-%m-%d')
+    if columns is None:
+        columns = DEFAULT_COLUMNS
+
+    selected_dates = list_quote_dates(start_date, end_date, store_folder)
+    if quote_dates is not None:
+        wanted = {pd.Timestamp(quote_date).date() for quote_date in quote_dates}
+        selected_dates = [quote_date for quote_date in selected_dates if quote_date in wanted]
+
+    file_columns = [column for column in columns if column != 'quote_date']
+    tables = []
+    for quote_date in selected_dates:
+        path = os.path.join(_partition_folder(quote_date, store_folder), PARTITION_FILE)
+        table = pq.read_table(path, columns=file_columns, memory_map=True)
+        tables.append(table.append_column('quote_date', pa.array([quote_date] * table.num_rows, pa.date32())))
+
+    if not tables:
+        return pd.DataFrame(columns=columns)
+    df = pa.concat_tables(tables).to_pandas(date_as_object=True)
+    return df[columns]
+
+
+def load_quote_date_fingerprints_from_store(start_date, end_date=None, store_folder=OPTIONS_STORE_FOLDER) -> pd.DataFrame:
+    """
+    Fingerprint each quote_date partition from its file size and modification time, without reading it.
+
+    :return: DataFrame with quote_date, row_count and fingerprint, like load_options_data.load_quote_date_fingerprints.
+    """
+    if end_date is None:
+        end_date = datetime.now().strftime('%Y-%m-%d')
+
+    rows = []
+    for quote_date in list_quote_dates(start_date, end_date, store_folder):
+        path = os.path.join(_partition_folder(quote_date, store_folder), PARTITION_FILE)
+        stat = os.stat(path)
+        rows.append({
+            'quote_date': quote_date,
+            'row_count': pq.ParquetFile(path).metadata.num_rows,
+            'fingerprint': hashlib.md5(f'{stat.st_size}:{stat.st_mtime_ns}'.encode()).hexdigest(),
+        })
+    return pd.DataFrame(rows, columns=['quote_date', 'row_count', 'fingerprint'])
+
+
+def export_options_data_from_db(start_date, end_date=None, store_folder=OPTIONS_STORE_FOLDER) -> int:
+    """
+    Copy options_data rows from PostgreSQL into the store, one month at a time to bound memory.
+
+    :return: Number of rows written.
+    """
+    from load_options_data import load_options_data_from_db
+
+    if end_date is None:
+        end_date = datetime.now().strftime('%Y-%m-%d')
+
+    rows_written = 0
+    for month_start in pd.date_range(pd.Timestamp(start_date).replace(day=1), end_date, freq='MS'):
+        month_end = min(month_start + pd.offsets.MonthEnd(0), pd.Timestamp(end_date))
+        df = load_options_data_from_db(max(month_start, pd.Timestamp(start_date)).strftime('%Y-%m-%d'),
+                                       month_end.strftime('%Y-%m-%d'), columns=OPTIONS_COLUMNS)
+        if df is None or df.empty:
+            continue
+        rows_written += write_options_data(df, store_folder)
+        print(f"Exported {len(df)} rows for {month_start.strftime('%Y-%m')} to {store_folder}")
+    return rows_written
@@ -1,31 +1,152 @@
 # https://d-nb.info/1174250364/34#page=24&zoom=100,0,0
 import pandas
 
-import return_calculator as ReturnCalculator
+import json
+import numpy as np
 import pandas as pd
-import matplotlib
 import plotly.graph_objs as go
-from entropy import get_entropy
+from typing import TYPE_CHECKING
+from entropy_estimators import get_estimator
+from constants import ENTROPY_ESTIMATOR
+
+if TYPE_CHECKING:
+    # Only needed for annotations; the demo path never loads prices
+    from return_calculator import ReturnCalculator
+    from signal_service import SignalClient
+
+# Series longer than this are drawn with WebGL (Scattergl) and without markers
+WEBGL_THRESHOLD = 5000
+# Points kept per trace by LTTB downsampling, and re-aggregated from the full series on zoom
+MAX_PLOT_POINTS = 2000
+IMAGE_SIZE = (1600, 900)
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets downsampling: pick threshold points that preserve the visual shape of a series.
+
+    :param x: Increasing x values as floats.
+    :param y: y values.
+    :param threshold: Number of points to keep.
+    :return: Indices of the kept points, first and last included.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    every = (n - 2) / (threshold - 2)
+    indices = np.empty(threshold, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        # Average of the next bucket is the third corner of the triangle
+        next_start, next_end = int((i + 1) * every) + 1, min(int((i + 2) * every) + 1, n)
+        average_x, average_y = x[next_start:next_end].mean(), y[next_start:next_end].mean()
+
+        start, end = int(i * every) + 1, int((i + 1) * every) + 1
+        area = np.abs((x[a] - average_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (average_y - y[a]))
+        a = start + int(np.argmax(area))
+        indices[i + 1] = a
+    return indices
+
+
+# Same LTTB in the browser: on zoom, the visible part of the full series is downsampled again, so detail appears
+# without embedding every point in the drawn traces. {plot_id} is filled in by plotly.
+ZOOM_SCRIPT = """
+var gd = document.getElementById('{plot_id}');
+var series = SERIES_JSON;
+function lttb(xs, ys, threshold) {
+    var n = xs.length;
+    if (threshold >= n || threshold < 3) return [xs, ys];
+    var every = (n - 2) / (threshold - 2), a = 0, outX = [xs[0]], outY = [ys[0]];
+    for (var i = 0; i < threshold - 2; i++) {
+        var nextStart = Math.floor((i + 1) * every) + 1, nextEnd = Math.min(Math.floor((i + 2) * every) + 1, n);
+        var averageX = 0, averageY = 0;
+        for (var j = nextStart; j < nextEnd; j++) { averageX += xs[j]; averageY += ys[j]; }
+        averageX /= nextEnd - nextStart; averageY /= nextEnd - nextStart;
+        var start = Math.floor(i * every) + 1, end = Math.floor((i + 1) * every) + 1, maxArea = -1, next = start;
+        for (var k = start; k < end; k++) {
+            var area = Math.abs((xs[a] - averageX) * (ys[k] - ys[a]) - (xs[a] - xs[k]) * (averageY - ys[a]));
+            if (area > maxArea) { maxArea = area; next = k; }
+        }
+        outX.push(xs[next]); outY.push(ys[next]); a = next;
+    }
+    outX.push(xs[n - 1]); outY.push(ys[n - 1]);
+    return [outX, outY];
+}
+function toMs(value) {
+    var text = String(value).replace(' ', 'T');
+    return Date.parse(text.length <= 10 ? text + 'T00:00:00Z' : text + 'Z');
+}
+gd.on('plotly_relayout', function (event) {
+    var low = -Infinity, high = Infinity;
+    if (event['xaxis.range[0]'] !== undefined) {
+        low = toMs(event['xaxis.range[0]']); high = toMs(event['xaxis.range[1]']);
+    } else if (event['xaxis.range'] !== undefined) {
+        low = toMs(event['xaxis.range'][0]); high = toMs(event['xaxis.range'][1]);
+    } else if (!event['xaxis.autorange']) {
+        return;
+    }
+    var xs = [], ys = [];
+    series.traces.forEach(function (trace) {
+        // Keep one point beyond each edge so lines run to the border of the plot
+        var first = 0, last = trace.x.length - 1;
+        while (first < last && trace.x[first + 1] < low) first++;
+        while (last > first && trace.x[last - 1] > high) last--;
+        var sampled = lttb(trace.x.slice(first, last + 1), trace.y.slice(first, last + 1), series.maxPoints);
+        xs.push(sampled[0]); ys.push(sampled[1]);
+    });
+    Plotly.restyle(gd, {x: xs, y: ys}, series.traces.map(function (trace, index) { return index; }));
+});
+"""
+
+
+def downsample(dates: pd.Series, values: pd.Series, max_points: int):
+    """Drop missing values and LTTB-downsample a series; returns (dates, values)."""
+    series = pd.DataFrame({'Date': pd.to_datetime(dates), 'Value': values}).dropna()
+    x = series['Date'].values.astype('datetime64[ms]').astype(np.float64)
+    indices = lttb_indices(x, series['Value'].to_numpy(dtype=np.float64), max_points)
+    return series['Date'].iloc[indices], series['Value'].iloc[indices]
+
+
+def zoom_script(dataframe: pandas.DataFrame, columns, max_points: int) -> str:
+    """post_script re-aggregating the given columns (in trace order) from the full series on zoom."""
+    traces = []
+    for column in columns:
+        series = dataframe[['Date', column]].dropna()
+        x = pd.to_datetime(series['Date']).values.astype('datetime64[ms]').astype(np.int64)
+        traces.append({'x': x.tolist(), 'y': series[column].astype(float).tolist()})
+    return ZOOM_SCRIPT.replace('SERIES_JSON', json.dumps({'traces': traces, 'maxPoints': max_points}))
 
-# Set the backend to a non-inline backend that supports interactive windows
-matplotlib.use('TkAgg')  # or 'Qt5Agg', depending on your preference
 
 class Plotter:
-    def __init__(self, return_calculator: ReturnCalculator) -> None:
+    def __init__(self, return_calculator: 'ReturnCalculator' = None, signal_client: 'SignalClient' = None) -> None:
+        # With a signal_client, live plots read the merged series from the signal service instead of computing it
         self.return_calculator = return_calculator
+        self.signal_client = signal_client
 
-    def plot_skewness_entropy_and_returns(self, ticker: str, dataframe: pandas.DataFrame, demo: bool = True):
+    def plot_skewness_entropy_and_returns(self, ticker: str, dataframe: pandas.DataFrame, demo: bool = True,
+                                          estimator=ENTROPY_ESTIMATOR, output_file: str = None,
+                                          max_points: int = MAX_PLOT_POINTS):
+        # In demo mode the Entropy column of the given dataframe is expected to come from this estimator
+        # output_file writes a self-contained .html (or a .png/.svg/.pdf image, which needs kaleido) instead of
+        # opening a browser, so charts can be rendered on servers
+        # Series longer than max_points are LTTB-downsampled, and re-aggregated from the full series on zoom
+        entropy_name = get_estimator(estimator).name
         if demo:
             merged_df = dataframe
+        elif self.signal_client is not None:
+            merged_df = self.signal_client.get_signal(estimator=estimator)
         else:
-            # Fetch the data for the ticker
-            data = self.return_calculator.financial_data[ticker].get_data()
-            if data.empty:
+            # Fetch the prices for the ticker from the shared cache
+            daily_returns = self.return_calculator.calculate_daily_returns(ticker)
+            if daily_returns.empty:
                 print(f"No data available for ticker {ticker}")
                 return
 
-            daily_returns = self.return_calculator.calculate_daily_returns(ticker)
-            entropy_df = get_entropy()
+            # Imported here so the demo path does not load the database and ingestion modules
+            from entropy import get_entropy
+            entropy_df = get_entropy(estimator=estimator)
             merged_df = pd.merge(entropy_df, daily_returns, left_on='Date', right_index=True, how='inner')
 
         # Save the entropy data into the database
@@ -33,10 +154,16 @@ class Plotter:
 
         fig = go.Figure()
 
+        large = len(merged_df) > WEBGL_THRESHOLD
+        scatter = go.Scattergl if large else go.Scatter
+        marker_mode = 'lines' if large else 'lines+markers'
+        downsampled = {column: downsample(merged_df['Date'], merged_df[column], max_points)
+                       for column in ('Skewness', 'Entropy', 'Adj Close')}
+
         # Skewness (red)
-        fig.add_trace(go.Scatter(
-            x=merged_df['Date'],
-            y=merged_df['Skewness'],
+        fig.add_trace(scatter(
+            x=downsampled['Skewness'][0],
+            y=downsampled['Skewness'][1],
             mode='lines',
             name='Skewness',
             line=dict(color='red', dash='dash', width=2),  # Dashed and thinner
@@ -45,22 +172,22 @@ class Plotter:
         ))
 
         # Entropy (blue)
-        fig.add_trace(go.Scatter(
-            x=merged_df['Date'],
-            y=merged_df['Entropy'],
-            mode='lines+markers',
-            name='Entropy',
+        fig.add_trace(scatter(
+            x=downsampled['Entropy'][0],
+            y=downsampled['Entropy'][1],
+            mode=marker_mode,
+            name=entropy_name,
             marker=dict(color='blue', size=3),
             line=dict(color='blue'),
             yaxis='y1',
-            hovertemplate='Entropy: %{y:.4f}<extra></extra>'
+            hovertemplate=entropy_name + ': %{y:.4f}<extra></extra>'
         ))
 
         # SPX Price (green) on the primary y-axis
-        fig.add_trace(go.Scatter(
-            x=merged_df['Date'],
-            y=merged_df['Adj Close'],
-            mode='lines+markers',
+        fig.add_trace(scatter(
+            x=downsampled['Adj Close'][0],
+            y=downsampled['Adj Close'][1],
+            mode=marker_mode,
             name='SPX Price',
             marker=dict(color='green', symbol='triangle-up', size=4),
             line=dict(color='green'),
@@ -72,10 +199,10 @@ class Plotter:
 
         # Update layout for multiple y-axes
         fig.update_layout(
-            title=f'Entropy, Skewness, and SPX Index for {ticker} Over Time',
+            title=f'{entropy_name}, Skewness, and SPX Index for {ticker} Over Time',
             xaxis=dict(title='Date', tickformat='%Y-%m-%d'),
             yaxis=dict(
-                title='Entropy',
+                title=entropy_name,
                 titlefont=dict(color='blue'),
                 tickfont=dict(color='blue'),
                 showgrid=False,
@@ -105,5 +232,15 @@ class Plotter:
             template='plotly_white'
         )
 
-        # Show the plot in a browser
-        fig.show()
+        post_script = None
+        if len(merged_df) > max_points:
+            post_script = zoom_script(merged_df, ['Skewness', 'Entropy', 'Adj Close'], max_points)
+
+        if output_file is None:
+            # Show the plot in a browser
+            fig.show(post_script=post_script)
+        elif output_file.endswith('.html'):
+            fig.write_html(output_file, include_plotlyjs=True, post_script=post_script)
+        else:
+            fig.write_image(output_file, width=IMAGE_SIZE[0], height=IMAGE_SIZE[1])
+        return fig
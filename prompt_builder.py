@@ -0,0 +1,229 @@
+# Compact, token-budgeted encoding of the Date/Entropy/Skewness/Adj Close history for the chat prompt
+# The prompt is resent with every question, so the data is rounded and summarized by precomputed entropy-decline
+# features, which are what the instructions ask the model to look for. When the daily rows do not fit the budget, each
+# period keeps them for the weeks leading into its largest SPX drawdown (for the COVID period, the entropy drop before
+# the February 2020 crash the instructions rely on) and for its final weeks, and only the rest is resampled.
+
+import itertools
+import math
+import re
+import pandas as pd
+from constants import PROMPT_TOKEN_BUDGET
+
+# (label, start, end) of the reference period and of the period the expectation is issued for
+TRAINING_PERIOD = ('COVID period', '2019-09-01', '2020-06-30')
+CURRENT_PERIOD = ('Current period', '2024-01-01', '2024-07-31')
+
+LOOKBACK_WEEKS = 6
+# Resampling steps of the rows outside the daily windows: None keeps daily rows
+RESOLUTIONS = [None, 'W-FRI', '2W-FRI', 'ME']
+# Encodings of a period, finest first: (resolution, whether the daily windows are kept), and finally no rows at all
+ENCODING_LEVELS = ([(resolution, True) for resolution in RESOLUTIONS]
+                   + [(resolution, False) for resolution in RESOLUTIONS[1:]] + [None])
+RESOLUTION_NAMES = {None: 'daily', 'W-FRI': 'weekly', '2W-FRI': 'biweekly', 'ME': 'monthly'}
+# Decimals kept per column; entropy moves in the third decimal, SPX is rounded to points
+DECIMALS = {'Entropy': 3, 'Skewness': 2, 'Adj Close': 0}
+
+INSTRUCTIONS = """You are a financial market analyst. Based on the provided data, issue a **Market Expectation** statement focused on the next 2-4 weeks.
+
+Key Insight:
+- A **drop** in Entropy values (even a brief one) within the past 4-6 weeks consistently precedes a downturn in SPX prices within the next 4-6 weeks, regardless of whether entropy subsequently recovers.
+- Consecutive days of Entropy decline serve as a particularly strong marker for an imminent market downturn, signaling increased risk of SPX decline.
+- Conversely, if Entropy values maintain or rise, this does not signal stability or upside but rather that a decline in SPX is unlikely.
+- Issue a cautious outlook if there has been *any* decline in Entropy values within the past 6 weeks, as this suggests a potential pullback in SPX prices within the coming 4-6 weeks. Recommend risk mitigation in this case.
+- Do not mention "entropy"; use "market structure" instead.
+- If no drop in market structure was observed, state that the current structure does not suggest an imminent decrease in SPX.
+- Format the response as a single, clear **Market Expectation** statement."""
+
+_TOKEN_PATTERN = re.compile(r'[A-Za-z]+|\d+|\S')
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Local estimate of the number of tokens of a text for GPT-style BPE tokenizers, without a tokenizer download.
+
+    Words count one token per 4 letters, digit runs one per 3 digits (how numbers are split) and every other
+    symbol one token. Common words are single tokens in practice, so this errs on the high side for prose, which
+    keeps prompts under the budget.
+    """
+    tokens = 0
+    for piece in _TOKEN_PATTERN.findall(text):
+        if piece[0].isalpha():
+            tokens += math.ceil(len(piece) / 4)
+        elif piece[0].isdigit():
+            tokens += math.ceil(len(piece) / 3)
+        else:
+            tokens += 1
+    return tokens
+
+
+def keeps_windows(level: int) -> bool:
+    """Whether ENCODING_LEVELS[level] keeps the daily windows (daily rows keep everything)."""
+    encoding = ENCODING_LEVELS[level]
+    return encoding is not None and (encoding[1] or encoding[0] is None)
+
+
+def select_period(df: pd.DataFrame, start: str, end: str) -> pd.DataFrame:
+    return df[(df['Date'] >= start) & (df['Date'] <= end)]
+
+
+def largest_drawdown(df: pd.DataFrame):
+    """
+    Largest peak-to-trough decline of Adj Close in a period.
+
+    :return: Dict with the 'peak' and 'trough' dates and the 'drawdown_pct', or None if the index never fell.
+    """
+    prices = df.set_index('Date')['Adj Close'].dropna()
+    drawdown = prices / prices.cummax() - 1
+    if prices.empty or drawdown.min() >= 0:
+        return None
+    trough = drawdown.idxmin()
+    return {'peak': prices.loc[:trough].idxmax(), 'trough': trough, 'drawdown_pct': 100 * drawdown.min()}
+
+
+def daily_windows(df: pd.DataFrame, lookback_weeks: int = LOOKBACK_WEEKS) -> list:
+    """(start, end) date ranges of a period kept daily: lookback_weeks before its largest drawdown through the trough,
+    and its last lookback_weeks."""
+    end = df['Date'].max()
+    windows = [(end - pd.Timedelta(weeks=lookback_weeks), end)]
+    drawdown = largest_drawdown(df)
+    if drawdown is not None:
+        windows.insert(0, (drawdown['peak'] - pd.Timedelta(weeks=lookback_weeks), drawdown['trough']))
+    return windows
+
+
+def entropy_decline_features(df: pd.DataFrame, lookback_weeks: int = LOOKBACK_WEEKS, end=None) -> dict:
+    """
+    Summarize the entropy declines of the lookback_weeks ending at end (default: the end of the period), from the
+    daily rows.
+
+    :return: Dict with the window dates, the number of declining days, the runs of consecutive declines
+             (start, end, days, drop), the longest run and the entropy and SPX changes over the window.
+    """
+    end = df['Date'].max() if end is None else pd.Timestamp(end)
+    window = df[(df['Date'] > end - pd.Timedelta(weeks=lookback_weeks)) & (df['Date'] <= end)].reset_index(drop=True)
+    declining = window['Entropy'].diff() < 0
+
+    # Consecutive declining days share a run id
+    run_ids = (declining != declining.shift()).cumsum()[declining]
+    runs = []
+    for _, run in window[declining].groupby(run_ids):
+        previous = window.loc[run.index[0] - 1, 'Entropy']
+        runs.append({'start': run['Date'].iloc[0], 'end': run['Date'].iloc[-1], 'days': len(run),
+                     'drop': previous - run['Entropy'].iloc[-1]})
+
+    return {
+        'start': window['Date'].iloc[0],
+        'end': end,
+        'declining_days': int(declining.sum()),
+        'trading_days': len(window),
+        'runs': runs,
+        'longest_run': max(runs, key=lambda run: run['days']) if runs else None,
+        'entropy_change': window['Entropy'].iloc[-1] - window['Entropy'].iloc[0],
+        'spx_change_pct': 100 * (window['Adj Close'].iloc[-1] / window['Adj Close'].iloc[0] - 1),
+    }
+
+
+def format_features(features: dict, max_runs: int = 8, title: str = f"Last {LOOKBACK_WEEKS} weeks") -> str:
+    """Render entropy_decline_features as a few lines of text."""
+    lines = [f"{title} ({features['start']:%Y-%m-%d} to {features['end']:%Y-%m-%d}): "
+             f"Entropy declined on {features['declining_days']} of {features['trading_days']} days; "
+             f"Entropy change {features['entropy_change']:+.3f}, SPX change {features['spx_change_pct']:+.1f}%."]
+    if features['longest_run'] is not None:
+        longest = features['longest_run']
+        lines.append(f"Longest consecutive decline: {longest['days']} days, {longest['start']:%Y-%m-%d} to "
+                     f"{longest['end']:%Y-%m-%d}, drop {longest['drop']:.3f}.")
+        # Multi-day runs first, largest drops first
+        runs = sorted(features['runs'], key=lambda run: (run['days'], run['drop']), reverse=True)[:max_runs]
+        runs = sorted(runs, key=lambda run: run['start'])
+        lines.append("Decline runs (start, days, drop): " +
+                     "; ".join(f"{run['start']:%Y-%m-%d} {run['days']}d {run['drop']:.3f}" for run in runs) + ".")
+    else:
+        lines.append("No Entropy decline.")
+    return '\n'.join(lines)
+
+
+def period_features(df: pd.DataFrame) -> str:
+    """Entropy-decline features of the weeks before the largest drawdown of a period and of its last weeks."""
+    sections = []
+    drawdown = largest_drawdown(df)
+    if drawdown is not None:
+        title = (f"{LOOKBACK_WEEKS} weeks before the largest SPX drawdown ({drawdown['drawdown_pct']:.1f}% from "
+                 f"{drawdown['peak']:%Y-%m-%d} to {drawdown['trough']:%Y-%m-%d})")
+        sections.append(format_features(entropy_decline_features(df, end=drawdown['peak']), title=title))
+    sections.append(format_features(entropy_decline_features(df)))
+    return '\n'.join(sections)
+
+
+def encode_series(df: pd.DataFrame, resolution=None, windows=()) -> str:
+    """
+    Encode a period as compact CSV rows with rounded values. If resolution is set, the rows outside the (start, end)
+    windows are resampled to the last row of each step; the rows inside them stay daily.
+    """
+    data = df.set_index('Date')[list(DECIMALS)]
+    if resolution is not None:
+        daily = pd.Series(False, index=data.index)
+        for start, end in windows:
+            daily |= (data.index >= start) & (data.index <= end)
+        # The last actual row of each step, so resampled rows never collide with the daily ones
+        resampled = data[~daily].groupby(pd.Grouper(freq=resolution)).tail(1)
+        data = pd.concat([data[daily], resampled]).sort_index().dropna(how='all')
+    lines = ['date,entropy,skew,spx']
+    for date, *row in zip(data.index, *(data[column].tolist() for column in DECIMALS)):
+        values = [f"{value:.{decimals}f}" if pd.notnull(value) else '' for value, decimals in zip(row, DECIMALS.values())]
+        lines.append(f"{date:%Y-%m-%d}," + ','.join(values))
+    return '\n'.join(lines)
+
+
+def build_market_prompt(df: pd.DataFrame, token_budget: int = PROMPT_TOKEN_BUDGET,
+                        training_period=TRAINING_PERIOD, current_period=CURRENT_PERIOD) -> str:
+    """
+    Build the market expectation prompt within a token budget.
+
+    The instructions and the entropy-decline features of both periods are always included. The series are encoded
+    daily if they fit. Otherwise the rows outside the daily_windows are resampled more coarsely, the reference period
+    first; only if that does not fit are the daily windows resampled too, and finally the rows are left out.
+
+    :param df: DataFrame with Date, Entropy, Skewness and Adj Close.
+    :param token_budget: Upper bound on estimate_tokens of the prompt. Only the instructions and features, which are
+                         always included, can exceed it.
+    :return: Prompt text.
+    """
+    df = df.assign(Date=pd.to_datetime(df['Date'])).sort_values('Date')
+    periods = []
+    for label, start, end in (training_period, current_period):
+        data = select_period(df, start, end)
+        if data.empty:
+            continue
+        periods.append((label, data, period_features(data), daily_windows(data)))
+
+    # Daily windows are the last detail given up; otherwise the coarsest encodings come last, and on a tie the one
+    # keeping the current period finer comes first
+    candidates = sorted(itertools.product(range(len(ENCODING_LEVELS)), repeat=len(periods)),
+                        key=lambda levels: (sum(not keeps_windows(level) for level in levels), sum(levels),
+                                            levels[-1] if levels else 0))
+
+    # Each period is encoded once per level, however many candidates use it
+    sections = {}
+    for position, (label, data, features, windows) in enumerate(periods):
+        title = f"{label} ({data['Date'].min():%Y-%m-%d} to {data['Date'].max():%Y-%m-%d})"
+        for level, encoding in enumerate(ENCODING_LEVELS):
+            if encoding is None:
+                section = f"{title}:\n{features}"
+            else:
+                resolution, keep_windows = encoding
+                name = RESOLUTION_NAMES[resolution] + (', daily around the drawdown and at the end'
+                                                       if keep_windows and resolution is not None else '')
+                rows = encode_series(data, resolution, windows if keep_windows else ())
+                section = f"{title}, {name} rows:\n{features}\n{rows}"
+            sections[position, level] = section, estimate_tokens(section)
+
+    instruction_tokens = estimate_tokens(INSTRUCTIONS)
+    prompt = None
+    for levels in candidates:
+        chosen = [sections[position, level] for position, level in enumerate(levels)]
+        prompt = '\n\n'.join([INSTRUCTIONS] + [section for section, _ in chosen])
+        # Sections are joined by blank lines, which the estimator does not count
+        if instruction_tokens + sum(tokens for _, tokens in chosen) <= token_budget:
+            break
+    return prompt
@@ -1,18 +1,71 @@
+import threading
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 from financial_data import FinancialData
+from constants import PRICE_DATA_SOURCE
 from typing import List
 
+MAX_LOAD_WORKERS = 16  # Tickers fetched at the same time; fetching is network bound, so threads suffice (see
+# YahooFinanceSource.download for why each thread uses its own yf.Ticker)
+
+# Prices shared by every ReturnCalculator of the process, keyed by (ticker, start_date, source):
+# 'Adj Close' and the precomputed 'Daily Return'
+PRICE_CACHE = {}
+_price_cache_lock = threading.Lock()
+
+
+def clear_price_cache() -> None:
+    """Forget the prices loaded so far, e.g. to pick up a refresh in a long-running process."""
+    with _price_cache_lock:
+        PRICE_CACHE.clear()
+
+
 class ReturnCalculator:
-    def __init__(self, tickers: List[str], start_date: str = '1960-01-01') -> None:
+    def __init__(self, tickers: List[str], start_date: str = '1960-01-01', source=PRICE_DATA_SOURCE,
+                 max_workers: int = MAX_LOAD_WORKERS) -> None:
         self.tickers = tickers
         self.start_date = start_date
-        self.financial_data = {ticker: FinancialData(ticker, start_date) for ticker in tickers}
+        self.max_workers = max_workers
+        self.financial_data = {ticker: FinancialData(ticker, start_date, source) for ticker in tickers}
         self.earliest_data_year = None
 
-    def calculate_daily_returns(self, ticker: str):
+    def _cache_key(self, ticker: str):
+        return ticker, self.start_date, self.financial_data[ticker].source.name
+
+    def _load_prices(self, ticker: str) -> pd.DataFrame:
+        """Load one ticker and derive its daily returns."""
         data = self.financial_data[ticker].get_data()
         if data is None or data.empty:
+            return pd.DataFrame(columns=['Adj Close', 'Daily Return'])
+        prices = data[['Adj Close']].dropna()
+        prices['Daily Return'] = prices['Adj Close'].pct_change()
+        return prices
+
+    def load_all(self) -> None:
+        """Load every configured ticker missing from the shared cache, concurrently."""
+        with _price_cache_lock:
+            missing = [ticker for ticker in self.tickers if self._cache_key(ticker) not in PRICE_CACHE]
+        if not missing:
+            return
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(missing))) as executor:
+            loaded = dict(zip(missing, executor.map(self._load_prices, missing)))
+
+        with _price_cache_lock:
+            for ticker, prices in loaded.items():
+                PRICE_CACHE[self._cache_key(ticker)] = prices
+
+    def get_prices(self, ticker: str) -> pd.DataFrame:
+        """'Adj Close' and 'Daily Return' of a ticker, loading all configured tickers on first use."""
+        key = self._cache_key(ticker)
+        if key not in PRICE_CACHE:
+            self.load_all()
+        return PRICE_CACHE[key]
+
+    def calculate_daily_returns(self, ticker: str):
+        prices = self.get_prices(ticker)
+        if prices.empty:
             return pd.DataFrame()
 
-        # Return the Adjusted Close (Adj Close) price to plot the index price
-        return data[['Adj Close']].dropna()
\ No newline at end of file
+        # Return the Adjusted Close (Adj Close) price to plot the index price, with the precomputed daily returns
+        return prices.copy()
@@ -0,0 +1,350 @@
+# Local HTTP service holding the merged Date/Entropy/Skewness/Adj Close signal in memory
+# The series is computed once and then refreshed only when the ingestion watermark moves (or, for the demo source, when
+# demo_data.csv changes), so any number of chat sessions, plots and dashboards read the same in-memory copy instead of
+# each one querying PostgreSQL and recomputing the entropy. With the pipeline source, a refresh goes through
+# get_entropy's SignalStore, which only computes the skewness of newly ingested quote dates.
+#
+#   GET /signal?start=YYYY-MM-DD&end=YYYY-MM-DD   rows with start <= Date <= end (both optional), as JSON
+#   GET /health                                   estimator, rows, version and watermark of the series being served
+#
+# Each row is serialized once per refresh and responses are assembled from those fragments. Every response carries an
+# ETag derived from the series content and the requested rows, and a request whose If-None-Match matches it gets an
+# empty 304, so a polling client only downloads the series after it changed.
+#
+# Usage: python signal_service.py [--source demo|pipeline] [--port N] [--refresh-seconds N]
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import pandas as pd
+from constants import (ENTROPY_ESTIMATOR, OPTIONS_DATA_SOURCE, SIGNAL_SERVICE_HOST, SIGNAL_SERVICE_PORT,
+                       SIGNAL_SERVICE_URL, SIGNAL_SERVICE_SOURCE, SIGNAL_REFRESH_SECONDS)
+from instrumentation import new_run
+
+SIGNAL_COLUMNS = ['Date', 'Entropy', 'Skewness', 'Adj Close']
+RESPONSE_CACHE_SIZE = 256  # Serialized range responses kept per series version
+CLIENT_TIMEOUT_SECONDS = 5
+
+
+class SignalServiceError(Exception):
+    """The signal service is unreachable or refused a request."""
+
+
+class SignalSnapshot:
+    """One immutable version of the served series; a refresh replaces the whole snapshot."""
+
+    def __init__(self, dataframe: pd.DataFrame, estimator: str, watermark) -> None:
+        dataframe = dataframe[SIGNAL_COLUMNS].reset_index(drop=True).assign(Date=lambda df: pd.to_datetime(df['Date']))
+        dataframe = dataframe.sort_values('Date')
+        self.estimator: str = estimator
+        self.watermark = watermark
+        self.dates: np.ndarray = dataframe['Date'].to_numpy(dtype='datetime64[ns]')
+        # Each row as a JSON array, missing or non-finite values as null so the body is strict JSON
+        values = dataframe[SIGNAL_COLUMNS[1:]].astype(float).to_numpy()
+        self.rows: list = [
+            json.dumps([date, *(value if math.isfinite(value) else None for value in row)])
+            for date, row in zip(dataframe['Date'].dt.strftime('%Y-%m-%d'), values.tolist())
+        ]
+        self.version: str = hashlib.sha1('\n'.join([estimator] + self.rows).encode()).hexdigest()[:16]
+        self.refreshed_at: pd.Timestamp = pd.Timestamp.now(tz='UTC')
+        self.responses: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+
+    def row_range(self, start=None, end=None):
+        """Positions [first, last) of the rows with start <= Date <= end."""
+        first = 0 if start is None else int(np.searchsorted(self.dates, np.datetime64(start, 'ns'), side='left'))
+        last = len(self.dates) if end is None else int(np.searchsorted(self.dates, np.datetime64(end, 'ns'), side='right'))
+        return first, max(first, last)
+
+    def etag(self, first: int, last: int) -> str:
+        return f'"{self.version}-{first}-{last}"'
+
+    def response(self, first: int, last: int) -> bytes:
+        """JSON body of rows [first, last), cached per range."""
+        with self.lock:
+            body = self.responses.get((first, last))
+            if body is not None:
+                self.responses.move_to_end((first, last))
+                return body
+        body = (f'{{"estimator": {json.dumps(self.estimator)}, "version": "{self.version}", '
+                f'"columns": {json.dumps(SIGNAL_COLUMNS)}, "rows": [{", ".join(self.rows[first:last])}]}}').encode()
+        with self.lock:
+            self.responses[(first, last)] = body
+            if len(self.responses) > RESPONSE_CACHE_SIZE:
+                self.responses.popitem(last=False)
+        return body
+
+    def health(self) -> dict:
+        return {'estimator': self.estimator, 'version': self.version, 'rows': len(self.rows),
+                'first_date': str(self.dates[0])[:10] if len(self.dates) else None,
+                'last_date': str(self.dates[-1])[:10] if len(self.dates) else None,
+                'watermark': self.watermark, 'refreshed_at': self.refreshed_at.isoformat()}
+
+
+class SignalLoader:
+    """
+    Computes the served series and tells whether it is out of date.
+
+    :param source: 'demo' (demo_data.csv) or 'pipeline' (ingest, get_entropy and index prices).
+    :param options_source: Where the pipeline reads options_data from, 'postgres' or 'parquet'.
+    :param ingest: Whether the pipeline loads the daily CSVs waiting in DAILY_DATA_FOLDER before each check.
+    """
+
+    def __init__(self, source: str = SIGNAL_SERVICE_SOURCE, estimator: str = ENTROPY_ESTIMATOR,
+                 options_source: str = OPTIONS_DATA_SOURCE, ingest: bool = True, ticker: str = '^SPX',
+                 start_date: str = '1990-01-01') -> None:
+        if source not in ('demo', 'pipeline'):
+            raise ValueError(f"Unknown signal source '{source}', expected 'demo' or 'pipeline'.")
+        self.source = source
+        self.estimator = estimator
+        self.options_source = options_source
+        self.ingest = ingest
+        self.ticker = ticker
+        self.start_date = start_date
+
+    def watermark(self):
+        """Value that changes whenever the series may have changed, as a JSON-serializable dict (or None)."""
+        if self.source == 'demo':
+            from main import DEMO_DATA_FILE
+            return {'file': DEMO_DATA_FILE, 'modified': os.path.getmtime(DEMO_DATA_FILE)}
+
+        from entropy import ingest_pending_files
+        from ingestion_manifest import get_ingestion_watermark
+        if self.ingest:
+            ingest_pending_files(self.options_source)
+        watermark = get_ingestion_watermark(self.options_source)
+        return None if watermark is None else {key: str(value) for key, value in watermark.items()}
+
+    def load(self) -> pd.DataFrame:
+        """The full Date/Entropy/Skewness/Adj Close series."""
+        if self.source == 'demo':
+            from main import load_demo_data
+            return load_demo_data(self.estimator)
+
+        from entropy import get_entropy
+        from return_calculator import ReturnCalculator, clear_price_cache
+        entropy = get_entropy(estimator=self.estimator, source=self.options_source, ingest=False)
+        # Prices are re-read on each refresh, so the new quote dates find their closes
+        clear_price_cache()
+        prices = ReturnCalculator([self.ticker], self.start_date).calculate_daily_returns(self.ticker)
+        if prices.empty:
+            return entropy.assign(**{'Adj Close': np.nan})
+        return pd.merge(entropy, prices[['Adj Close']], left_on='Date', right_index=True, how='inner')
+
+
+class SignalService:
+    """The latest SignalSnapshot, refreshed by a background thread when the loader's watermark moves."""
+
+    def __init__(self, loader: SignalLoader, refresh_seconds: float = SIGNAL_REFRESH_SECONDS) -> None:
+        self.loader = loader
+        self.refresh_seconds = refresh_seconds
+        self.snapshot: SignalSnapshot = None
+        self.refresh_lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def refresh(self, force: bool = False) -> bool:
+        """Recompute the series if the watermark moved since the last refresh; returns whether it was recomputed."""
+        with self.refresh_lock:
+            watermark = self.loader.watermark()
+            if not force and self.snapshot is not None and watermark == self.snapshot.watermark:
+                return False
+            # Each recompute logs its stages under its own run_id, so a regression can be traced to one refresh
+            run_id = new_run()
+            refresh_start = time.time()
+            snapshot = SignalSnapshot(self.loader.load(), self.loader.estimator, watermark)
+            # Readers holding the previous snapshot finish their request with it
+            self.snapshot = snapshot
+            print(f"Refreshing the signal ({len(snapshot.rows)} rows, version {snapshot.version}, run {run_id}) took "
+                  f"{time.time() - refresh_start:.2f} seconds")
+            return True
+
+    def refresh_forever(self) -> None:
+        while not self.stopped.wait(self.refresh_seconds):
+            try:
+                self.refresh()
+            except Exception as e:
+                # Keep serving the last good series
+                print(f"Error refreshing the signal: {e}")
+
+    def start_refreshing(self) -> threading.Thread:
+        thread = threading.Thread(target=self.refresh_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+class SignalRequestHandler(BaseHTTPRequestHandler):
+    service: SignalService = None  # Set by create_server
+    protocol_version = 'HTTP/1.1'  # Keep-alive, so polling clients reuse their connection
+    include_body: bool = True  # False while answering a HEAD request
+    # Headers and body are written separately; without TCP_NODELAY the body waits for the client's delayed ACK
+    disable_nagle_algorithm = True
+
+    def send_body(self, status: int, body: bytes, etag: str = None) -> None:
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if etag is not None:
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'no-cache')  # Cacheable, but revalidated on every request
+        self.end_headers()
+        if self.include_body:
+            self.wfile.write(body)
+
+    def send_error_json(self, status: int, message: str) -> None:
+        self.send_body(status, json.dumps({'error': message}).encode())
+
+    def do_GET(self) -> None:
+        self.include_body = True
+        self.route()
+
+    def do_HEAD(self) -> None:
+        # Status line and headers only (ETag, Content-Length); a body would be read as the next response on keep-alive
+        self.include_body = False
+        self.route()
+
+    def route(self) -> None:
+        url = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        snapshot = self.service.snapshot
+        if snapshot is None:
+            self.send_error_json(503, "The signal is not loaded yet.")
+        elif url.path == '/health':
+            self.send_body(200, json.dumps(snapshot.health()).encode())
+        elif url.path == '/signal':
+            self.get_signal(snapshot, query)
+        else:
+            self.send_error_json(404, f"Unknown path {url.path}")
+
+    def get_signal(self, snapshot: SignalSnapshot, query: dict) -> None:
+        if query.get('estimator', snapshot.estimator) != snapshot.estimator:
+            self.send_error_json(404, f"This service serves the '{snapshot.estimator}' estimator, "
+                                      f"not '{query['estimator']}'.")
+            return
+        try:
+            first, last = snapshot.row_range(query.get('start'), query.get('end'))
+        except ValueError as e:
+            self.send_error_json(400, f"Invalid date: {e}")
+            return
+
+        etag = snapshot.etag(first, last)
+        if etag in (tag.strip() for tag in self.headers.get('If-None-Match', '').split(',')):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_body(200, snapshot.response(first, last), etag)
+
+    def log_message(self, format, *args) -> None:
+        # One line per request would dominate the console of a busy service
+        pass
+
+
+def create_server(service: SignalService, host: str = SIGNAL_SERVICE_HOST,
+                  port: int = SIGNAL_SERVICE_PORT) -> ThreadingHTTPServer:
+    handler = type('BoundSignalRequestHandler', (SignalRequestHandler,), {'service': service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def serve(source: str = SIGNAL_SERVICE_SOURCE, estimator: str = ENTROPY_ESTIMATOR, host: str = SIGNAL_SERVICE_HOST,
+          port: int = SIGNAL_SERVICE_PORT, refresh_seconds: float = SIGNAL_REFRESH_SECONDS, **loader_options) -> None:
+    """Load the signal, then serve it until interrupted, checking for new data every refresh_seconds."""
+    service = SignalService(SignalLoader(source, estimator, **loader_options), refresh_seconds)
+    service.refresh(force=True)
+    service.start_refreshing()
+    server = create_server(service, host, port)
+    print(f"Serving the {estimator} signal from {source} on http://{host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopped the signal service.")
+    finally:
+        service.stopped.set()
+        server.server_close()
+
+
+class SignalClient:
+    """
+    Reads the signal from a running service, keeping the last response of each range and revalidating it with its
+    ETag, so an unchanged series is not downloaded or parsed again.
+    """
+
+    def __init__(self, url: str = SIGNAL_SERVICE_URL, timeout: float = CLIENT_TIMEOUT_SECONDS) -> None:
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+        self.cached = {}  # Query string -> (etag, DataFrame)
+
+    def _get(self, path: str, headers: dict = None):
+        request = urllib.request.Request(self.url + path, headers=headers or {})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return response.status, response.headers, response.read()
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                return e.code, e.headers, b''
+            raise SignalServiceError(f"{self.url}{path} answered {e.code}: {e.read().decode(errors='replace')}") from e
+        except OSError as e:
+            raise SignalServiceError(f"Signal service at {self.url} is unreachable: {e}") from e
+
+    def health(self) -> dict:
+        return json.loads(self._get('/health')[2])
+
+    def is_available(self) -> bool:
+        try:
+            self.health()
+            return True
+        except SignalServiceError:
+            return False
+
+    def get_signal(self, start=None, end=None, estimator: str = None) -> pd.DataFrame:
+        """
+        Rows of the served series with start <= Date <= end.
+
+        :param estimator: If set, fail unless the service serves this entropy estimator.
+        :return: DataFrame with Date, Entropy, Skewness and Adj Close.
+        """
+        parameters = {key: str(value) for key, value in (('start', start), ('end', end), ('estimator', estimator))
+                      if value is not None}
+        query = urllib.parse.urlencode(parameters)
+        etag, dataframe = self.cached.get(query, (None, None))
+        status, headers, body = self._get(f'/signal?{query}', {'If-None-Match': etag} if etag else None)
+        if status == 304:
+            return dataframe.copy()
+
+        payload = json.loads(body)
+        dataframe = pd.DataFrame(payload['rows'], columns=payload['columns'])
+        dataframe['Date'] = pd.to_datetime(dataframe['Date'])
+        dataframe[SIGNAL_COLUMNS[1:]] = dataframe[SIGNAL_COLUMNS[1:]].astype(float)
+        self.cached[query] = (headers.get('ETag'), dataframe)
+        return dataframe.copy()
+
+
+if __name__ == "__main__":
+    from entropy_estimators import ESTIMATORS
+
+    parser = argparse.ArgumentParser(description="Serve the entropy/skewness signal over HTTP.")
+    parser.add_argument('--source', default=SIGNAL_SERVICE_SOURCE, choices=['demo', 'pipeline'],
+                        help="demo_data.csv, or the ingestion and entropy pipeline")
+    parser.add_argument('--estimator', default=ENTROPY_ESTIMATOR, choices=sorted(ESTIMATORS))
+    parser.add_argument('--options-source', default=OPTIONS_DATA_SOURCE, choices=['postgres', 'parquet'])
+    parser.add_argument('--no-ingest', action='store_true', help="Do not load the daily CSVs waiting for ingestion")
+    parser.add_argument('--host', default=SIGNAL_SERVICE_HOST)
+    parser.add_argument('--port', type=int, default=SIGNAL_SERVICE_PORT)
+    parser.add_argument('--refresh-seconds', type=float, default=SIGNAL_REFRESH_SECONDS,
+                        help="How often to check for newly ingested data")
+    args = parser.parse_args()
+
+    serve(args.source, args.estimator, args.host, args.port, args.refresh_seconds,
+          options_source=args.options_source, ingest=not args.no_ingest)
@@ -0,0 +1,122 @@
+# Materialized per-quote_date skewness and entropy, so plotting and chat startup are a lookup instead of a pipeline run
+# Skewness is cached per quote_date and only recomputed for dates whose source rows changed. Entropy depends on the
+# whole skewness series (r = 0.15 * std_dev), so it is cached per estimator and recomputed when the series changes.
+
+import hashlib
+import json
+import os
+import pandas as pd
+from constants import SIGNAL_STORE_FOLDER
+from skewness import MIN_DTE, MAX_DTE, MAX_ABS_SKEWNESS
+
+# Bump when the skewness or entropy calculation changes so stale tables are not served
+STORE_VERSION = 2
+
+
+def _hash(payload) -> str:
+    """Short stable hash of a JSON-serializable payload."""
+    return hashlib.sha1(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+def fingerprint_series(dataframe: pd.DataFrame) -> str:
+    """Hash of a frame's contents, used to tell whether a cached result was built from the same input."""
+    return hashlib.sha1(pd.util.hash_pandas_object(dataframe, index=False).values.tobytes()).hexdigest()
+
+
+class SignalStore:
+    """
+    Versioned local store of per-quote_date skewness and entropy.
+
+    Each table is a CSV file keyed by STORE_VERSION and the calculation parameters; a JSON sidecar records the
+    parameters and the fingerprint of the data it was built from.
+    """
+
+    def __init__(self, store_folder: str = SIGNAL_STORE_FOLDER) -> None:
+        self.store_folder: str = store_folder
+        if not os.path.exists(self.store_folder):
+            os.makedirs(self.store_folder)
+
+    def _paths(self, table: str, parameters: dict):
+        """CSV and metadata paths for a table built with the given parameters."""
+        key = _hash({'version': STORE_VERSION, 'table': table, **parameters})
+        base = os.path.join(self.store_folder, f'{table}_v{STORE_VERSION}_{key}')
+        return f'{base}.csv', f'{base}.json'
+
+    def _read(self, table: str, parameters: dict, parse_dates, dtype=None):
+        """Return (data, metadata) of a stored table, or (None, None) if it does not exist."""
+        data_path, metadata_path = self._paths(table, parameters)
+        if not (os.path.exists(data_path) and os.path.exists(metadata_path)):
+            return None, None
+        with open(metadata_path, 'r') as f:
+            metadata = json.load(f)
+        data = pd.read_csv(data_path, parse_dates=parse_dates, dtype=dtype, float_precision='round_trip')
+        return data, metadata
+
+    def _write(self, table: str, parameters: dict, data: pd.DataFrame, metadata: dict) -> None:
+        """Write a table and its metadata; the CSV is replaced atomically."""
+        data_path, metadata_path = self._paths(table, parameters)
+        data.to_csv(f'{data_path}.tmp', index=False)
+        os.replace(f'{data_path}.tmp', data_path)
+        with open(metadata_path, 'w') as f:
+            json.dump({'version': STORE_VERSION, 'parameters': parameters, **metadata}, f, indent=2, default=str)
+
+    def get_skewness(self, fingerprints: pd.DataFrame, compute_skewness) -> pd.DataFrame:
+        """
+        Serve the skewness series, recomputing only quote dates that are new or whose source rows changed.
+
+        :param fingerprints: DataFrame with quote_date and fingerprint for every quote date of the source data.
+        :param compute_skewness: Callable taking a list of quote dates and returning their 'quote_date' /
+                                 'Average Skewness' frame, e.g. get_average_skewness over those dates only.
+        :return: DataFrame with 'quote_date' and 'Average Skewness', sorted by date.
+        """
+        parameters = {'min_dte': MIN_DTE, 'max_dte': MAX_DTE, 'max_abs_skewness': MAX_ABS_SKEWNESS}
+        cached, _ = self._read('skewness', parameters, parse_dates=['quote_date'], dtype={'fingerprint': str})
+        if cached is None:
+            cached = pd.DataFrame({'quote_date': pd.to_datetime([]), 'fingerprint': [], 'Average Skewness': []})
+
+        fingerprints = fingerprints[['quote_date', 'fingerprint']].copy()
+        fingerprints['quote_date'] = pd.to_datetime(fingerprints['quote_date'])
+
+        merged = fingerprints.merge(cached, on='quote_date', how='left', suffixes=('', '_cached'))
+        stale = merged['fingerprint'] != merged['fingerprint_cached']
+        stale_dates = merged.loc[stale, 'quote_date']
+        print(f"Signal store: {len(merged) - len(stale_dates)} cached quote dates, {len(stale_dates)} to recompute")
+
+        if len(stale_dates):
+            computed = compute_skewness([date.date() for date in stale_dates])
+            computed = computed.assign(quote_date=pd.to_datetime(computed['quote_date']))
+            # Dates without usable quotes are stored as missing so they are not recomputed every run
+            recomputed = fingerprints[fingerprints['quote_date'].isin(stale_dates)].merge(computed, on='quote_date', how='left')
+            fresh = merged.loc[~stale, ['quote_date', 'fingerprint', 'Average Skewness']]
+            table = pd.concat([fresh, recomputed], ignore_index=True).sort_values('quote_date', ignore_index=True)
+            self._write('skewness', parameters, table, {'quote_dates': len(table)})
+        else:
+            table = merged[['quote_date', 'fingerprint', 'Average Skewness']]
+            if len(table) != len(cached):
+                # Quote dates were removed from the source
+                self._write('skewness', parameters, table, {'quote_dates': len(table)})
+
+        average_skewness = table.dropna(subset=['Average Skewness'])[['quote_date', 'Average Skewness']]
+        average_skewness = average_skewness.assign(quote_date=average_skewness['quote_date'].dt.date)
+        return average_skewness.reset_index(drop=True)
+
+    def get_entropy(self, average_skewness: pd.DataFrame, estimator) -> pd.DataFrame:
+        """
+        Serve the entropy of the skewness series for an estimator, recomputing it only if the series changed.
+
+        :param average_skewness: DataFrame with 'quote_date' and 'Average Skewness'.
+        :param estimator: EntropyEstimator instance.
+        :return: DataFrame with Date, Entropy and Skewness.
+        """
+        parameters = {'estimator': type(estimator).__name__, 'window_width': estimator.window_width,
+                      'sliding_step': estimator.sliding_step, 'm': estimator.m, 'r': estimator.r}
+        source_fingerprint = fingerprint_series(average_skewness.assign(quote_date=pd.to_datetime(average_skewness['quote_date'])))
+
+        cached, metadata = self._read('entropy', parameters, parse_dates=['Date'])
+        if cached is not None and metadata.get('source_fingerprint') == source_fingerprint:
+            print(f"Signal store: serving cached {estimator.name}")
+            return cached
+
+        entropy = estimator.calculate(average_skewness['Average Skewness'], average_skewness['quote_date'])
+        self._write('entropy', parameters, entropy, {'source_fingerprint': source_fingerprint, 'rows': len(entropy)})
+        return entropy
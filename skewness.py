@@ -0,0 +1,118 @@
+# Skewness premium of deep out-of-the-money SPX options, one value per quote_date
+# https://pages.stern.nyu.edu/~dbackus/GE_asset_pricing/disasters/Bates%20crash%20JF%2091.PDF - Bates skewness premium
+
+import pandas as pd
+
+MIN_DTE = 28  # Only expiries with MIN_DTE < dte < MAX_DTE are used
+MAX_DTE = 118
+MAX_ABS_SKEWNESS = 200  # Skewness premiums at or beyond this magnitude are set to 0
+
+
+def clean_options_data(option_data_sample):
+    """
+    Drop incomplete quotes and add the mid prices C_Avg and P_Avg for calls and puts.
+
+    :param option_data_sample: DataFrame of option rows as returned by load_options_data_from_db.
+    :return: DataFrame with numeric c_bid, c_ask, p_bid, p_ask and the C_Avg and P_Avg columns.
+    """
+    option_data_sample = option_data_sample.dropna(subset=['quote_date', 'expire_date', 'c_bid', 'c_ask', 'p_bid', 'p_ask'])
+    # Calculate the average price for call and put options
+    # Ensure that c_bid, c_ask, p_bid, and p_ask are numeric
+    prices = option_data_sample[['c_bid', 'c_ask', 'p_bid', 'p_ask']].apply(pd.to_numeric, errors='coerce')
+
+    option_data_sample = option_data_sample.assign(
+        c_bid=prices['c_bid'], c_ask=prices['c_ask'], p_bid=prices['p_bid'], p_ask=prices['p_ask'],
+        C_Avg=(prices['c_bid'] + prices['c_ask']) / 2,
+        P_Avg=(prices['p_bid'] + prices['p_ask']) / 2,
+    )
+    return option_data_sample.dropna(subset=['C_Avg', 'P_Avg'])
+
+
+def filter_options_data(option_data_sample, min_dte=MIN_DTE, max_dte=MAX_DTE):
+    """
+    Keep quotes with nonzero mid prices and min_dte < dte < max_dte.
+
+    :param option_data_sample: Cleaned DataFrame from clean_options_data.
+    :return: Filtered DataFrame.
+    """
+    mask = ((option_data_sample['C_Avg'] != 0) & (option_data_sample['P_Avg'] != 0)
+            & (option_data_sample['dte'] > min_dte) & (option_data_sample['dte'] < max_dte))
+    return option_data_sample[mask]
+
+
+def calculate_average_skewness_same_strike_same_dte(df):
+    """
+    Calculate skewness premium using the deepest available out-of-the-money option pairs across multiple expiries for each quote_date.
+
+    The deepest call is the highest strike and the deepest put the lowest strike quoted on the date; their mid prices
+    are the medians across all expiries at that strike. Everything is computed with grouped transforms and
+    aggregations, in one pass over the rows.
+
+    :param df: DataFrame containing options data (already filtered for DTE and valid premiums).
+    :return: DataFrame with 'quote_date' and 'Average Skewness' (one row per quote_date, sorted by date).
+    """
+    quote_dates = df['quote_date']
+    strikes = df['strike'].groupby(quote_dates)
+
+    # Rows at the deepest call (highest strike) and deepest put (lowest strike) of their quote_date
+    is_deepest_call = df['strike'] == strikes.transform('max')
+    is_deepest_put = df['strike'] == strikes.transform('min')
+
+    dates = strikes.size().index
+    call_avg = df['C_Avg'][is_deepest_call].groupby(quote_dates[is_deepest_call]).median().reindex(dates)
+    put_avg = df['P_Avg'][is_deepest_put].groupby(quote_dates[is_deepest_put]).median().reindex(dates)
+
+    return skewness_from_deepest_strike_medians(call_avg, put_avg)
+
+
+def skewness_from_deepest_strike_medians(call_avg, put_avg):
+    """
+    Turn the median call and put mid prices at the deepest strikes into the clipped skewness premium.
+
+    :param call_avg: Series indexed by quote_date with the median C_Avg at the highest strike.
+    :param put_avg: Series indexed by quote_date with the median P_Avg at the lowest strike.
+    :return: DataFrame with 'quote_date' and 'Average Skewness'.
+    """
+    # Only dates where both medians are positive get a skewness premium, the rest are missing
+    skewness_premium = ((put_avg / call_avg) - 1).where((call_avg > 0) & (put_avg > 0))
+
+    # Filter out extreme skewness values (e.g., by limiting the skewness ratio); missing values become 0 as well
+    skewness_premium = skewness_premium.where(skewness_premium.abs() < MAX_ABS_SKEWNESS, 0)
+
+    average_skewness = skewness_premium.rename('Average Skewness').rename_axis('quote_date').reset_index()
+    return average_skewness
+
+
+def calculate_average_skewness_from_chunks(chunks):
+    """
+    Calculate the skewness premium from option rows that arrive in chunks ordered by quote_date.
+
+    The rows of the last quote_date of a chunk may continue in the next chunk, so they are carried over and only
+    complete quote dates are reduced. Prices are widened to float64 per chunk, so compact input dtypes do not
+    reduce the precision of the mid prices and ratios.
+
+    :param chunks: Iterable of DataFrames as yielded by load_options_data.stream_options_data_from_db.
+    :return: DataFrame with 'quote_date' and 'Average Skewness' (quote_date as datetime.date).
+    """
+    def reduce_rows(rows):
+        rows = rows.astype({column: 'float64' for column in ['c_bid', 'c_ask', 'p_bid', 'p_ask', 'strike']})
+        return calculate_average_skewness_same_strike_same_dte(filter_options_data(clean_options_data(rows)))
+
+    results = []
+    carry = None
+    for chunk in chunks:
+        if carry is not None:
+            chunk = pd.concat([carry, chunk], ignore_index=True)
+        is_last_date = chunk['quote_date'] == chunk['quote_date'].iloc[-1]
+        carry = chunk[is_last_date]
+        if not is_last_date.all():
+            results.append(reduce_rows(chunk[~is_last_date]))
+    if carry is not None:
+        results.append(reduce_rows(carry))
+
+    results = [result for result in results if len(result)]
+    if not results:
+        return pd.DataFrame({'quote_date': [], 'Average Skewness': []})
+    average_skewness = pd.concat(results, ignore_index=True)
+    average_skewness['quote_date'] = pd.to_datetime(average_skewness['quote_date'].astype('datetime64[s]')).dt.date
+    return average_skewness
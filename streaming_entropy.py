@@ -0,0 +1,155 @@
+# Incremental Approximate Entropy (ApEn) over a sliding window of skewness values
+# Each appended point only touches the vectors entering and leaving the window, so an update is O(W) work.
+
+import json
+import os
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from approximate_entropy import WINDOW_SIZE, EMBEDDING_DIMENSION, TOLERANCE_FACTOR
+
+ENTROPY_STATE_FILE = 'historical_data/entropy_state.json'
+
+
+class StreamingApproximateEntropy:
+    """
+    Stateful ApEn calculator that emits the entropy of the newest window as skewness values are appended.
+
+    The tolerance r is frozen when the calculator is created, so every emitted value equals the batch
+    calculate_approximate_entropy_with_skewness result for the same window and the same r. r_fitted_through records
+    the last quote date of the history r was computed from (None when r was given).
+    """
+
+    def __init__(self, r: float, window_width: int = WINDOW_SIZE, m: int = EMBEDDING_DIMENSION) -> None:
+        if window_width < m + 2:
+            raise ValueError("Window is too short to calculate approximate entropy.")
+        self.r: float = float(r)
+        self.window_width: int = window_width
+        self.m: int = m
+        self.window: np.ndarray = np.empty(0)
+        self.last_date: pd.Timestamp = None
+        self.r_fitted_through: pd.Timestamp = None
+        # Running number of matches (self-match included) for each vector of the window, oldest first
+        self.counts_m: np.ndarray = np.empty(0, dtype=np.int64)
+        self.counts_m1: np.ndarray = np.empty(0, dtype=np.int64)
+
+    @classmethod
+    def from_history(cls, skewness_data, quote_dates, window_width: int = WINDOW_SIZE,
+                     m: int = EMBEDDING_DIMENSION, r: float = None) -> 'StreamingApproximateEntropy':
+        """Create a calculator primed with the tail of an existing series, using r = 0.15 * std_dev if not provided."""
+        fitted = r is None
+        if fitted:
+            r = TOLERANCE_FACTOR * np.std(skewness_data)
+        calculator = cls(r, window_width, m)
+        if fitted and len(quote_dates):
+            calculator.r_fitted_through = pd.Timestamp(np.asarray(quote_dates)[-1])
+        values = np.asarray(skewness_data, dtype=float)[-window_width:]
+        dates = np.asarray(quote_dates)[-window_width:]
+        for value, date in zip(values, dates):
+            calculator.update(value, date)
+        return calculator
+
+    @property
+    def is_ready(self) -> bool:
+        """Whether the window is full and update() returns entropy values."""
+        return len(self.window) == self.window_width
+
+    def _matches(self, vectors: np.ndarray, vector: np.ndarray) -> np.ndarray:
+        """Boolean mask of the vectors within Chebyshev distance r of the given vector."""
+        return np.max(np.abs(vectors - vector), axis=1) <= self.r
+
+    def _slide(self, counts: np.ndarray, old_window: np.ndarray, dimension: int) -> np.ndarray:
+        """Update the match counts of one embedding dimension after self.window moved forward."""
+        if len(self.window) < dimension:
+            return counts
+        vectors = sliding_window_view(self.window, dimension)
+
+        # Drop the oldest vector once the window was already full
+        if len(old_window) == self.window_width:
+            old_vector = old_window[:dimension]
+            counts = counts[1:] - self._matches(vectors[:-1], old_vector)
+
+        # The newest vector matches itself, so it always counts at least once
+        new_matches = self._matches(vectors, vectors[-1])
+        counts = np.append(counts, 0) + new_matches
+        counts[-1] = np.count_nonzero(new_matches)
+        return counts
+
+    def _phi(self, counts: np.ndarray) -> float:
+        """Φ(m)(r) for the current window from its running match counts."""
+        C_m = counts / len(counts)
+        return np.sum(np.log(C_m)) / len(C_m)
+
+    def update(self, value: float, date=None) -> float:
+        """
+        Append a skewness value and return the ApEn of the window ending at it.
+
+        :param value: Newest skewness value.
+        :param date: Quote date of the value; must be later than the previous one when given.
+        :return: ApEn of the newest window, or None while the window is still filling.
+        """
+        if date is not None:
+            date = pd.Timestamp(date)
+            if self.last_date is not None and date <= self.last_date:
+                raise ValueError(f"Quote date {date.date()} is not after the last processed date {self.last_date.date()}.")
+            self.last_date = date
+
+        old_window = self.window
+        self.window = np.append(old_window, float(value))[-self.window_width:]
+        self.counts_m = self._slide(self.counts_m, old_window, self.m)
+        self.counts_m1 = self._slide(self.counts_m1, old_window, self.m + 1)
+
+        if not self.is_ready:
+            return None
+        return self._phi(self.counts_m) - self._phi(self.counts_m1)
+
+    def update_many(self, skewness_data, quote_dates) -> pd.DataFrame:
+        """Append several values and return a DataFrame with the Date, Entropy and Skewness of each full window."""
+        rows = []
+        for value, date in zip(np.asarray(skewness_data, dtype=float), quote_dates):
+            entropy = self.update(value, date)
+            if entropy is not None:
+                rows.append({'Date': pd.Timestamp(date), 'Entropy': entropy, 'Skewness': value})
+        return pd.DataFrame(rows, columns=['Date', 'Entropy', 'Skewness'])
+
+    def to_dict(self) -> dict:
+        """Serialize the calculator state."""
+        return {
+            'r': self.r,
+            'r_fitted_through': None if self.r_fitted_through is None else self.r_fitted_through.isoformat(),
+            'window_width': self.window_width,
+            'm': self.m,
+            'window': self.window.tolist(),
+            'last_date': None if self.last_date is None else self.last_date.isoformat(),
+            'counts_m': self.counts_m.tolist(),
+            'counts_m1': self.counts_m1.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, state: dict) -> 'StreamingApproximateEntropy':
+        """Restore a calculator serialized with to_dict()."""
+        calculator = cls(state['r'], state['window_width'], state['m'])
+        calculator.window = np.array(state['window'], dtype=float)
+        calculator.last_date = None if state['last_date'] is None else pd.Timestamp(state['last_date'])
+        # States saved before r_fitted_through was recorded do not have it
+        r_fitted_through = state.get('r_fitted_through')
+        calculator.r_fitted_through = None if r_fitted_through is None else pd.Timestamp(r_fitted_through)
+        calculator.counts_m = np.array(state['counts_m'], dtype=np.int64)
+        calculator.counts_m1 = np.array(state['counts_m1'], dtype=np.int64)
+        return calculator
+
+    def save(self, file_path: str = ENTROPY_STATE_FILE) -> None:
+        """Save the calculator state to a JSON file."""
+        directory = os.path.dirname(file_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(file_path, 'w') as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, file_path: str = ENTROPY_STATE_FILE) -> 'StreamingApproximateEntropy':
+        """Load a calculator state saved with save(), or return None if there is no saved state."""
+        if not os.path.exists(file_path):
+            return None
+        with open(file_path, 'r') as f:
+            return cls.from_dict(json.load(f))
@@ -0,0 +1,116 @@
+# Synthetic SPX option chains for benchmarks and offline tests
+# The index follows a geometric random walk; every quote date lists the same number of expiries (geometrically spaced
+# from a few days to two years) and strikes (evenly spaced around the index level). Mid prices are intrinsic value plus a
+# normal-density time value with a put skew, so the skewness premium and entropy stages see realistic shapes.
+
+import os
+import numpy as np
+import pandas as pd
+from options_store import OPTIONS_COLUMNS
+from daily_csv_parser import EXPIRE_DATE_FORMAT, HEADER_DATE_FORMAT
+
+MIN_DTE_DAYS = 3
+MAX_DTE_DAYS = 720
+STRIKE_RANGE = (0.5, 1.5)  # Lowest and highest strike relative to the index level
+BASE_VOLATILITY = 0.18
+PUT_SKEW = 0.35  # Extra volatility per unit of log-moneyness below the index level
+
+# Header of the daily quote table CSVs, as in the deltaneutral / CBOE delayed quotes download
+CSV_COLUMN_HEADER = ('Expiration Date,Calls,Last Sale,Net,Bid,Ask,Volume,IV,Delta,Gamma,Open Interest,Strike,'
+                     'Puts,Last Sale,Net,Bid,Ask,Volume,IV,Delta,Gamma,Open Interest')
+
+
+def generate_option_chain(days: int, expiries: int, strikes: int, start_date: str = '2019-05-13',
+                          seed: int = 0) -> pd.DataFrame:
+    """
+    Generate days x expiries x strikes option rows.
+
+    :param days: Number of quote dates (business days from start_date).
+    :param expiries: Expiries listed on every quote date.
+    :param strikes: Strikes listed for every expiry.
+    :return: DataFrame with the OPTIONS_COLUMNS, datetime quote and expiry dates, sorted like the daily files; strikes
+             are whole points.
+    """
+    rng = np.random.default_rng(seed)
+    quote_dates = pd.bdate_range(start_date, periods=days)
+    spot = 3000 * np.exp(np.cumsum(rng.normal(0.0003, 0.01, days)))
+    dte = np.unique(np.round(np.geomspace(MIN_DTE_DAYS, MAX_DTE_DAYS, expiries)).astype(int))
+    moneyness = np.linspace(*STRIKE_RANGE, strikes)
+
+    # One row per (quote date, expiry, strike), in that order
+    day_index = np.repeat(np.arange(days), len(dte) * strikes)
+    row_dte = np.tile(np.repeat(dte, strikes), days)
+    underlying = spot[day_index]
+    strike = np.round(underlying * np.tile(moneyness, days * len(dte)))
+
+    years = row_dte / 365
+    log_moneyness = np.log(strike / underlying)
+    volatility = BASE_VOLATILITY + PUT_SKEW * np.maximum(-log_moneyness, 0)
+    spread = volatility * np.sqrt(years)
+    d = log_moneyness / spread
+    time_value = underlying * spread * np.exp(-0.5 * d ** 2) / np.sqrt(2 * np.pi)
+    call_mid = np.maximum(underlying - strike, 0) + time_value
+    put_mid = np.maximum(strike - underlying, 0) + time_value
+    # Quotes widen with the price; deep options are quoted at 0.05 minimum
+    call_half_spread = np.maximum(0.05, 0.01 * call_mid) * rng.uniform(0.5, 1.5, len(strike))
+    put_half_spread = np.maximum(0.05, 0.01 * put_mid) * rng.uniform(0.5, 1.5, len(strike))
+    call_delta = 1 / (1 + np.exp(1.7 * d))
+    gamma = np.exp(-0.5 * d ** 2) / (underlying * spread * np.sqrt(2 * np.pi))
+
+    quote_date = quote_dates[day_index]
+    chain = pd.DataFrame({
+        'quote_date': quote_date,
+        'underlying_last': np.round(underlying, 2),
+        'expire_date': quote_date + pd.to_timedelta(row_dte, unit='D'),
+        'dte': row_dte,
+        'c_volume': rng.integers(0, 5000, len(strike)),
+        'c_bid': np.round(np.maximum(call_mid - call_half_spread, 0), 2),
+        'c_ask': np.round(call_mid + call_half_spread, 2),
+        'c_iv': np.round(volatility, 4),
+        'c_delta': np.round(call_delta, 4),
+        'c_gamma': np.round(gamma, 6),
+        'c_open_interest': rng.integers(0, 50000, len(strike)),
+        'strike': strike,
+        'p_bid': np.round(np.maximum(put_mid - put_half_spread, 0), 2),
+        'p_ask': np.round(put_mid + put_half_spread, 2),
+        'p_volume': rng.integers(0, 5000, len(strike)),
+        'p_iv': np.round(volatility, 4),
+        'p_delta': np.round(call_delta - 1, 4),
+        'p_gamma': np.round(gamma, 6),
+        'p_open_interest': rng.integers(0, 50000, len(strike)),
+    })
+    # Dense strike grids can round two strikes to the same point
+    return chain[OPTIONS_COLUMNS].drop_duplicates(subset=['quote_date', 'expire_date', 'strike'], ignore_index=True)
+
+
+def write_daily_csvs(chain: pd.DataFrame, folder: str) -> list:
+    """
+    Write a chain as one daily quote table CSV per quote date (spx_quotedata_YYYY_MM_DD.csv), readable by
+    daily_csv_parser.parse_daily_csv.
+
+    :return: Paths of the files written, in quote date order.
+    """
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    paths = []
+    for quote_date, day in chain.groupby('quote_date', sort=True):
+        expiry = day['expire_date'].dt.strftime(EXPIRE_DATE_FORMAT)
+        strike = day['strike'].map('{:.0f}'.format)
+        symbol_date = day['expire_date'].dt.strftime('%y%m%d')
+        mid_call = ((day['c_bid'] + day['c_ask']) / 2).round(2)
+        mid_put = ((day['p_bid'] + day['p_ask']) / 2).round(2)
+        rows = pd.DataFrame({
+            'expire_date': expiry, 'Calls': 'SPXW' + symbol_date + 'C' + strike, 'C_Last Sale': mid_call, 'C_Net': 0.0,
+            'C_Bid': day['c_bid'], 'C_Ask': day['c_ask'], 'C_Volume': day['c_volume'], 'C_IV': day['c_iv'],
+            'C_Delta': day['c_delta'], 'C_Gamma': day['c_gamma'], 'C_Open Interest': day['c_open_interest'],
+            'Strike': day['strike'], 'Puts': 'SPXW' + symbol_date + 'P' + strike, 'P_Last Sale': mid_put, 'P_Net': 0.0,
+            'P_Bid': day['p_bid'], 'P_Ask': day['p_ask'], 'P_Volume': day['p_volume'], 'P_IV': day['p_iv'],
+            'P_Delta': day['p_delta'], 'P_Gamma': day['p_gamma'], 'P_Open Interest': day['p_open_interest'],
+        })
+        path = os.path.join(folder, f'spx_quotedata_{quote_date:%Y_%m_%d}.csv')
+        with open(path, 'w') as f:
+            f.write(f"SPX,S&P 500 INDEX\nSPX,Last: {day['underlying_last'].iloc[0]:.4f},Change: 0.0\n"
+                    f"Date: {quote_date.strftime(HEADER_DATE_FORMAT)}\n\n{CSV_COLUMN_HEADER}\n")
+            rows.to_csv(f, index=False, header=False)
+        paths.append(path)
+    return paths